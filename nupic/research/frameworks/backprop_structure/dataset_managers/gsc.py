@@ -21,11 +21,18 @@
 
 import os
 import re
+from functools import partial
 from pathlib import Path
 
 import numpy as np
 import torch
 
+from nupic.research.frameworks.pytorch.dataset_utils import (
+    MemoryMappedDataset,
+    npz_to_npy,
+    prefetch_npz,
+)
+
 
 def dataset_from_npz(filepath):
     x, y = np.load(filepath).values()
@@ -33,24 +40,55 @@ def dataset_from_npz(filepath):
     return torch.utils.data.TensorDataset(x, y)
 
 
+def dataset_from_npy(filepath, cache_dir=None):
+    return MemoryMappedDataset(npz_to_npy(filepath, cache_dir))
+
+
 class PreprocessedGSC(object):
-    def __init__(self):
+    def __init__(self, memory_map=False, cache_dir=None):
+        """
+        :param memory_map: Whether to memory map an uncompressed copy of each
+                           dataset file instead of loading it into tensors. The
+                           next training seed is prefetched in the background.
+        :param cache_dir: Directory of the uncompressed copies. Defaults to the
+                          dataset directory
+        """
         self.folder = Path(os.path.expanduser("~/nta/datasets/gsc"))
         matches = [re.search(r"gsc_train(\d+).npz", filename)
                    for filename in os.listdir(self.folder)]
         self.seeds = [int(match.group(1))
                       for match in matches
                       if match is not None]
+        self.memory_map = memory_map
+        self.cache_dir = cache_dir
+        if memory_map:
+            self.load_dataset = partial(dataset_from_npy, cache_dir=cache_dir)
+        else:
+            self.load_dataset = dataset_from_npz
+        self._prefetch = None
 
-    def get_train_dataset(self, iteration):
+    def _train_filepath(self, iteration):
         seed = self.seeds[iteration % len(self.seeds)]
-        filename = "gsc_train{}.npz".format(seed)
-        return dataset_from_npz(self.folder / filename)
+        return self.folder / "gsc_train{}.npz".format(seed)
+
+    def get_train_dataset(self, iteration):
+        if not self.memory_map:
+            return self.load_dataset(self._train_filepath(iteration))
+
+        # Wait for the prefetch of this seed to finish converting the file
+        if self._prefetch is not None:
+            self._prefetch.join()
+        dataset = self.load_dataset(self._train_filepath(iteration))
+
+        # Prefetch the next seed while this one is used
+        self._prefetch = prefetch_npz(self._train_filepath(iteration + 1),
+                                      self.cache_dir)
+        return dataset
 
     def get_validation_dataset(self):
         filename = "gsc_valid.npz"
-        return dataset_from_npz(self.folder / filename)
+        return self.load_dataset(self.folder / filename)
 
     def get_test_dataset(self, noise_level=0.0):
         filename = "gsc_test_noise{}.npz".format("{:.2f}".format(noise_level)[2:])
-        return dataset_from_npz(self.folder / filename)
+        return self.load_dataset(self.folder / filename)
@@ -19,22 +19,38 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
-import torch
+from nupic.research.frameworks.pytorch.streaming_covariance import (
+    StreamingCovariance,
+)
 
 
 class LogCovariance(object):
-    def __init__(self, log_covariance_layernames, **kwargs):
+    """
+    Log the variances and covariances of the activations of the given layers
+    on the test set, accumulated batch by batch on the device.
+
+    :param log_covariance_mode: "full", "diagonal" or "lowrank". See
+                                :class:`StreamingCovariance`. The covariance
+                                sum of squares isn't logged in "diagonal" mode
+    :param log_covariance_rank: Rank of the sketch in "lowrank" mode
+    """
+    def __init__(self, log_covariance_layernames, log_covariance_mode="full",
+                 log_covariance_rank=64, **kwargs):
         super().__init__(**kwargs)
 
         self.log_covariance_layernames = log_covariance_layernames
+        self.log_covariance_mode = log_covariance_mode
+        self.log_covariance_rank = log_covariance_rank
 
     def test(self, loader):
-        activations = {layername: []
-                       for layername in self.log_covariance_layernames}
+        accumulators = {
+            layername: StreamingCovariance(self.log_covariance_mode,
+                                           self.log_covariance_rank)
+            for layername in self.log_covariance_layernames}
 
         def accumulator(layername):
             def accumulate_activation(module, x, y):
-                activations[layername].append(y)
+                accumulators[layername].update(y)
 
             return accumulate_activation
 
@@ -45,15 +61,13 @@ class LogCovariance(object):
         for hook in hooks:
             hook.remove()
 
-        for layername, layer_activations in activations.items():
-            H = torch.cat(layer_activations) # NOQA N806
-            H -= torch.mean(H, dim=0)
-            cov = H.t().mm(H) / H.shape[0]
-            var = cov.diag()
-            # Mask out the diagonal
-            cov *= (1 - torch.eye(cov.shape[0]).to(self.device))
-            result["{}/covariance_sum_of_squares".format(layername)] = \
-                (cov.pow(2).sum() / 2).item()
-            result["{}/variance_sum".format(layername)] = var.sum().item()
+        for layername, covariance in accumulators.items():
+            if covariance.count == 0:
+                continue
+            if covariance.mode != "diagonal":
+                result["{}/covariance_sum_of_squares".format(layername)] = \
+                    covariance.off_diagonal_sum_of_squares().item()
+            result["{}/variance_sum".format(layername)] = \
+                covariance.variance().sum().item()
 
         return result
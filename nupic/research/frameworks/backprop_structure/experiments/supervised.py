@@ -27,6 +27,7 @@ from tqdm import tqdm
 
 import nupic.research.frameworks.backprop_structure.dataset_managers as dm
 import nupic.research.frameworks.backprop_structure.networks as networks
+from nupic.research.frameworks.pytorch.model_utils import ClassificationMetrics
 
 
 class Supervised(object):
@@ -77,9 +78,8 @@ class Supervised(object):
 
     def test(self, loader):
         self.model.eval()
-        val_loss = 0
+        metrics = ClassificationMetrics(self.device)
         num_val_batches = 0
-        val_correct = 0
         with torch.no_grad():
             if self.use_tqdm:
                 batches = tqdm(loader, leave=False, desc="Testing")
@@ -89,16 +89,15 @@ class Supervised(object):
             for data, target in batches:
                 data, target = data.to(self.device), target.to(self.device)
                 output = self.model(data)
-                val_loss += self.loss_func(output, target).item()
-                # get the index of the max log-probability
-                pred = output.argmax(dim=1, keepdim=True)
-                val_correct += pred.eq(target.view_as(pred)).sum().item()
+                # Accumulate the loss of every batch as returned by loss_func
+                metrics.update(output, target, self.loss_func(output, target))
                 num_val_batches += 1
 
+        results = metrics.results()
         return {
-            "mean_accuracy": val_correct / len(loader.dataset),
-            "mean_loss": val_loss / num_val_batches,
-            "total_correct": val_correct,
+            "mean_accuracy": results["total_correct"] / len(loader.dataset),
+            "mean_loss": results["total_loss"] / num_val_batches,
+            "total_correct": results["total_correct"],
         }
 
     def run_epoch(self, iteration):
@@ -40,6 +40,8 @@ from torch.nn.modules import Module
 from torch.nn.modules.utils import _pair as pair
 from torch.nn.parameter import Parameter
 
+from .inference_cache import InferenceCacheMixin, topk_mask
+
 
 class HeavisideStep(Module):
     def __init__(self, neg1_activation, cancel_gradient, inplace):
@@ -59,10 +61,14 @@ class HeavisideStep(Module):
         return x
 
 
-def sample_weight(p1, weight, deterministic=False, samples=1):
+def sample_weight(p1, weight, deterministic=False, samples=1, u=None):
+    """
+    :param u: Optional uniform random numbers (samples, *p1.size()) used to
+              sample the gates, e.g. reused buffers. Ignored if deterministic
+    """
     if deterministic:
         u = 0.5
-    else:
+    elif u is None:
         t = (torch.FloatTensor if not torch.cuda.is_available()
              else torch.cuda.FloatTensor)
         if samples > 1:
@@ -77,7 +83,7 @@ def sample_weight(p1, weight, deterministic=False, samples=1):
     return weight * z
 
 
-class BinaryGatedLinear(Module):
+class BinaryGatedLinear(InferenceCacheMixin, Module):
     """
     Linear layer with stochastic binary gates
     """
@@ -130,6 +136,7 @@ class BinaryGatedLinear(Module):
         self.reset_parameters()
 
     def reset_parameters(self):
+        self.clear_inference_cache()
         if self.random_weight:
             init.kaiming_normal_(self.exc_weight, mode="fan_out")
             init.kaiming_normal_(self.inh_weight, mode="fan_out")
@@ -141,6 +148,7 @@ class BinaryGatedLinear(Module):
             self.bias.data.fill_(0)
 
     def constrain_parameters(self, **kwargs):
+        self.clear_inference_cache()
         self.exc_weight.data.clamp_(min=0.)
         self.inh_weight.data.clamp_(min=0.)
 
@@ -190,6 +198,9 @@ class BinaryGatedLinear(Module):
             return 0
 
     def get_inference_mask(self):
+        return self.cached_inference("mask", self._compute_inference_mask)
+
+    def _compute_inference_mask(self):
         exc_p1, inh_p1 = self.get_gate_probabilities()
 
         if self.deterministic:
@@ -197,27 +208,29 @@ class BinaryGatedLinear(Module):
             inh_mask = (inh_p1 >= 0.5).float()
             return exc_mask, inh_mask
         else:
-            exc_count1 = exc_p1.sum(dim=1).round().int()
-            inh_count1 = inh_p1.sum(dim=1).round().int()
-
-            # pytorch doesn't offer topk with varying k values.
-            exc_mask = torch.zeros_like(exc_p1)
-            inh_mask = torch.zeros_like(inh_p1)
-            for i in range(exc_count1.size()[0]):
-                _, exc_indices = torch.topk(exc_p1[i], exc_count1[i].item())
-                _, inh_indices = torch.topk(inh_p1[i], inh_count1[i].item())
-                exc_mask[i].scatter_(-1, exc_indices, 1)
-                inh_mask[i].scatter_(-1, inh_indices, 1)
-
-            return exc_mask, inh_mask
+            # Keep the round(sum(p1)) gates with the highest p1 of every unit
+            exc_p1 = exc_p1.view(exc_p1.size(0), -1)
+            inh_p1 = inh_p1.view(inh_p1.size(0), -1)
+            exc_mask = topk_mask(exc_p1, exc_p1.sum(dim=1).round().long())
+            inh_mask = topk_mask(inh_p1, inh_p1.sum(dim=1).round().long())
+            return (exc_mask.float().view_as(self.exc_p1),
+                    inh_mask.float().view_as(self.inh_p1))
+
+    def get_inference_weight(self):
+        if torch.is_grad_enabled():
+            return self._compute_inference_weight()
+        return self.cached_inference("weight", self._compute_inference_weight)
+
+    def _compute_inference_weight(self):
+        exc_mask, inh_mask = self.get_inference_mask()
+        return exc_mask * self.exc_weight - inh_mask * self.inh_weight
 
     def sample_weight_and_bias(self):
         if self.training or not self.optimize_inference:
             w = (sample_weight(self.exc_p1, self.exc_weight, self.deterministic)
                  - sample_weight(self.inh_p1, self.inh_weight, self.deterministic))
         else:
-            exc_mask, inh_mask = self.get_inference_mask()
-            w = exc_mask * self.exc_weight - inh_mask * self.inh_weight
+            w = self.get_inference_weight()
 
         b = None
         if self.use_baseline_bias:
@@ -270,7 +283,7 @@ class BinaryGatedLinear(Module):
         return multiplies.item(), adds.item()
 
 
-class BinaryGatedConv2d(Module):
+class BinaryGatedConv2d(InferenceCacheMixin, Module):
     """
     Convolutional layer with binary stochastic gates
     """
@@ -279,7 +292,8 @@ class BinaryGatedConv2d(Module):
                  droprate_init=0.5, l2_strength=1., l0_strength=1.,
                  random_weight=True, deterministic=False,
                  use_baseline_bias=False, optimize_inference=True,
-                 one_sample_per_item=False, decay_mean=False, **kwargs):
+                 one_sample_per_item=False, decay_mean=False,
+                 sample_memory_budget=None, **kwargs):
         """
         :param in_channels: Number of input channels
         :param out_channels: Number of output channels
@@ -292,6 +306,11 @@ class BinaryGatedConv2d(Module):
         :param droprate_init: Dropout rate that the gates will be initialized to
         :param l2_strength: Strength of the L2 penalty
         :param l0_strength: Strength of the L0 penalty
+        :param sample_memory_budget: Approximate memory in bytes used by the
+                                     weights sampled at once when
+                                     one_sample_per_item is True. The batch is
+                                     processed in chunks of items that fit the
+                                     budget. None samples the whole batch at once
         """
         super(BinaryGatedConv2d, self).__init__()
         if in_channels % groups != 0:
@@ -314,6 +333,8 @@ class BinaryGatedConv2d(Module):
         self.optimize_inference = optimize_inference
         self.one_sample_per_item = one_sample_per_item
         self.decay_mean = decay_mean
+        self.sample_memory_budget = sample_memory_budget
+        self._uniform_buffer = None
 
         self.random_weight = random_weight
         if random_weight:
@@ -347,6 +368,7 @@ class BinaryGatedConv2d(Module):
         self.reset_parameters()
 
     def reset_parameters(self):
+        self.clear_inference_cache()
         if self.random_weight:
             init.kaiming_normal_(self.exc_weight, mode="fan_out")
             init.kaiming_normal_(self.inh_weight, mode="fan_out")
@@ -359,6 +381,7 @@ class BinaryGatedConv2d(Module):
             self.bias.data.fill_(0)
 
     def constrain_parameters(self, **kwargs):
+        self.clear_inference_cache()
         self.exc_weight.data.clamp_(min=0.)
         self.inh_weight.data.clamp_(min=0.)
 
@@ -410,6 +433,9 @@ class BinaryGatedConv2d(Module):
         return exc_p1, inh_p1
 
     def get_inference_mask(self):
+        return self.cached_inference("mask", self._compute_inference_mask)
+
+    def _compute_inference_mask(self):
         exc_p1, inh_p1 = self.get_gate_probabilities()
 
         if self.deterministic:
@@ -417,35 +443,79 @@ class BinaryGatedConv2d(Module):
             inh_mask = (inh_p1 >= 0.5).float()
             return exc_mask, inh_mask
         else:
-            exc_count1 = exc_p1.sum(
-                dim=tuple(range(1, len(exc_p1.shape)))
-            ).round().int()
-            inh_count1 = inh_p1.sum(
-                dim=tuple(range(1, len(inh_p1.shape)))
-            ).round().int()
-
-            # pytorch doesn't offer topk with varying k values.
-            exc_mask = torch.zeros_like(exc_p1)
-            inh_mask = torch.zeros_like(inh_p1)
-            for i in range(exc_count1.size()[0]):
-                _, exc_indices = torch.topk(exc_p1[i].flatten(),
-                                            exc_count1[i].item())
-                _, inh_indices = torch.topk(inh_p1[i].flatten(),
-                                            inh_count1[i].item())
-                exc_mask[i].flatten().scatter_(-1, exc_indices, 1)
-                inh_mask[i].flatten().scatter_(-1, inh_indices, 1)
+            # Keep the round(sum(p1)) gates with the highest p1 of every unit
+            exc_p1 = exc_p1.view(exc_p1.size(0), -1)
+            inh_p1 = inh_p1.view(inh_p1.size(0), -1)
+            exc_mask = topk_mask(exc_p1, exc_p1.sum(dim=1).round().long())
+            inh_mask = topk_mask(inh_p1, inh_p1.sum(dim=1).round().long())
+            return (exc_mask.float().view_as(self.exc_p1),
+                    inh_mask.float().view_as(self.inh_p1))
+
+    def get_inference_weight(self):
+        if torch.is_grad_enabled():
+            return self._compute_inference_weight()
+        return self.cached_inference("weight", self._compute_inference_weight)
+
+    def _compute_inference_weight(self):
+        exc_mask, inh_mask = self.get_inference_mask()
+        return exc_mask * self.exc_weight - inh_mask * self.inh_weight
 
-            return exc_mask, inh_mask
+    def uniform_samples(self, samples):
+        """
+        Uniform random numbers to sample the gates of ``samples`` weights. With
+        a sample_memory_budget they are drawn into a buffer holding one chunk,
+        reused across chunks and training steps, so the result is only valid
+        until the next call.
+        """
+        buf = self._uniform_buffer
+        if buf is None or buf.size(0) < samples:
+            buf = self.exc_p1.new_empty((samples,) + self.exc_p1.size())
+        return buf[:samples].uniform_(0, 1)
+
+    def _resize_uniform_buffer(self, chunk_size):
+        """
+        Keep the buffer of :meth:`uniform_samples` sized for one chunk, on the
+        device and with the dtype of the gate parameters
+        """
+        buf = self._uniform_buffer
+        p1 = self.exc_p1
+        if (buf is None or buf.size(0) != chunk_size or buf.device != p1.device
+                or buf.dtype != p1.dtype):
+            self._uniform_buffer = None
+            self._uniform_buffer = p1.new_empty((chunk_size,) + p1.size())
+
+    def train(self, mode=True):
+        if not mode:
+            self._uniform_buffer = None
+        return super().train(mode)
+
+    def samples_per_chunk(self, batch_size):
+        """
+        Number of items whose weights are sampled at once when
+        one_sample_per_item is True, given the sample_memory_budget
+        """
+        if self.sample_memory_budget is None:
+            return batch_size
+        # The uniform samples, both gates, both gated weights and their
+        # difference are alive at the same time for every item
+        item_bytes = 6 * self.exc_weight.numel() * self.exc_weight.element_size()
+        return max(1, min(batch_size,
+                          int(self.sample_memory_budget // item_bytes)))
 
     def sample_weight_and_bias(self, samples=1):
         if self.training or not self.optimize_inference:
-            w = (sample_weight(self.exc_p1, self.exc_weight,
-                               self.deterministic, samples)
-                 - sample_weight(self.inh_p1, self.inh_weight,
-                                 self.deterministic, samples))
+            if samples > 1 and not self.deterministic:
+                w = (sample_weight(self.exc_p1, self.exc_weight,
+                                   u=self.uniform_samples(samples))
+                     - sample_weight(self.inh_p1, self.inh_weight,
+                                     u=self.uniform_samples(samples)))
+            else:
+                w = (sample_weight(self.exc_p1, self.exc_weight,
+                                   self.deterministic, samples)
+                     - sample_weight(self.inh_p1, self.inh_weight,
+                                     self.deterministic, samples))
         else:
-            exc_mask, inh_mask = self.get_inference_mask()
-            w = exc_mask * self.exc_weight - inh_mask * self.inh_weight
+            w = self.get_inference_weight()
 
         b = None
         if self.use_baseline_bias:
@@ -463,25 +533,37 @@ class BinaryGatedConv2d(Module):
             self.input_shape = x.size()
 
         if self.one_sample_per_item and self.training and len(x.size()) > 3:
-            w, b = self.sample_weight_and_bias(x.size(0))
-
-            if self.use_baseline_bias:
-                b = b.view(x.size(0) * self.out_channels)
+            chunk_size = self.samples_per_chunk(x.size(0))
+            if self.sample_memory_budget is None:
+                self._uniform_buffer = None
             else:
-                b = b.repeat(x.size(0))
-
-            x_ = x.view(1, x.size(0) * x.size(1), *x.size()[2:])
-            w_ = w.view(w.size(0) * w.size(1), *w.size()[2:])
-            result = F.conv2d(x_, w_, b,
-                              self.stride, self.padding, self.dilation,
-                              x.size(0) * self.groups)
-
-            return result.view(x.size(0), self.out_channels, *result.size()[2:])
+                self._resize_uniform_buffer(chunk_size)
+            if chunk_size >= x.size(0):
+                return self._forward_one_sample_per_item(x)
+            return torch.cat([self._forward_one_sample_per_item(x_chunk)
+                              for x_chunk in x.split(chunk_size)])
         else:
             w, b = self.sample_weight_and_bias()
             return F.conv2d(x, w, b,
                             self.stride, self.padding, self.dilation, self.groups)
 
+    def _forward_one_sample_per_item(self, x):
+        """Convolve every item of x with its own sampled weights"""
+        w, b = self.sample_weight_and_bias(x.size(0))
+
+        if self.use_baseline_bias:
+            b = b.view(x.size(0) * self.out_channels)
+        elif b is not None:
+            b = b.repeat(x.size(0))
+
+        x_ = x.reshape(1, x.size(0) * x.size(1), *x.size()[2:])
+        w_ = w.reshape(-1, *w.size()[-3:])
+        result = F.conv2d(x_, w_, b,
+                          self.stride, self.padding, self.dilation,
+                          x.size(0) * self.groups)
+
+        return result.view(x.size(0), self.out_channels, *result.size()[2:])
+
     def get_expected_nonzeros(self):
         exc_p1, inh_p1 = self.get_gate_probabilities()
 
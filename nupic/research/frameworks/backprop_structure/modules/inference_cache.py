@@ -0,0 +1,79 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+from itertools import chain
+
+import torch
+
+
+def topk_mask(x, k):
+    """
+    Mask of the k[i] largest values of every row x[i], computed for all the
+    rows at once.
+
+    :param x: 2D tensor (rows, n)
+    :param k: LongTensor (rows,) with the number of values to select per row
+    :return: boolean tensor with the same shape as x
+    """
+    order = x.argsort(dim=1, descending=True)
+    ranks = torch.arange(x.shape[1], device=x.device)
+    selected = ranks.unsqueeze(0) < k.view(-1, 1).to(x.device)
+    return torch.zeros_like(x, dtype=torch.bool).scatter_(1, order, selected)
+
+
+class InferenceCacheMixin(object):
+    """
+    Cache tensors computed from the parameters of the module, such as the
+    inference masks and weights of the gated layers.
+
+    Cached values are computed without gradient and invalidated when the
+    storage or version counter of any parameter or buffer of the module changes
+    (in place updates, loading a state dict, moving the module to another
+    device) and when switching between train and eval mode. Call
+    :meth:`clear_inference_cache` after modifying ``param.data`` directly.
+    """
+
+    def clear_inference_cache(self):
+        self.__dict__["_inference_cache"] = {}
+
+    def _parameters_key(self):
+        return tuple((t.data_ptr(), t._version)
+                     for t in chain(self._parameters.values(),
+                                    self._buffers.values())
+                     if t is not None)
+
+    def cached_inference(self, name, compute_fn):
+        """
+        Return the cached value of ``compute_fn()`` if the parameters of the
+        module didn't change since it was computed
+        """
+        cache = self.__dict__.setdefault("_inference_cache", {})
+        key = self._parameters_key()
+        entry = cache.get(name)
+        if entry is None or entry[0] != key:
+            with torch.no_grad():
+                entry = (key, compute_fn())
+            cache[name] = entry
+        return entry[1]
+
+    def train(self, mode=True):
+        self.clear_inference_cache()
+        return super().train(mode)
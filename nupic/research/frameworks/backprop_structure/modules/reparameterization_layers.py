@@ -34,12 +34,14 @@ from torch.nn.modules import Module
 from torch.nn.modules.utils import _pair as pair
 from torch.nn.parameter import Parameter
 
+from .inference_cache import InferenceCacheMixin
+
 LIMIT_A = -.1
 LIMIT_B = 1.1
 EPSILON = 1e-6
 
 
-class HardConcreteGatedLinear(Module):
+class HardConcreteGatedLinear(InferenceCacheMixin, Module):
     """
     Linear layer with stochastic connections, as in
     https://arxiv.org/abs/1712.01312
@@ -85,6 +87,7 @@ class HardConcreteGatedLinear(Module):
         self.reset_parameters()
 
     def reset_parameters(self):
+        self.clear_inference_cache()
         init.kaiming_normal_(self.weight, mode="fan_out")
         self.loga.data.normal_(math.log(1 - self.droprate_init)
                                - math.log(self.droprate_init),
@@ -93,6 +96,7 @@ class HardConcreteGatedLinear(Module):
             self.bias.data.fill_(0)
 
     def constrain_parameters(self, **kwargs):
+        self.clear_inference_cache()
         self.loga.data.clamp_(min=math.log(1e-2), max=math.log(1e2))
 
     def cdf_qz(self, x):
@@ -160,17 +164,25 @@ class HardConcreteGatedLinear(Module):
         eps = Variable(eps)
         return eps
 
+    def get_inference_gates(self):
+        pi = torch.sigmoid(self.loga)
+        return F.hardtanh(pi * (LIMIT_B - LIMIT_A) + LIMIT_A, min_val=0,
+                          max_val=1)
+
+    def get_inference_weight(self):
+        if torch.is_grad_enabled():
+            return self.get_inference_gates() * self.weight
+        return self.cached_inference(
+            "weight", lambda: self.get_inference_gates() * self.weight)
+
     def sample_weight(self):
         if self.training:
             z = self.quantile_concrete(
                 self.get_eps(self.floatTensor(self.loga.size())))
             mask = F.hardtanh(z, min_val=0, max_val=1)
+            return mask * self.weight
         else:
-            pi = torch.sigmoid(self.loga)
-            mask = F.hardtanh(pi * (LIMIT_B - LIMIT_A) + LIMIT_A, min_val=0,
-                              max_val=1)
-
-        return mask * self.weight
+            return self.get_inference_weight()
 
     def forward(self, x):
         return F.linear(x, self.sample_weight(),
@@ -182,11 +194,9 @@ class HardConcreteGatedLinear(Module):
             dim=tuple(range(1, len(expected_gates.shape)))).detach()
 
     def get_inference_nonzeros(self):
-        inference_gates = F.hardtanh(
-            torch.sigmoid(self.loga) * (LIMIT_B - LIMIT_A) + LIMIT_A,
-            min_val=0, max_val=1)
+        inference_gates = self.cached_inference("gates", self.get_inference_gates)
         return (inference_gates > 0).sum(
-            dim=tuple(range(1, len(inference_gates.shape)))).detach()
+            dim=tuple(range(1, len(inference_gates.shape))))
 
     def __repr__(self):
         s = ("{name}({in_features} -> {out_features}, "
@@ -198,7 +208,7 @@ class HardConcreteGatedLinear(Module):
         return s.format(name=self.__class__.__name__, **self.__dict__)
 
 
-class HardConcreteGatedConv2d(Module):
+class HardConcreteGatedConv2d(InferenceCacheMixin, Module):
     """
     Convolutional layer with stochastic connections, as in
     https://arxiv.org/abs/1712.01312
@@ -264,6 +274,7 @@ class HardConcreteGatedConv2d(Module):
         self.reset_parameters()
 
     def reset_parameters(self):
+        self.clear_inference_cache()
         init.kaiming_normal_(self.weight, mode="fan_in")
 
         self.loga.data.normal_(
@@ -274,6 +285,7 @@ class HardConcreteGatedConv2d(Module):
             self.bias.data.fill_(0)
 
     def constrain_parameters(self, **kwargs):
+        self.clear_inference_cache()
         self.loga.data.clamp_(min=math.log(1e-2), max=math.log(1e2))
 
     def cdf_qz(self, x):
@@ -369,17 +381,25 @@ class HardConcreteGatedConv2d(Module):
         eps = Variable(eps)
         return eps
 
+    def get_inference_gates(self):
+        pi = torch.sigmoid(self.loga)
+        return F.hardtanh(pi * (LIMIT_B - LIMIT_A) + LIMIT_A, min_val=0,
+                          max_val=1)
+
+    def get_inference_weight(self):
+        if torch.is_grad_enabled():
+            return self.get_inference_gates() * self.weight
+        return self.cached_inference(
+            "weight", lambda: self.get_inference_gates() * self.weight)
+
     def sample_weight(self):
         if self.training:
             z = self.quantile_concrete(
                 self.get_eps(self.floatTensor(self.loga.size())))
             mask = F.hardtanh(z, min_val=0, max_val=1)
+            return mask * self.weight
         else:
-            pi = torch.sigmoid(self.loga)
-            mask = F.hardtanh(pi * (LIMIT_B - LIMIT_A) + LIMIT_A, min_val=0,
-                              max_val=1)
-
-        return mask * self.weight
+            return self.get_inference_weight()
 
     def forward(self, x):
         if self.input_shape is None:
@@ -395,11 +415,9 @@ class HardConcreteGatedConv2d(Module):
             dim=tuple(range(1, len(expected_gates.shape)))).detach()
 
     def get_inference_nonzeros(self):
-        inference_gates = F.hardtanh(
-            torch.sigmoid(self.loga) * (LIMIT_B - LIMIT_A) + LIMIT_A,
-            min_val=0, max_val=1)
+        inference_gates = self.cached_inference("gates", self.get_inference_gates)
         return (inference_gates > 0).sum(
-            dim=tuple(range(1, len(inference_gates.shape)))).detach()
+            dim=tuple(range(1, len(inference_gates.shape))))
 
     def __repr__(self):
         s = ("{name}({in_channels}, {out_channels}, kernel_size={kernel_size}, "
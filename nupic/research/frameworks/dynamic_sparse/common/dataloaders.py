@@ -19,7 +19,6 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
-import itertools
 import os
 import random
 import re
@@ -29,6 +28,12 @@ import numpy as np
 import torch
 from torch.utils.data import DataLoader, Dataset
 
+from nupic.research.frameworks.pytorch.dataset_utils import (
+    MemoryMappedDataset,
+    npz_to_npy,
+    prefetch_npz,
+)
+
 CLASSES = (
     "unknown, silence, zero, one, two, three, four, five, six, seven,"
     " eight, nine".split(", ")
@@ -87,7 +92,8 @@ class PreprocessedSpeechDataset(Dataset):
     """
 
     def __init__(
-        self, root, subset, random_seed=0, noise_level=0, classes=CLASSES
+        self, root, subset, random_seed=0, noise_level=0, classes=CLASSES,
+        memory_map=False, cache_dir=None,
     ):
         """
         :param root: Dataset root directory
@@ -95,6 +101,12 @@ class PreprocessedSpeechDataset(Dataset):
         :param noise_level: noise_level of dataset to load (in percent)
         :param classes: List of classes to load. See CLASSES for valid options
         :param silence_percentage: Percentage of the dataset to be filled with silence
+        :param memory_map: Whether to memory map an uncompressed copy of each seed
+                           (see :func:`npz_to_npy`) instead of loading the ".npz"
+                           file into a list of tensors. The next seed is
+                           prefetched in the background.
+        :param cache_dir: Directory of the ".npy" copies used when ``memory_map``
+                          is set. Defaults to the dataset directory
         """
         self.classes = classes
 
@@ -109,18 +121,24 @@ class PreprocessedSpeechDataset(Dataset):
             root += "/gsc"
         self._root = root
         self._subset = subset
+        self._memory_map = memory_map
+        self._cache_dir = cache_dir
+        self._prefetch = None
 
         self.data = None
 
         # Circular list of all seeds in this dataset
         random.seed(random_seed)
-        seeds = [re.search(r"gsc_" + subset + r"(\d+)", e) for e in os.listdir(root)]
+        # Only match the ".npz" files, ignoring their memory mapped ".npy" copies
+        pattern = r"gsc_" + subset + r"(\d+)\.npz$"
+        seeds = [re.search(pattern, e) for e in os.listdir(root)]
         seeds = [int(e.group(1)) for e in seeds if e is not None]
         seeds = seeds if len(seeds) > 0 else [""]
         if subset == "test_noise":
             seeds = sorted([seed for seed in seeds
                             if int(seed) in noise_levels])
-        self._all_seeds = itertools.cycle(seeds if len(seeds) > 0 else "")
+        self._seeds = seeds
+        self._seed_index = 0
         self.num_seeds = len(seeds)
 
         # Load first seed.
@@ -141,21 +159,41 @@ class PreprocessedSpeechDataset(Dataset):
         """
         return self.data[index]
 
-    def next_seed(self):
-        """Load next seed from disk."""
-        seed = str(next(self._all_seeds))
+    def _get_data_path(self, seed):
+        seed = str(seed)
         seed = "0" + seed if (len(seed) == 1) and self._subset == "test_noise" else seed
+        return seed, os.path.join(self._root, "gsc_" + self._subset + seed + ".npz")
 
-        data_path = os.path.join(self._root, "gsc_" + self._subset + seed + ".npz")
-
-        x, y = np.load(data_path).values()
+    def next_seed(self):
+        """Load next seed from disk."""
+        seed, data_path = self._get_data_path(self._seeds[self._seed_index])
+        self._seed_index = (self._seed_index + 1) % len(self._seeds)
+
+        if self._memory_map:
+            # Wait for the prefetch of this seed to finish converting the file
+            if self._prefetch is not None:
+                self._prefetch.join()
+            self.data = MemoryMappedDataset(npz_to_npy(data_path, self._cache_dir))
+
+            # Prefetch the next seed while this one is used
+            if self.num_seeds > 1:
+                _, next_path = self._get_data_path(self._seeds[self._seed_index])
+                self._prefetch = prefetch_npz(next_path, self._cache_dir)
+        else:
+            x, y = np.load(data_path).values()
 
-        x = map(torch.tensor, x)
-        y = map(torch.tensor, y)
-        self.data = list(zip(x, y))
+            x = map(torch.tensor, x)
+            y = map(torch.tensor, y)
+            self.data = list(zip(x, y))
 
         return seed
 
+    def __getstate__(self):
+        # Threads cannot be pickled and are only needed by the main process
+        state = self.__dict__.copy()
+        state["_prefetch"] = None
+        return state
+
 
 class PreprocessedSpeechDataLoader(VaryingDataLoader):
     def __init__(
@@ -166,12 +204,14 @@ class PreprocessedSpeechDataLoader(VaryingDataLoader):
         noise_level=0,
         classes=CLASSES,
         batch_size=1,
+        memory_map=False,
+        cache_dir=None,
         *args,
         **kwargs,
     ):
 
         self.dataset = PreprocessedSpeechDataset(
-            root, subset, random_seed, noise_level, classes)
+            root, subset, random_seed, noise_level, classes, memory_map, cache_dir)
         self.first_iter_occurred = False
 
         super().__init__(self.dataset, batch_size, *args, *kwargs)
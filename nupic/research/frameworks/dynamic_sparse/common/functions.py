@@ -23,6 +23,8 @@ import numpy as np
 import torch
 from torch import nn
 
+from nupic.research.frameworks.pytorch.functions import kwinners_threshold
+
 
 class KWinners(nn.Module):
     """Test implementation of KWinners
@@ -34,7 +36,8 @@ class KWinners(nn.Module):
     Please test before using it.
     """
 
-    def __init__(self, k_perc=0.1, use_absolute=False, use_boosting=False, beta=0.01):
+    def __init__(self, k_perc=0.1, use_absolute=False, use_boosting=False, beta=0.01,
+                 strategy="kthvalue"):
         super(KWinners, self).__init__()
 
         self.duty_cycle = None
@@ -44,6 +47,7 @@ class KWinners(nn.Module):
         self.current_time = 0
         self.use_absolute = use_absolute
         self.use_boosting = use_boosting
+        self.strategy = strategy
 
     def forward(self, x):
 
@@ -73,7 +77,7 @@ class KWinners(nn.Module):
                 boosting = self._calculate_boosting()
                 tx *= boosting
             # get mask
-            mask = tx > threshold
+            mask = tx >= threshold
 
             # update duty cycle at training only
             if self.training:
@@ -84,9 +88,7 @@ class KWinners(nn.Module):
     def _get_threshold(self, x, k):
         """Calculate dynamic theshold"""
         # k-winners over neurons only
-        flatten_x = x.view(x.shape[0], -1)
-        pos = int((flatten_x.shape[1] - k))
-        threshold, _ = torch.kthvalue(flatten_x, pos, dim=-1)
+        threshold = kwinners_threshold(x, k, strategy=self.strategy)
         expanded_size = [x.shape[0]] + [1 for _ in range(len(x.shape) - 1)]
         return threshold.view(expanded_size)
 
@@ -22,5 +22,6 @@ from .comparative import *
 from .dscnn import *
 from .dsnn import *
 from .main import *
+from .mask_updates import *
 from .modules import *
 from .pruning import *
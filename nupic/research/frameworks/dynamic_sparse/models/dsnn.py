@@ -19,11 +19,16 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
-import numpy as np
 import torch
 
 from .loggers import DSNNLogger
 from .main import SparseModel
+from .mask_updates import (
+    hebbian_add_masks,
+    hebbian_keep_masks,
+    magnitude_keep_masks,
+    random_add_masks,
+)
 
 __all__ = [
     "DSNNHeb",
@@ -35,7 +40,19 @@ __all__ = [
 
 
 class DSNNHeb(SparseModel):
-    """Parent class for DSNNHeb models. Not to be instantiated"""
+    """Parent class for DSNNHeb models. Not to be instantiated
+
+    The keep (prune) and add (grow) masks of all the dynamic modules are
+    computed on the device, see :mod:`.mask_updates`. The only host sync in
+    each structure update is the ``num_adds.tolist()`` in
+    :meth:`_reinitialize_weights`, which hands the added counts to the logger.
+    With ``log_masks`` or ``log_surviving_synapses`` enabled the logger adds
+    further ``.item()`` syncs per module. Subclasses define the criteria in
+    :meth:`prune_modules` and :meth:`grow_modules`.
+
+    By default the structure is updated after every epoch. Set
+    ``prune_every_n_batches`` to update it every N training batches instead.
+    """
 
     def setup(self):
         super().setup()
@@ -48,6 +65,7 @@ class DSNNHeb(SparseModel):
             weight_prune_perc=None,
             hebbian_grow=False,
             reset_coactivations=True,
+            prune_every_n_batches=None,
         )
         new_defaults = {k: v for k, v in new_defaults.items() if k not in self.__dict__}
         self.__dict__.update(new_defaults)
@@ -66,6 +84,7 @@ class DSNNHeb(SparseModel):
         # initialize hebbian learning
         self._init_hebbian()
         self.prune_cycles_completed = 0
+        self.train_batches_completed = 0
 
         self.logger = DSNNLogger(self, config=self.config)
 
@@ -79,16 +98,28 @@ class DSNNHeb(SparseModel):
     def _is_dynamic(self, module):
         return True
 
-    def _pre_epoch_setup(self):
+    def _reset_coactivations(self):
         if self.reset_coactivations:
             for module in self.sparse_modules:
                 if module.hebbian_prune:
                     module.reset_coactivations()
 
+    def _pre_epoch_setup(self):
+        self._reset_coactivations()
+
+    def _post_optimize_updates(self):
+        super()._post_optimize_updates()
+        if self.prune_every_n_batches:
+            self.train_batches_completed += 1
+            if self.train_batches_completed % self.prune_every_n_batches == 0:
+                self._reinitialize_weights()
+                self._reset_coactivations()
+
     def _post_epoch_updates(self, dataset=None):
         super()._post_epoch_updates(dataset)
         # zero out correlations (move to network)
-        self._reinitialize_weights()
+        if not self.prune_every_n_batches:
+            self._reinitialize_weights()
         # decide whether to stop pruning
         if self.pruning_early_stop:
             if self.current_epoch in self.lr_milestones:
@@ -98,168 +129,66 @@ class DSNNHeb(SparseModel):
 
     def _reinitialize_weights(self):
         """Reinitialize weights - prune and grow"""
-        if self.pruning_active:
+        if not self.pruning_active:
+            return
+        modules = [m for m in self.sparse_modules if self._is_dynamic(m)]
+        if not modules:
+            return
+
+        with torch.no_grad():
+            # prune
+            keep_masks = self.prune_modules(modules)
+            # grow the number of synapses pruned in each module
+            num_params = torch.tensor(
+                [module.num_params for module in modules], device=keep_masks[0].device
+            )
+            num_kept = torch.stack([keep_mask.sum() for keep_mask in keep_masks])
+            num_adds = (num_params - num_kept).clamp(min=0)
+            add_masks = self.grow_modules(modules, num_adds)
+
             # keep track of added synapes
-            for module in self.sparse_modules:
-                if self._is_dynamic(module):
-                    # prune
-                    keep_mask = self.prune(module)
-                    # grow
-                    num_params = module.num_params
-                    num_add = int(max(num_params - torch.sum(keep_mask).item(), 0))
-                    add_mask = self.grow(module, num_add)
-                    # join both
-                    new_mask = keep_mask | add_mask
-                    with torch.no_grad():
-                        module.mask = new_mask.float()
-                        module.apply_mask()
-
-                    self.logger.save_masks(
-                        module.pos, new_mask, keep_mask, add_mask, num_add
-                    )
-                    self.logger.save_surviving_synapses(module, keep_mask, add_mask)
-
-    def _get_hebbian_mask(self, weight, corr, active_synapses, prune_perc):
-
-        num_synapses = np.prod(weight.shape)
-        total_active = torch.sum(active_synapses).item()
-
-        corr_active = corr[active_synapses]
-        # decide which weights to remove based on correlation
-        kth = int(prune_perc * total_active)
-        # if kth = 0, keep all the synapses
-        if kth == 0:
-            hebbian_mask = active_synapses
-        # else if kth greater than shape, remove all synapses
-        elif kth >= num_synapses:
-            hebbian_mask = torch.zeros(weight.shape)
-        # if no edge cases
-        else:
-            keep_threshold, _ = torch.kthvalue(corr_active, kth)
-            # keep mask are ones above threshold and currently active
-            hebbian_mask = (corr > keep_threshold) & active_synapses
-        # move to device
-        hebbian_mask.to(self.device)
-
-        return hebbian_mask
-
-    def _get_inverse_hebbian_mask(self, weight, corr, active_synapses, prune_perc):
-
-        num_synapses = np.prod(weight.shape)
-        total_active = torch.sum(active_synapses).item()
-
-        corr_active = corr[active_synapses]
-        # decide which weights to remove based on correlation
-        kth = int((1 - prune_perc) * total_active)
-        # if kth = 0, keep all the synapses
-        if kth == 0:
-            hebbian_mask = torch.zeros(weight.shape).bool()
-        # else if kth greater than shape, remove all synapses
-        elif kth >= num_synapses:
-            hebbian_mask = active_synapses
-        # if no edge cases
-        else:
-            keep_threshold, _ = torch.kthvalue(corr_active, kth)
-            # keep mask are ones above threshold and currently active
-            hebbian_mask = (corr <= keep_threshold) & active_synapses
-        hebbian_mask = hebbian_mask.to(self.device)
-
-        return hebbian_mask
-
-    def _get_magnitude_mask(self, weight, active_synapses, prune_perc):
-
-        # calculate the positive
-        weight_pos = weight[weight > 0]
-        pos_kth = int(prune_perc * len(weight_pos))
-        # if no positive weight, threshold can be 0 (select none)
-        if len(weight_pos) > 0:
-            # if prune_perc=0, pos_kth=0, prune nothing
-            if pos_kth == 0:
-                pos_threshold = -1
-            else:
-                pos_threshold, _ = torch.kthvalue(weight_pos, pos_kth)
-        else:
-            pos_threshold = 0
-
-        # calculate the negative
-        weight_neg = weight[weight < 0]
-        neg_kth = int((1 - prune_perc) * len(weight_neg))
-        # if no negative weight, threshold -1 (select none)
-        if len(weight_neg) > 0:
-            # if prune_perc=1, neg_kth=0, prune all
-            if neg_kth == 0:
-                neg_threshold = torch.min(weight_neg).item() - 1
-            else:
-                neg_threshold, _ = torch.kthvalue(weight_neg, neg_kth)
-        else:
-            neg_threshold = -1
-
-        # consolidate
-        partial_weight_mask = (weight > pos_threshold) | (weight <= neg_threshold)
-        weight_mask = partial_weight_mask & active_synapses
-        weight_mask = weight_mask.to(self.device)
-
-        return weight_mask
-
-    def _get_random_add_mask_prob(self, nonactive_synapses, num_add):
-        """
-        Deprecated method of add random mask.
-        Faster, but adds stochasticity to number of added params - tricky to test
-        """
-        total_nonactive = torch.sum(nonactive_synapses).item()
-        p_add = num_add / max(total_nonactive, num_add)
-        random_sample = torch.rand(nonactive_synapses.shape).to(self.device) < p_add
-        add_mask = random_sample & nonactive_synapses
+            for module, keep_mask, add_mask, num_add in zip(
+                modules, keep_masks, add_masks, num_adds.tolist()
+            ):
+                # join both
+                new_mask = keep_mask | add_mask
+                module.mask = new_mask.float()
+                module.apply_mask()
+
+                self.logger.save_masks(
+                    module.pos, new_mask, keep_mask, add_mask, num_add
+                )
+                self.logger.save_surviving_synapses(module, keep_mask, add_mask)
 
-        return add_mask
+    def prune(self, module):
+        """Keep mask of a single module. See :meth:`prune_modules`"""
+        with torch.no_grad():
+            return self.prune_modules([module])[0]
 
-    def _get_random_add_mask(self, nonactive_synapses, num_add):
+    def grow(self, module, num_add):
+        """Add mask of a single module. See :meth:`grow_modules`"""
+        with torch.no_grad():
+            num_adds = torch.tensor([int(num_add)], device=module.m.weight.device)
+            return self.grow_modules([module], num_adds)[0]
+
+    def prune_modules(self, modules):
         """
-        Random mask that ensures the exact number of params is added
-        For computationally faster method, see _get_random_add_mask_prob
+        Return the keep masks of the modules. Keeps all the active synapses
         """
-        nonzero = torch.nonzero(nonactive_synapses, as_tuple=False)
-        num_add = min(int(num_add), len(nonzero))  # can't select more than available
-        sampled_idxs = np.random.choice(range(len(nonzero)), num_add, replace=False)
-        selected = nonzero[sampled_idxs]
-
-        add_mask = torch.zeros(nonactive_synapses.shape, dtype=torch.bool)
-        if len(selected.shape) > 1:
-            add_mask[list(zip(*selected))] = True
-        else:
-            add_mask[selected] = True
-
-        return add_mask.to(self.device)
-
-    def _get_hebbian_add_mask(self, corr, nonactive_synapses, num_add):
-
-        # get threshold
-        total_nonactive = torch.sum(nonactive_synapses).item()
-        kth = int(total_nonactive - num_add)  # should not be non-int
-        corr_nonactive = corr[nonactive_synapses]
-        add_threshold, _ = torch.kthvalue(corr_nonactive, kth)
-        # calculate mask, only for currently nonactive
-        add_mask = (corr > add_threshold) & nonactive_synapses
-
-        return add_mask
-
-    def _get_inverse_add_mask(self, corr, nonactive_synapses, num_add):
-
-        # get threshold
-        kth = int(num_add)  # should not be non-int
-        if kth > 0:
-            corr_nonactive = corr[nonactive_synapses]
-            add_threshold, _ = torch.kthvalue(corr_nonactive, kth)
-            # calculate mask, only for currently nonactive
-            add_mask = (corr <= add_threshold) & nonactive_synapses
-        # if there is nothing to add, return zeros
-        else:
-            add_mask = torch.zeros(nonactive_synapses.shape).bool()
-
-        return add_mask
+        return [module.m.weight != 0 for module in modules]
 
-    def prune(self, module):
-        pass
+    def grow_modules(self, modules, num_adds):
+        """
+        Return the add masks of the modules
+
+        :param modules: list of sparse modules
+        :param num_adds: LongTensor with the number of synapses to add per module
+        """
+        nonactives = [module.m.weight == 0 for module in modules]
+        if self.hebbian_grow:
+            corrs = [module.get_coactivations() for module in modules]
+            return hebbian_add_masks(corrs, nonactives, num_adds)
+        return random_add_masks(nonactives, num_adds)
 
 
 class DSNNWeightedMag(DSNNHeb):
@@ -268,94 +197,80 @@ class DSNNWeightedMag(DSNNHeb):
     def _is_dynamic(self, module):
         return module.hebbian_prune is not None
 
-    def prune(self, module):
-        """Prune by magnitude"""
-        with torch.no_grad():
-            # unpack module
-            weight = module.m.weight.clone().detach()
-            corr = module.get_coactivations()
-            hebbian_prune_perc = module.hebbian_prune
-            # init shared variables
-            active_synapses = weight != 0
-
-            if hebbian_prune_perc is not None:
-                # multiply correlation by weight, and then apply regular weight pruning
-                weight *= corr
-                keep_mask = self._get_magnitude_mask(
-                    weight, active_synapses, hebbian_prune_perc
-                )
-            else:
-                keep_mask = active_synapses.to(self.device)
-
-        return keep_mask
-
-    def grow(self, module, num_add):
+    def prune_modules(self, modules):
+        """Prune by magnitude of the weights multiplied by correlation"""
+        keep_masks = super().prune_modules(modules)
+        idxs = [i for i, m in enumerate(modules) if m.hebbian_prune is not None]
+        if idxs:
+            # multiply correlation by weight, and then apply regular weight pruning
+            weights = [modules[i].m.weight * modules[i].get_coactivations()
+                       for i in idxs]
+            masks = magnitude_keep_masks(
+                weights,
+                [keep_masks[i] for i in idxs],
+                [modules[i].hebbian_prune for i in idxs],
+            )
+            for i, mask in zip(idxs, masks):
+                keep_masks[i] = mask
+        return keep_masks
+
+    def grow_modules(self, modules, num_adds):
         """Add randomly"""
-        with torch.no_grad():
-            nonactive_synapses = module.m.weight == 0
-            add_mask = self._get_random_add_mask(nonactive_synapses, num_add)
-            add_mask = add_mask.to(self.device)
-
-        return add_mask
+        nonactives = [module.m.weight == 0 for module in modules]
+        return random_add_masks(nonactives, num_adds)
 
 
 class DSNNMixedHeb(DSNNHeb):
     """Improved results compared to DSNNHeb"""
 
+    # Whether or not to keep and add the synapses with the lowest correlations
+    inverse_hebbian = False
+
     def _is_dynamic(self, module):
         return module.hebbian_prune is not None or module.weight_prune is not None
 
-    def prune(self, module):
+    def prune_modules(self, modules):
         """Allows pruning by magnitude and hebbian"""
-        with torch.no_grad():
-            # unpack module
-            weight = module.m.weight.clone().detach()
-            hebbian_prune_perc = module.hebbian_prune
-            weight_prune_perc = module.weight_prune
-            active_synapses = weight != 0
-
-            # hebbian mask
-            if hebbian_prune_perc is not None:
-                corr = module.get_coactivations()
-                hebbian_mask = self._get_hebbian_mask(
-                    weight, corr, active_synapses, hebbian_prune_perc
-                )
-            else:
-                hebbian_mask = None
-
-            # weight mask
-            if weight_prune_perc is not None:
-                magnitude_mask = self._get_magnitude_mask(
-                    weight, active_synapses, weight_prune_perc
-                )
-            else:
-                magnitude_mask = None
-
-            # join both masks
-            if hebbian_prune_perc and weight_prune_perc:
-                keep_mask = hebbian_mask | magnitude_mask
-            elif hebbian_prune_perc:
-                keep_mask = hebbian_mask
-            elif weight_prune_perc:
-                keep_mask = magnitude_mask
-            # if no pruning, just perpetuate same synapses
-            else:
-                keep_mask = active_synapses.to(self.device)
-
-        return keep_mask
-
-    def grow(self, module, num_add):
-        """Add randomly"""
-        with torch.no_grad():
-            nonactive_synapses = module.m.weight == 0
-            if self.hebbian_grow:
-                corr = module.get_coactivations()
-                add_mask = self._get_hebbian_add_mask(corr, nonactive_synapses, num_add)
-            else:
-                add_mask = self._get_random_add_mask(nonactive_synapses, num_add)
-            add_mask = add_mask.to(self.device)
-
-        return add_mask
+        actives = super().prune_modules(modules)
+        keep_masks = list(actives)
+
+        # hebbian masks
+        hebbian_idxs = [i for i, m in enumerate(modules) if m.hebbian_prune]
+        if hebbian_idxs:
+            masks = hebbian_keep_masks(
+                [modules[i].get_coactivations() for i in hebbian_idxs],
+                [actives[i] for i in hebbian_idxs],
+                [modules[i].hebbian_prune for i in hebbian_idxs],
+                inverse=self.inverse_hebbian,
+            )
+            for i, mask in zip(hebbian_idxs, masks):
+                keep_masks[i] = mask
+
+        # weight masks, joined with the hebbian masks
+        magnitude_idxs = [i for i, m in enumerate(modules) if m.weight_prune]
+        if magnitude_idxs:
+            masks = magnitude_keep_masks(
+                [modules[i].m.weight for i in magnitude_idxs],
+                [actives[i] for i in magnitude_idxs],
+                [modules[i].weight_prune for i in magnitude_idxs],
+            )
+            for i, mask in zip(magnitude_idxs, masks):
+                if modules[i].hebbian_prune:
+                    keep_masks[i] = keep_masks[i] | mask
+                else:
+                    keep_masks[i] = mask
+
+        # if no pruning, just perpetuate same synapses
+        return keep_masks
+
+    def grow_modules(self, modules, num_adds):
+        """Add randomly or by correlation"""
+        nonactives = [module.m.weight == 0 for module in modules]
+        if self.hebbian_grow:
+            corrs = [module.get_coactivations() for module in modules]
+            return hebbian_add_masks(corrs, nonactives, num_adds,
+                                     inverse=self.inverse_hebbian)
+        return random_add_masks(nonactives, num_adds)
 
 
 class SET(DSNNHeb):
@@ -364,88 +279,27 @@ class SET(DSNNHeb):
     def _is_dynamic(self, module):
         return module.weight_prune is not None
 
-    def prune(self, module):
-        """Allows pruning by magnitude and hebbian"""
-        with torch.no_grad():
-            # unpack module
-            weight = module.m.weight.clone().detach()
-            weight_prune_perc = module.weight_prune
-            active_synapses = weight != 0
-
-            # weight mask
-            if weight_prune_perc is not None:
-                keep_mask = self._get_magnitude_mask(
-                    weight, active_synapses, weight_prune_perc
-                )
-            else:
-                keep_mask = active_synapses
-
-        return keep_mask.to(self.device)
-
-    def grow(self, module, num_add):
+    def prune_modules(self, modules):
+        """Allows pruning by magnitude"""
+        keep_masks = super().prune_modules(modules)
+        idxs = [i for i, m in enumerate(modules) if m.weight_prune is not None]
+        if idxs:
+            masks = magnitude_keep_masks(
+                [modules[i].m.weight for i in idxs],
+                [keep_masks[i] for i in idxs],
+                [modules[i].weight_prune for i in idxs],
+            )
+            for i, mask in zip(idxs, masks):
+                keep_masks[i] = mask
+        return keep_masks
+
+    def grow_modules(self, modules, num_adds):
         """Add randomly"""
-        with torch.no_grad():
-            nonactive_synapses = module.m.weight == 0
-            add_mask = self._get_random_add_mask(nonactive_synapses, num_add)
-            add_mask = add_mask.to(self.device)
-
-        return add_mask
+        nonactives = [module.m.weight == 0 for module in modules]
+        return random_add_masks(nonactives, num_adds)
 
 
 class DSNNMixedHebInverse(DSNNMixedHeb):
     """Test the extreme alternative hypothesis"""
 
-    def prune(self, module):
-        """Allows pruning by magnitude and hebbian"""
-        with torch.no_grad():
-            # unpack module
-            weight = module.m.weight.clone().detach()
-            hebbian_prune_perc = module.hebbian_prune
-            weight_prune_perc = module.weight_prune
-            # init shared variables
-            active_synapses = weight != 0
-
-            # hebbian mask
-            if hebbian_prune_perc is not None:
-                corr = module.get_coactivations()
-                hebbian_mask = self._get_inverse_hebbian_mask(
-                    weight, corr, active_synapses, hebbian_prune_perc
-                )
-            else:
-                hebbian_mask = None
-
-            # weight mask
-            if weight_prune_perc is not None:
-                magnitude_mask = self._get_magnitude_mask(
-                    weight, active_synapses, weight_prune_perc
-                )
-            else:
-                magnitude_mask = None
-
-            # join both masks
-            if hebbian_prune_perc and weight_prune_perc:
-                keep_mask = hebbian_mask | magnitude_mask
-            elif hebbian_prune_perc:
-                keep_mask = hebbian_mask
-            elif weight_prune_perc:
-                keep_mask = magnitude_mask
-            # if no pruning, just perpetuate same synapses
-            else:
-                keep_mask = active_synapses.to(self.device)
-
-        return keep_mask
-
-    def grow(self, module, num_add):
-        """Add randomly"""
-        with torch.no_grad():
-            nonactive_synapses = module.m.weight == 0
-            if self.hebbian_grow:
-                corr = module.get_coactivations()
-                add_mask = self._get_inverse_hebbian_add_mask(
-                    corr, nonactive_synapses, num_add
-                )
-            else:
-                add_mask = self._get_random_add_mask(nonactive_synapses, num_add)
-            add_mask = add_mask.to(self.device)
-
-        return add_mask
+    inverse_hebbian = True
@@ -109,24 +109,23 @@ class SparseLogger(BaseLogger):
 
     def _log_magnitude_and_coactivations(self, train):
 
+        x, y, hue = "coactivations", "weight", "log_abs_grads"
         for i, module in enumerate(self.model.sparse_modules):
 
             m = module.m
-            coacts = m.coactivations.clone().detach().to("cpu").numpy()
-            weight = m.weight.clone().detach().to("cpu").numpy()
-            grads = m.weight.grad.clone().detach().to("cpu").numpy()
+            with torch.no_grad():
+                mask = m.weight.grad != 0
+                if not mask.any():
+                    continue
+                coacts = m.coactivations[mask]
+                weight = m.weight[mask]
+                grads = m.weight.grad[mask].abs().log()
 
-            mask = ((m.weight.grad != 0)).to("cpu").numpy()
-
-            coacts = coacts[mask]
-            weight = weight[mask]
-            grads = grads[mask]
-            grads = np.log(np.abs(grads))
-
-            x, y, hue = "coactivations", "weight", "log_abs_grads"
+                # copy only the selected synapses to build the scatter plot
+                columns = torch.stack((coacts, weight, grads), dim=1).cpu().numpy()
 
             dataframe = DataFrame(
-                {x: coacts.flatten(), y: weight.flatten(), hue: grads.flatten()}
+                {x: columns[:, 0], y: columns[:, 1], hue: columns[:, 2]}
             )
             seaborn_config = dict(rc={"figure.figsize": (11.7, 8.27)}, style="white")
 
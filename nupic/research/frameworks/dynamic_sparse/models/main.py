@@ -32,6 +32,7 @@ import torch.optim as optim
 import torch.optim.lr_scheduler as schedulers
 
 from nupic.research.frameworks.dynamic_sparse.networks import NumScheduler
+from nupic.research.frameworks.pytorch.model_utils import ClassificationMetrics
 from nupic.torch.modules import update_boost_strength
 
 from .loggers import BaseLogger, SparseLogger
@@ -159,8 +160,7 @@ class BaseModel:
         pass
 
     def _run_one_pass(self, loader, train=True, noise=False):
-        epoch_loss = 0
-        correct = 0
+        metrics = ClassificationMetrics(self.device)
         for idx, (inputs, targets) in enumerate(loader):
             self.logger.log_pre_batch()
             # Limit number of batches per epoch if desired.
@@ -175,21 +175,20 @@ class BaseModel:
             with torch.set_grad_enabled(train):
                 # forward + backward + optimize
                 outputs = self.network(inputs)
-                _, preds = torch.max(outputs, 1)
-                correct += torch.sum(targets == preds).item()
                 loss = self.loss_func(outputs, targets)
                 if train:
                     loss.backward()
                     self.optimizer.step()
                     self._post_optimize_updates()
 
-            # keep track of loss
-            epoch_loss += loss.item() * inputs.size(0)
+            # keep track of loss and accuracy, without syncing the device
+            metrics.update(outputs, targets, loss.detach() * inputs.size(0))
             self.logger.log_post_batch()
 
         # store loss and acc at each pass
-        loss = epoch_loss / len(loader.dataset)
-        acc = correct / len(loader.dataset)
+        results = metrics.results()
+        loss = results["total_loss"] / len(loader.dataset)
+        acc = results["total_correct"] / len(loader.dataset)
         self.logger.log_metrics(loss, acc, train, noise)
 
     def has_params(self, module):
@@ -0,0 +1,173 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Keep (prune) and add (grow) masks for dynamic sparse networks.
+
+Every function takes lists with one tensor per sparse module and returns the
+masks of all the modules. The thresholds are computed on the device of every
+module, one module at a time and without copying the counts to the host, so
+the memory is bounded by the largest module rather than by all of them.
+
+The pruning criteria keep the semantics of the original per module masks: the
+k-th smallest score is the threshold, and every score tied with a pruned
+threshold is pruned as well (e.g. the synapses with zero coactivations). Only
+:func:`random_add_masks` adds an exact number of synapses.
+"""
+
+import math
+
+import torch
+
+__all__ = [
+    "magnitude_keep_masks",
+    "hebbian_keep_masks",
+    "random_add_masks",
+    "hebbian_add_masks",
+]
+
+
+def _percent_of(count, perc):
+    """int(perc * count), computed on the device"""
+    return (count.double() * perc).floor().long()
+
+
+def _kth_smallest(scores, candidates, k):
+    """
+    k-th smallest score among the candidates, for a 0-dim LongTensor k. The
+    result is undefined (but valid) when k is not in [1, candidates.sum()]
+    """
+    sorted_scores = scores.masked_fill(~candidates, math.inf).reshape(-1).sort()[0]
+    index = (k - 1).clamp(min=0, max=sorted_scores.numel() - 1)
+    return sorted_scores.gather(0, index.view(1)).squeeze(0)
+
+
+def _magnitude_keep_mask(weight, active, prune_perc):
+    # Prune the prune_perc smallest positive weights. Zeros are only kept if
+    # no positive weight is pruned
+    positive = weight > 0
+    num_pos = positive.sum()
+    pos_kth = _percent_of(num_pos, prune_perc)
+    pos_threshold = _kth_smallest(weight, positive, pos_kth)
+    keep_pos = torch.where(pos_kth > 0, weight > pos_threshold,
+                           (weight >= 0) & (num_pos > 0))
+
+    # Keep the 1 - prune_perc most negative weights
+    negative = weight < 0
+    neg_kth = _percent_of(negative.sum(), 1 - prune_perc)
+    neg_threshold = _kth_smallest(weight, negative, neg_kth)
+    keep_neg = negative & (weight <= neg_threshold) & (neg_kth > 0)
+
+    return (keep_pos | keep_neg) & active
+
+
+def magnitude_keep_masks(weights, actives, prune_percs):
+    """
+    Prune the ``prune_perc`` smallest positive weights and the ``prune_perc``
+    negative weights closest to zero of every module.
+
+    :param weights: list of weight tensors
+    :param actives: list of boolean masks of the active synapses
+    :param prune_percs: list with the percentage to prune in every module
+    :return: list of boolean keep masks
+    """
+    return [_magnitude_keep_mask(weight, active, perc)
+            for weight, active, perc in zip(weights, actives, prune_percs)]
+
+
+def _hebbian_keep_mask(corr, active, prune_perc, inverse):
+    num_active = active.sum()
+    if inverse:
+        kth = _percent_of(num_active, 1 - prune_perc)
+        threshold = _kth_smallest(corr, active, kth)
+        return (corr <= threshold) & active & (kth > 0)
+
+    kth = _percent_of(num_active, prune_perc)
+    threshold = _kth_smallest(corr, active, kth)
+    return torch.where(kth > 0, (corr > threshold) & active, active)
+
+
+def hebbian_keep_masks(corrs, actives, prune_percs, inverse=False):
+    """
+    Prune the ``prune_perc`` active synapses with the lowest correlations of
+    every module. If inverse, keep the ``1 - prune_perc`` active synapses with
+    the lowest correlations instead.
+
+    :param corrs: list of coactivation tensors
+    :param actives: list of boolean masks of the active synapses
+    :param prune_percs: list with the percentage to prune in every module
+    :param inverse: Whether or not to keep the lowest correlations
+    :return: list of boolean keep masks
+    """
+    return [_hebbian_keep_mask(corr, active, perc, inverse)
+            for corr, active, perc in zip(corrs, actives, prune_percs)]
+
+
+def _random_add_mask(nonactive, num_add, generator=None):
+    # Non active synapses in random order, followed by the active ones
+    scores = torch.rand(nonactive.shape, device=nonactive.device,
+                        generator=generator)
+    scores = scores.masked_fill(~nonactive, -1).reshape(-1)
+    order = scores.argsort(descending=True)
+    num_add = torch.min(num_add, nonactive.sum())
+    selected = torch.arange(scores.numel(), device=scores.device) < num_add
+    mask = torch.zeros_like(scores, dtype=torch.bool).scatter_(0, order, selected)
+    return mask.view_as(nonactive)
+
+
+def random_add_masks(nonactives, num_adds, generator=None):
+    """
+    Add exactly ``num_add`` random synapses among the non active synapses of
+    every module (or all of them if there are fewer).
+
+    :param nonactives: list of boolean masks of the non active synapses
+    :param num_adds: LongTensor with the number of synapses to add per module
+    :param generator: Optional random number generator
+    :return: list of boolean add masks
+    """
+    return [_random_add_mask(nonactive, num_add, generator)
+            for nonactive, num_add in zip(nonactives, num_adds)]
+
+
+def _hebbian_add_mask(corr, nonactive, num_add, inverse):
+    if inverse:
+        threshold = _kth_smallest(corr, nonactive, num_add)
+        return (corr <= threshold) & nonactive & (num_add > 0)
+
+    kth = nonactive.sum() - num_add
+    threshold = _kth_smallest(corr, nonactive, kth)
+    return torch.where(kth > 0, (corr > threshold) & nonactive, nonactive)
+
+
+def hebbian_add_masks(corrs, nonactives, num_adds, inverse=False):
+    """
+    Add the ``num_add`` non active synapses with the highest correlations of
+    every module, or the lowest correlations if inverse.
+
+    :param corrs: list of coactivation tensors
+    :param nonactives: list of boolean masks of the non active synapses
+    :param num_adds: LongTensor with the number of synapses to add per module
+    :param inverse: Whether or not to add the lowest correlations
+    :return: list of boolean add masks
+    """
+    return [_hebbian_add_mask(corr, nonactive, num_add, inverse)
+            for corr, nonactive, num_add in zip(corrs, nonactives, num_adds)]
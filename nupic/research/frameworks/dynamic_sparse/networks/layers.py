@@ -23,6 +23,7 @@ import itertools
 
 import numpy as np
 import torch
+import torch.nn.functional as F
 
 __all__ = [
     "DynamicSparseBase",
@@ -185,14 +186,12 @@ class DynamicSparseBase(torch.nn.Module):
 
         new_coacts = self.calc_coactivations(input_tensor, output_tensor)
         if self.update_func:
-            updated_coacts = self.update_func(self.coactivations, new_coacts)
+            self.coactivations[:] = self.update_func(self.coactivations, new_coacts)
         elif self.moving_average_alpha:
             alpha = self.moving_average_alpha
-            updated_coacts = (1 - alpha) * self.coactivations + alpha * new_coacts
+            self.coactivations.mul_(1 - alpha).add_(new_coacts, alpha=alpha)
         else:
-            updated_coacts = self.coactivations + new_coacts
-
-        self.coactivations[:] = updated_coacts
+            self.coactivations.add_(new_coacts)
 
     @staticmethod
     def forward_hook(module, input_tensor, output_tensor):
@@ -237,27 +236,56 @@ class DSLinear(torch.nn.Linear, DynamicSparseBase):
         self.__dict__.update(new_defaults)
         self.update_interval = self.lin_update_interval
 
-    def calc_coactivations(self, x, y):
-        outer = 0
-        n_samples = x.shape[0]
+    def _get_activations(self, x, y):
+        """
+        Returns the (samples x in_features) and (samples x out_features) activity
+        matrices used to compute coactivations. Any leading dimensions of the
+        input and output are flattened into the sample dimension.
+        """
         with torch.no_grad():
-
-            # Get active units.
+            prev_act = x.detach().reshape(-1, self.in_features)
+            curr_act = y.detach().reshape(-1, self.out_features)
             if self.use_binary_coactivations:
-                prev_act = (x > 0).detach().float()
-                curr_act = (y > 0).detach().float()
+                prev_act = (prev_act > 0).float()
+                curr_act = (curr_act > 0).float()
             else:
-                prev_act = x.clone().detach().float()
-                curr_act = y.clone().detach().float()
+                prev_act = prev_act.float()
+                curr_act = curr_act.float()
 
-            # Cumulate outer product over all samples.
-            # TODO: Vectorize this sum; for instance, using torch.einsum().
-            for s in range(n_samples):
-                outer += torch.ger(curr_act[s], prev_act[s])
+        return prev_act, curr_act
+
+    def calc_coactivations(self, x, y):
+        """
+        Returns the sum over samples of the outer products between output and
+        input activity, computed as a single matrix product.
+        """
+        prev_act, curr_act = self._get_activations(x, y)
+        with torch.no_grad():
+            outer = curr_act.t().mm(prev_act)
 
         # Return coactivations.
         return outer
 
+    def _update_coactivations(self, input_tensor, output_tensor):
+        """
+        Accumulates the batch coactivations directly into `self.coactivations`
+        with one `addmm_`, avoiding an intermediate out_features x in_features
+        tensor. Custom `update_func`s go through the generic path.
+        """
+        if self.update_func:
+            return super()._update_coactivations(input_tensor, output_tensor)
+
+        if self.moving_average_alpha:
+            alpha = self.moving_average_alpha
+            beta = 1 - alpha
+        else:
+            alpha = 1
+            beta = 1
+
+        prev_act, curr_act = self._get_activations(input_tensor, output_tensor)
+        with torch.no_grad():
+            self.coactivations.addmm_(curr_act.t(), prev_act, beta=beta, alpha=alpha)
+
 
 # ------------------
 # Conv Layers
@@ -351,6 +379,18 @@ class DSConv2d(torch.nn.Conv2d, DynamicSparseBase):
         config = config or {}
         self._init_coactivations(weight=self.weight, config=config)
 
+        # The helper convolution used by the "grouped_conv" backend is large;
+        # only build it when that backend is requested.
+        self.grouped_conv = None
+        if self.coactivation_backend == "grouped_conv":
+            self._init_grouped_conv()
+
+    def _init_grouped_conv(self):
+        """
+        Builds the helper convolution and indices used by the "grouped_conv"
+        coactivation backend.
+        """
+
         # -------------------------------------
         # 'calc_coactivation' related attr's
         # -------------------------------------
@@ -400,7 +440,7 @@ class DSConv2d(torch.nn.Conv2d, DynamicSparseBase):
         ]
         stacked_weights = torch.cat(single_unit_weights, dim=0)
         self.grouped_conv.weight = torch.nn.Parameter(
-            stacked_weights, requires_grad=False
+            stacked_weights.to(self.weight.device), requires_grad=False
         )
 
     def _init_coactivations(self, weight, config=None):
@@ -414,6 +454,8 @@ class DSConv2d(torch.nn.Conv2d, DynamicSparseBase):
             half_precision=False,
             coactivation_test="correlation_proxy",
             threshold_multiplier=1,
+            coactivation_backend="unfold",  # See `calc_coactivations`
+            coactivation_memory_budget=2 ** 28,  # bytes; see `_calc_unfold`
         )
         new_defaults = {k: (config.get(k, None) or v) for k, v in defaults.items()}
         self.__dict__.update(new_defaults)
@@ -440,8 +482,19 @@ class DSConv2d(torch.nn.Conv2d, DynamicSparseBase):
         Override torch.nn.Module's `_apply` method to ensure `fn`
         if applied to the `grouped_conv`.
         """
-        self.grouped_conv._apply(fn)
-        super()._apply(fn)
+        if self.grouped_conv is not None:
+            self.grouped_conv._apply(fn)
+        return super()._apply(fn)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        """
+        Drop the weights of the `grouped_conv` helper from legacy checkpoints.
+        They are constant and rebuilt when the "grouped_conv" backend is used.
+        """
+        for key in list(state_dict.keys()):
+            if key.startswith(prefix + "grouped_conv."):
+                del state_dict[key]
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
 
     def get_activity_threshold(self, input_tensor, output_tensor):
         """
@@ -451,13 +504,132 @@ class DSConv2d(torch.nn.Conv2d, DynamicSparseBase):
 
     def calc_coactivations(self, input_tensor, output_tensor):
         """
-        This function updates self.coactivations.
-        The computation is highly vectorized and unfortunately quite opaque.
-        Generally, two units, say unit_in and unit_out, coactivate if
+        This function computes the coactivations of a batch. Generally, two units,
+        say unit_in and unit_out, coactivate if
             1. unit_in is in the receptive field of unit_out
             2. (unit_in  - mean_input ) > input_activity_threshold
             3. (unit_out - mean_output) > output_activity_threshold
+
+        Two backends are available through the `coactivation_backend` config:
+            - "unfold": extracts the receptive fields with `F.unfold` and
+              reduces them against the output with matrix products.
+            - "grouped_conv": the original implementation, which replicates the
+              input through a helper grouped convolution. Its memory grows as
+              batch x in_channels x kernel_size x out_channels x H x W.
+        The "unfold" backend falls back to "grouped_conv" for grouped
+        convolutions and non-zero padding modes.
+        """
+        if (
+            self.coactivation_backend == "unfold"
+            and self.groups == 1
+            and self.padding_mode == "zeros"
+        ):
+            return self._calc_unfold(input_tensor, output_tensor)
+
+        return self._calc_grouped_conv(input_tensor, output_tensor)
+
+    def _calc_unfold(self, input_tensor, output_tensor):
+        """
+        Computes the coactivations from the unfolded input. Its memory use is
+        batch x in_channels x kernel_size x H x W for the unfolded input, and the
+        per-location intermediates of the "correlation" test are computed in
+        chunks of output channels sized to fit `coactivation_memory_budget`.
         """
+        with torch.no_grad():
+
+            # Switch to half-floating precision if needed.
+            if self.half_precision:
+                input_tensor = input_tensor.half()
+
+            # Receptive field of every output location, with shape
+            # (batch, in_channels * kernel_size[0] * kernel_size[1], H_out * W_out).
+            # The connections are ordered as in `self.weight.shape[1:]`.
+            patches = F.unfold(
+                input_tensor,
+                self.kernel_size,
+                dilation=self.dilation,
+                padding=self.padding,
+                stride=self.stride,
+            )
+            batch_size, num_connections, num_locations = patches.shape
+            output_flat = output_tensor.reshape(
+                batch_size, self.out_channels, num_locations
+            )
+            dtype = self.coactivations.dtype
+
+            if self.coactivation_test in ("variance", "correlation_proxy"):
+
+                if self.coactivation_test == "variance":
+                    a1, a2 = self.get_activity_threshold(input_tensor, output_tensor)
+                    a1 = a1 * self.threshold_multiplier
+                    a2 = a2 * self.threshold_multiplier
+                    s1 = torch.abs(patches - input_tensor.mean()).gt_(a1)
+                    s2 = torch.abs(output_flat - output_tensor.mean()).gt_(a2)
+                else:
+                    s1 = patches != 0
+                    s2 = output_flat != 0
+
+                del patches
+
+                # Count coincident activity over batch and locations with
+                # a single (out_channels x N) @ (N x connections) product.
+                s1 = s1.to(dtype).transpose(1, 2).reshape(-1, num_connections)
+                s2 = s2.to(dtype).transpose(0, 1).reshape(self.out_channels, -1)
+                h = s2.mm(s1)
+
+                del s1
+                del s2
+
+            elif self.coactivation_test == "correlation":
+
+                s1 = patches.to(output_flat.dtype)
+                s2 = output_flat
+
+                del patches
+
+                std_in = s1.std(dim=0)
+                std_out = s2.std(dim=0)
+                s1 = s1 - s1.mean(dim=0)
+                s2 = s2 - s2.mean(dim=0)
+
+                # Each output channel needs a (connections x locations)
+                # correlation map, plus a temporary of the same size.
+                bytes_per_channel = (
+                    2 * num_connections * num_locations * s1.element_size()
+                )
+                chunk_size = max(
+                    1, int(self.coactivation_memory_budget // bytes_per_channel)
+                )
+
+                h = torch.empty(
+                    self.out_channels, num_connections, dtype=dtype, device=s1.device
+                )
+                for start in range(0, self.out_channels, chunk_size):
+                    end = min(start + chunk_size, self.out_channels)
+                    corr = torch.einsum("bcl,bol->ocl", s1, s2[:, start:end])
+                    corr.div_(batch_size)
+                    std = std_in * std_out[start:end].unsqueeze(1)
+                    corr.div_(std).masked_fill_(std == 0, 0)
+                    h[start:end] = corr.abs_().sum(dim=2)
+
+                    del corr
+                    del std
+
+                del s1
+                del s2
+                del std_in
+                del std_out
+
+            return h.view_as(self.coactivations)
+
+    def _calc_grouped_conv(self, input_tensor, output_tensor):
+        """
+        The original implementation of `calc_coactivations`.
+        The computation is highly vectorized and unfortunately quite opaque.
+        """
+        if self.grouped_conv is None:
+            self._init_grouped_conv()
+
         with torch.no_grad():
 
             # Switch to half-floating precision if needed.
@@ -370,3 +370,185 @@ class Unsqueeze(object):
         if self.model_type in ["resnet9", "cnn"]:
             data = torch.unsqueeze(data, 0)
         return data
+
+
+class BatchChangeAmplitude(object):
+    """Batch version of :class:`ChangeAmplitude` applied to a ``[batch, samples]``
+    tensor. Each sample gets its own random amplitude."""
+
+    def __init__(self, amplitude_range=(0.7, 1.1), prob=0.5):
+        self.amplitude_range = amplitude_range
+        self.prob = prob
+
+    def __call__(self, samples):
+        batch_size = samples.shape[0]
+        low, high = self.amplitude_range
+        scale = torch.empty(batch_size, device=samples.device).uniform_(low, high)
+        apply = _apply_mask(batch_size, self.prob, samples.device)
+        scale = torch.where(apply, scale, torch.ones_like(scale))
+        return samples * scale.unsqueeze(1)
+
+
+class BatchAddNoise(object):
+    """Batch version of :class:`AddNoise` applied to a ``[batch, samples]``
+    tensor."""
+
+    def __init__(self, alpha=0.0, max_val=1.0):
+        self.alpha = alpha
+        self.max_val = max_val
+
+    def __call__(self, samples):
+        noise = torch.empty_like(samples).uniform_(-self.max_val, self.max_val)
+        return samples * (1 - self.alpha) + noise * self.alpha
+
+
+class BatchChangeSpeedAndPitch(object):
+    """Batch version of :class:`ChangeSpeedAndPitchAudio` followed by
+    :class:`FixAudioLength`, applied to a ``[batch, samples]`` tensor. Each
+    sample gets its own random speed, the interpolation is vectorized over the
+    whole batch and the result keeps the input length, zero padded."""
+
+    def __init__(self, max_scale=0.2, prob=0.5):
+        self.max_scale = max_scale
+        self.prob = prob
+
+    def __call__(self, samples):
+        batch_size, length = samples.shape
+        device = samples.device
+        scale = torch.empty(batch_size, device=device).uniform_(
+            -self.max_scale, self.max_scale)
+        speed_fac = 1.0 / (1 + scale)
+        apply = _apply_mask(batch_size, self.prob, device)
+        speed_fac = torch.where(apply, speed_fac, torch.ones_like(speed_fac))
+
+        # Same positions as "np.arange(0, length, speed_fac)". Use double
+        # precision, single precision is not enough for 1 second at 16KHz
+        steps = torch.arange(length, dtype=torch.float64, device=device)
+        positions = steps.unsqueeze(0) * speed_fac.double().unsqueeze(1)
+        left = positions.floor().clamp(max=length - 1)
+        frac = (positions - left).to(samples.dtype)
+        left = left.long()
+        right = (left + 1).clamp(max=length - 1)
+        resampled = (samples.gather(1, left) * (1 - frac)
+                     + samples.gather(1, right) * frac)
+        # Slower samples are shorter, FixAudioLength pads them with zeros
+        return resampled * (positions < length).to(samples.dtype)
+
+
+class BatchTimeshift(object):
+    """Batch version of :class:`TimeshiftAudio` applied to a ``[batch, samples]``
+    tensor. Each sample gets its own random shift, the shifted out part is
+    replaced by zeros."""
+
+    def __init__(self, max_shift_seconds=0.2, sample_rate=16000, prob=0.5):
+        self.max_shift = int(sample_rate * max_shift_seconds)
+        self.prob = prob
+
+    def __call__(self, samples):
+        batch_size, length = samples.shape
+        device = samples.device
+        shift = torch.randint(-self.max_shift, self.max_shift + 1, (batch_size,),
+                              device=device)
+        apply = _apply_mask(batch_size, self.prob, device)
+        shift = torch.where(apply, shift, torch.zeros_like(shift))
+
+        index = torch.arange(length, device=device).unsqueeze(0) + shift.unsqueeze(1)
+        valid = (index >= 0) & (index < length)
+        shifted = samples.gather(1, index.clamp(0, length - 1))
+        return shifted * valid.to(samples.dtype)
+
+
+class BatchAddBackgroundNoise(object):
+    """Batch version of :class:`AddBackgroundNoise` applied to a
+    ``[batch, samples]`` tensor. Each sample gets its own random background
+    noise and percentage.
+
+    :param bg_dataset: Background noise dataset. Every item must be a dict with
+                       "samples" of the same length as the batch samples,
+                       see :class:`FixAudioLength`
+    """
+
+    def __init__(self, bg_dataset, max_percentage=0.45, prob=0.5):
+        self.noise = torch.stack([
+            torch.as_tensor(bg_dataset[i]["samples"], dtype=torch.float32)
+            for i in range(len(bg_dataset))
+        ])
+        self.max_percentage = max_percentage
+        self.prob = prob
+
+    def __call__(self, samples):
+        batch_size = samples.shape[0]
+        device = samples.device
+        if self.noise.device != device:
+            self.noise = self.noise.to(device)
+        choice = torch.randint(len(self.noise), (batch_size,), device=device)
+        percentage = torch.empty(batch_size, device=device).uniform_(
+            0, self.max_percentage)
+        apply = _apply_mask(batch_size, self.prob, device)
+        percentage = torch.where(apply, percentage, torch.zeros_like(percentage))
+        percentage = percentage.unsqueeze(1)
+        return samples * (1 - percentage) + self.noise[choice] * percentage
+
+
+class BatchMelSpectrogram(object):
+    """Batch version of :class:`ToMelSpectrogram` and :class:`ToTensor`.
+    Creates the log mel spectrogram of every sample of a ``[batch, samples]``
+    tensor using :func:`torch.stft`, returning a ``[batch, n_mels, frames]``
+    tensor, or ``[batch, 1, n_mels, frames]`` when "unsqueeze" is True.
+
+    Like :func:`librosa.power_to_db` with ``ref=np.max``, the decibels are
+    relative to the max power of each sample.
+    """
+
+    def __init__(self, sample_rate=16000, n_mels=32, n_fft=2048, hop_length=512,
+                 top_db=80.0, normalize=None, unsqueeze=False):
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.top_db = top_db
+        self.normalize = normalize
+        self.unsqueeze = unsqueeze
+        self.mel_basis = torch.from_numpy(librosa.filters.mel(
+            sr=sample_rate, n_fft=n_fft, n_mels=n_mels)).float()
+        self.window = torch.hann_window(n_fft)
+
+    def __call__(self, samples):
+        device = samples.device
+        if self.mel_basis.device != device:
+            self.mel_basis = self.mel_basis.to(device)
+            self.window = self.window.to(device)
+
+        power = _power_spectrum(samples, self.n_fft, self.hop_length, self.window)
+        mel = torch.matmul(self.mel_basis, power)
+
+        # librosa.power_to_db(mel, ref=np.max)
+        amin = 1e-10
+        log_spec = 10.0 * torch.log10(mel.clamp(min=amin))
+        ref = mel.flatten(1).max(dim=1)[0].clamp(min=amin)
+        log_spec -= 10.0 * torch.log10(ref).view(-1, 1, 1)
+        if self.top_db is not None:
+            floor = log_spec.flatten(1).max(dim=1)[0] - self.top_db
+            log_spec = torch.max(log_spec, floor.view(-1, 1, 1))
+
+        if self.normalize is not None:
+            mean, std = self.normalize
+            log_spec = (log_spec - mean) / std
+        if self.unsqueeze:
+            log_spec = log_spec.unsqueeze(1)
+        return log_spec
+
+
+def _power_spectrum(samples, n_fft, hop_length, window):
+    """Batched equivalent of ``np.abs(librosa.stft(samples)) ** 2``"""
+    kwargs = dict(n_fft=n_fft, hop_length=hop_length, window=window, center=True,
+                  pad_mode="reflect")
+    try:
+        stft = torch.stft(samples, return_complex=True, **kwargs)
+        return stft.abs().pow(2)
+    except TypeError:
+        # Older pytorch versions return the real and imaginary parts
+        return torch.stft(samples, **kwargs).pow(2).sum(dim=-1)
+
+
+def _apply_mask(batch_size, prob, device):
+    """Per sample version of :func:`should_apply_transform`"""
+    return torch.rand(batch_size, device=device) < prob
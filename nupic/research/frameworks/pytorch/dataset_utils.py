@@ -19,10 +19,14 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 import collections
+import hashlib
 import itertools
 import os
 import pickle
 import posixpath
+import tempfile
+import threading
+import time
 from bisect import bisect
 from functools import partial
 from io import BytesIO
@@ -32,15 +36,35 @@ import h5py
 import numpy as np
 import torch
 from PIL import Image
-from torch.utils.data import Dataset, Subset
-from torchvision.datasets import DatasetFolder, VisionDataset
+from torch.utils.data import (
+    BatchSampler,
+    DataLoader,
+    Dataset,
+    RandomSampler,
+    SequentialSampler,
+    Subset,
+    TensorDataset,
+)
+from torchvision.datasets import CIFAR10, DatasetFolder, VisionDataset
 from torchvision.datasets.folder import (
     IMG_EXTENSIONS,
     default_loader,
     is_image_file,
     make_dataset,
 )
-from torchvision.transforms import RandomResizedCrop
+from torchvision.transforms import Compose, Normalize, RandomResizedCrop, ToTensor
+
+PACKED_INDEX_FILE = "__packed_index__.npy"
+PACKED_CLASSES_FILE = "__packed_classes__.npy"
+PACKED_SHARD_FILE = "shard_{:05d}.bin"
+
+# Fixed width index entry for each image in a packed dataset
+PACKED_INDEX_DTYPE = np.dtype([
+    ("shard", np.uint32),
+    ("size", np.uint32),
+    ("offset", np.uint64),
+    ("target", np.int64),
+])
 
 
 def create_validation_data_sampler(dataset, ratio):
@@ -104,6 +128,56 @@ def select_subset(classes, class_to_idx, samples, num_classes):
     return subset_classes, subset_class_to_idx, subset_samples
 
 
+def create_batch_loader(dataset, batch_size, shuffle=False, sampler=None,
+                        drop_last=False, **kwargs):
+    """
+    Create a :class:`torch.utils.data.DataLoader` that requests whole batches
+    from datasets accepting a list of indices in `__getitem__`, such as
+    :class:`torch.utils.data.TensorDataset`. The batches are sliced from the
+    dataset at once instead of indexing and collating each item separately.
+
+    :param dataset: Dataset accepting a list of indices in `__getitem__`
+    :param batch_size: Number of items in each batch
+    :param shuffle: Whether to shuffle the dataset. Ignored if `sampler` is given
+    :param sampler: Optional sampler used to draw the items indices, for example
+                    :class:`torch.utils.data.WeightedRandomSampler`
+    :param drop_last: Whether to drop the last incomplete batch
+    :param kwargs: Other arguments passed to the DataLoader, i.e. `num_workers`
+    :return: torch.utils.data.DataLoader
+    """
+    if sampler is None:
+        sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+    return DataLoader(
+        dataset,
+        batch_size=None,
+        sampler=BatchSampler(sampler, batch_size=batch_size, drop_last=drop_last),
+        **kwargs
+    )
+
+
+def create_cifar10_test_loader(batch_size, data_dir, **kwargs):
+    """
+    Create a loader over the clean CIFAR-10 test set. The images are decoded and
+    normalized once and kept in memory, the noise is added on the fly by
+    :func:`nupic.research.frameworks.pytorch.model_utils.evaluate_noise`.
+
+    :param batch_size: Number of items in each batch
+    :param data_dir: CIFAR-10 dataset root directory
+    :param kwargs: Other arguments passed to the DataLoader, i.e. `pin_memory`
+    :return: torch.utils.data.DataLoader
+    """
+    transform_test = Compose(
+        [
+            ToTensor(),
+            Normalize((0.4914, 0.4822, 0.4465), (0.2023, 0.1994, 0.2010)),
+        ]
+    )
+    testset = CIFAR10(root=data_dir, train=False, transform=transform_test)
+    images, targets = next(iter(DataLoader(testset, batch_size=len(testset))))
+    return DataLoader(TensorDataset(images, targets), batch_size=batch_size,
+                      shuffle=False, **kwargs)
+
+
 class UnionDataset(Dataset):
     """Dataset used to create unions of two or more datasets. The union is
     created by applying the given transformation to the items in the dataset.
@@ -225,6 +299,304 @@ class PreprocessedDataset(Dataset):
         return file_name
 
 
+def npz_to_npy(npz_file, cache_dir=None):
+    """
+    Convert each array of a compressed numpy file (.npz) into an uncompressed
+    numpy file (.npy), suitable for memory mapping. The ".npy" files are named
+    "{npz_file without extension}_{key}_{array name}.npy", where the key is
+    derived from the path, size and modification time of the ".npz" file (see
+    :meth:`FeatureCache.file_key`), and are only created once. Regenerating the
+    ".npz" file produces new ".npy" files instead of reusing stale ones.
+
+    :param npz_file: Path to the ".npz" file
+    :param cache_dir: Directory where the ".npy" files are written. Defaults to
+                      the directory of the ".npz" file
+    :return: List with the ".npy" file names in the same order as the ".npz" arrays
+    """
+    base, _ = os.path.splitext(npz_file)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.join(cache_dir, os.path.basename(base))
+    key = FeatureCache.file_key(npz_file)[:16]
+    with np.load(npz_file) as data:
+        npy_files = []
+        for name in data.files:
+            npy_file = "{}_{}_{}.npy".format(base, key, name)
+            if not os.path.exists(npy_file):
+                # Save to a temporary file first to allow concurrent conversions
+                fd, tmp_file = tempfile.mkstemp(suffix=".npy",
+                                                dir=os.path.dirname(npy_file))
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, data[name])
+                os.chmod(tmp_file, 0o644)
+                os.replace(tmp_file, npy_file)
+            npy_files.append(npy_file)
+    return npy_files
+
+
+def _read_files(file_names, chunk_size=2 ** 24):
+    buffer = bytearray(chunk_size)
+    for file_name in file_names:
+        with open(file_name, "rb", buffering=0) as f:
+            while f.readinto(buffer):
+                pass
+
+
+def prefetch_npz(npz_file, cache_dir=None):
+    """
+    Convert the given ".npz" file with :func:`npz_to_npy` and read the ".npy"
+    files in a background thread, bringing them into the OS page cache before
+    they are memory mapped by :class:`MemoryMappedDataset`.
+
+    :param npz_file: Path to the ".npz" file
+    :param cache_dir: Directory of the ".npy" files, see :func:`npz_to_npy`
+    :return: The background thread
+    """
+    thread = threading.Thread(
+        target=lambda: _read_files(npz_to_npy(npz_file, cache_dir)), daemon=True)
+    thread.start()
+    return thread
+
+
+class MemoryMappedDataset(Dataset):
+    """
+    Dataset backed by uncompressed numpy files (.npy) memory mapped in read only
+    mode. Items are sliced from the mapped arrays on demand, avoiding loading
+    and converting the whole dataset to tensors upfront.
+
+    The index may also be a list of indices, returning a whole batch at once.
+    See :func:`create_batch_loader`.
+
+    :param npy_files: List of ".npy" files, one per tensor in the dataset items.
+                      All arrays must have the same first dimension.
+    """
+
+    def __init__(self, npy_files):
+        self.npy_files = list(npy_files)
+
+        # Use plain ndarray views, indexing np.memmap objects is much slower
+        self.arrays = [np.load(f, mmap_mode="r").view(np.ndarray)
+                       for f in self.npy_files]
+        assert all(len(a) == len(self.arrays[0]) for a in self.arrays)
+
+    def __getitem__(self, index):
+        return tuple(torch.tensor(a[index]) for a in self.arrays)
+
+    def __len__(self):
+        return len(self.arrays[0])
+
+    def __getstate__(self):
+        # Map the files again instead of copying the arrays into each worker
+        return {"npy_files": self.npy_files}
+
+    def __setstate__(self, state):
+        self.__init__(state["npy_files"])
+
+
+def describe_transform(transform):
+    """
+    Stable textual description of a transform and its parameters, used to
+    build cache keys. :class:`torchvision.transforms.Compose` is described by
+    its transforms, other transforms by their class name and public attributes.
+    """
+    if transform is None:
+        return "None"
+    transforms = getattr(transform, "transforms", None)
+    if isinstance(transforms, (list, tuple)):
+        return "[{}]".format(",".join(describe_transform(t) for t in transforms))
+    cls = type(transform)
+    params = sorted((k, repr(v)) for k, v in vars(transform).items()
+                    if not k.startswith("_"))
+    return "{}.{}{}".format(cls.__module__, cls.__qualname__, params)
+
+
+def _nbytes(value):
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    if isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    return getattr(value, "nbytes", 64)
+
+
+class FeatureCache(object):
+    """
+    Two level LRU cache for expensive deterministic features, i.e. decoded
+    audio or spectrograms. Entries are kept in memory up to ``max_memory``
+    bytes and, when ``cache_dir`` is given, pickled to disk up to ``max_disk``
+    bytes. The disk cache is shared by all processes using the same directory,
+    including :class:`DataLoader` workers and later runs.
+
+    Keys must be content addressed, see :meth:`make_key`, since the cache
+    never checks whether an entry is stale.
+
+    The cache keeps the number of hits and misses, and the time saved by the
+    hits, measured as the time spent computing the entries. Statistics are per
+    process.
+
+    :param cache_dir: Optional directory used to store the entries on disk
+    :param max_memory: Max size in bytes of the in memory entries
+    :param max_disk: Max size in bytes of the disk entries
+    """
+
+    def __init__(self, cache_dir=None, max_memory=2 ** 30, max_disk=2 ** 34):
+        self.cache_dir = cache_dir
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._memory = collections.OrderedDict()
+        self._memory_size = 0
+        self._disk_size = None
+        self.reset_stats()
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash the given parts into a cache key"""
+        text = "\0".join(str(p) for p in parts)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def file_key(path, *parts):
+        """
+        Cache key for features computed from the given file. Includes the file
+        path, size and modification time, so the entries are invalidated when
+        the file changes.
+        """
+        if path:
+            stat = os.stat(path)
+            return FeatureCache.make_key(os.path.abspath(path), stat.st_mtime_ns,
+                                         stat.st_size, *parts)
+        return FeatureCache.make_key(path, *parts)
+
+    def get_or_compute(self, key, compute):
+        """
+        Get the cached value for the given key, computing and caching it with
+        ``compute()`` on a miss.
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            self.time_saved += entry[1]
+            return entry[0]
+
+        entry = self._load(key)
+        if entry is not None:
+            self.disk_hits += 1
+            self.time_saved += entry[1]
+            self._store_memory(key, entry)
+            return entry[0]
+
+        self.misses += 1
+        start = time.time()
+        value = compute()
+        entry = (value, time.time() - start)
+        self._store_memory(key, entry)
+        self._store_disk(key, entry)
+        return value
+
+    def reset_stats(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+
+    def stats(self):
+        """
+        :return: dictionary with "hits", "memory_hits", "disk_hits", "misses",
+                 "hit_rate" and "time_saved" in seconds
+        """
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total > 0 else 0.0,
+            "time_saved": self.time_saved,
+        }
+
+    def _store_memory(self, key, entry):
+        size = _nbytes(entry[0])
+        if size > self.max_memory:
+            return
+        self._memory[key] = entry
+        self._memory_size += size
+        while self._memory_size > self.max_memory:
+            _, (value, _) = self._memory.popitem(last=False)
+            self._memory_size -= _nbytes(value)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".pkl")
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # Update access time used by the LRU eviction
+        os.utime(path)
+        return entry
+
+    def _store_disk(self, key, entry):
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Save to a temporary file first to allow concurrent writers
+        fd, tmp_file = tempfile.mkstemp(suffix=".pkl", dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+            size = f.tell()
+        os.chmod(tmp_file, 0o644)
+        os.replace(tmp_file, path)
+
+        if self._disk_size is None:
+            self._disk_size = sum(f.stat().st_size
+                                  for f in Path(self.cache_dir).glob("*/*.pkl"))
+        else:
+            self._disk_size += size
+        if self._disk_size > self.max_disk:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Remove the least recently used files until the disk cache is 10%
+        below its max size"""
+        files = []
+        for f in Path(self.cache_dir).glob("*/*.pkl"):
+            try:
+                stat = f.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, f))
+        files.sort()
+        size = sum(s for _, s, _ in files)
+        target = self.max_disk * 0.9
+        for _, file_size, f in files:
+            if size <= target:
+                break
+            try:
+                f.unlink()
+            except OSError:
+                continue
+            size -= file_size
+        self._disk_size = size
+
+    def __getstate__(self):
+        # Do not copy the memory cache into other processes
+        state = self.__dict__.copy()
+        state["_memory"] = collections.OrderedDict()
+        state["_memory_size"] = 0
+        return state
+
+
 class CachedDatasetFolder(DatasetFolder):
     """A cached version of `torchvision.datasets.DatasetFolder` where the
     classes and image list are static and cached skiping the costly `os.walk`
@@ -460,3 +832,202 @@ class HDF5Dataset(VisionDataset):
 
     def get_classes(self):
         return self._classes
+
+
+def is_packed_dataset(root):
+    """
+    Check whether the given directory contains a packed dataset created by
+    :func:`create_packed_dataset`
+    """
+    return os.path.isfile(os.path.join(root, PACKED_INDEX_FILE))
+
+
+def _iter_raw_images(dataset):
+    """
+    Iterate over the encoded image bytes and targets of the given dataset
+    without decoding the images.
+
+    :param dataset: :class:`HDF5Dataset` or any :class:`DatasetFolder` such as
+                    :class:`CachedDatasetFolder`
+    :return: tuple with the list of class names and an iterator of
+             (image_bytes, target) tuples
+    """
+    if isinstance(dataset, HDF5Dataset):
+        class_names = sorted(dataset.get_classes().items(), key=lambda x: x[1])
+        classes = [posixpath.basename(name) for name, _ in class_names]
+
+        def iterator():
+            with h5py.File(name=dataset._hdf5_file, mode="r") as hdf5:
+                for file_name in dataset._images:
+                    target = dataset.get_classes()[posixpath.dirname(file_name)]
+                    yield hdf5[file_name][()].tobytes(), target
+
+    elif isinstance(dataset, DatasetFolder):
+        classes = list(dataset.classes)
+
+        def iterator():
+            for path, target in dataset.samples:
+                yield Path(path).read_bytes(), target
+    else:
+        raise TypeError("Unsupported dataset type: {}".format(type(dataset)))
+
+    return classes, iterator()
+
+
+def create_packed_dataset(dataset, output_dir, shard_size=2 ** 32, progress=None):
+    """
+    Convert an existing :class:`HDF5Dataset` or :class:`CachedDatasetFolder` into
+    a packed dataset readable by :class:`PackedImageDataset`. The encoded images
+    are copied as is into contiguous shard files and a fixed width index with
+    the shard, offset, size and target of every image is saved next to them::
+
+        output_dir/__packed_index__.npy
+        output_dir/__packed_classes__.npy
+        output_dir/shard_00000.bin
+        output_dir/shard_00001.bin
+        ...
+
+    :param dataset: Source dataset. Only the image bytes and targets are used,
+                    transforms are ignored.
+    :param output_dir: Directory where to save the packed dataset
+    :param shard_size: Approximate maximum size in bytes of each shard file
+    :param progress: Optional function wrapping the image iterator, i.e. `tqdm`
+    :return: Number of images saved
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    classes, images = _iter_raw_images(dataset)
+    if progress is not None:
+        images = progress(images)
+
+    index = []
+    shard = 0
+    offset = 0
+    shard_file = open(output_dir / PACKED_SHARD_FILE.format(shard), "wb")
+    try:
+        for image_data, target in images:
+            if offset > 0 and offset + len(image_data) > shard_size:
+                shard_file.close()
+                shard += 1
+                offset = 0
+                shard_file = open(output_dir / PACKED_SHARD_FILE.format(shard), "wb")
+
+            shard_file.write(image_data)
+            index.append((shard, len(image_data), offset, target))
+            offset += len(image_data)
+    finally:
+        shard_file.close()
+
+    # Save the index last, a packed dataset is only valid once its index exists
+    np.save(output_dir / PACKED_CLASSES_FILE, np.array(classes, dtype="S"))
+    np.save(output_dir / PACKED_INDEX_FILE, np.array(index, dtype=PACKED_INDEX_DTYPE))
+    return len(index)
+
+
+class PackedImageDataset(VisionDataset):
+    """
+    Image dataset backed by the packed format created by
+    :func:`create_packed_dataset`. The encoded images are stored back to back
+    in large shard files and located through a fixed width index, replacing
+    the per image HDF5 lookups of :class:`HDF5Dataset`.
+
+    The index is memory mapped when the whole dataset is used and each
+    dataloader worker lazily memory maps the shard files on first access.
+    Only the encoded bytes of the requested image are read from the shard, and
+    copied once into the buffer they are decoded from.
+
+    :param root:
+        Directory containing the packed dataset
+    :param num_classes:
+        Number of classes used to Limit the dataset size. Not limited when None
+    :param classes:
+        Limit the dataset to images from the given classes.
+    :param kwargs:
+        Other argument passed to :class:`VisionDataset` constructor
+    """
+
+    def __init__(self, root, num_classes=None, classes=None, **kwargs):
+        super(PackedImageDataset, self).__init__(root=root, **kwargs)
+        assert is_packed_dataset(root)
+
+        all_classes = np.load(os.path.join(root, PACKED_CLASSES_FILE))
+        all_classes = all_classes.astype("U").tolist()
+        self._index = np.load(os.path.join(root, PACKED_INDEX_FILE), mmap_mode="r")
+
+        # Select subset of the dataset filtering only images from the given classes
+        if classes is None:
+            classes = all_classes
+        else:
+            classes = list(classes)
+
+        # Limit dataset size by num_classes
+        if num_classes is not None:
+            classes = classes[:num_classes]
+
+        self._classes = {c: i for i, c in enumerate(classes)}
+        if classes != all_classes:
+            # Map the stored targets to the selected classes, -1 when excluded
+            target_map = np.full(len(all_classes), -1, dtype=np.int64)
+            for c, i in self._classes.items():
+                target_map[all_classes.index(c)] = i
+            targets = target_map[self._index["target"]]
+            self._index = self._index[targets >= 0]
+            self._targets = targets[targets >= 0]
+        else:
+            self._targets = np.array(self._index["target"])
+
+        # Lazy memory map the shards on __getitem__ of each dataloader worker.
+        self._shards = {}
+
+    def _get_index(self):
+        if self._index is None:
+            index_file = os.path.join(self.root, PACKED_INDEX_FILE)
+            self._index = np.load(index_file, mmap_mode="r")
+        return self._index
+
+    def _get_shard(self, shard):
+        data = self._shards.get(shard, None)
+        if data is None:
+            file_name = os.path.join(self.root, PACKED_SHARD_FILE.format(shard))
+            data = np.memmap(file_name, mode="r", dtype=np.uint8)
+            self._shards[shard] = data
+        return data
+
+    def __getitem__(self, index):
+        shard, size, offset, _ = self._get_index()[index].tolist()
+        target = int(self._targets[index])
+
+        image_data = self._get_shard(shard)[offset: offset + size]
+
+        # Copy the encoded image out of the shard and convert it to RGB
+        image = Image.open(BytesIO(image_data))
+        sample = image.convert("RGB")
+
+        # Apply transforms
+        if self.transform is not None:
+            sample = self.transform(sample)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+
+        return sample, target
+
+    def __len__(self):
+        return len(self._targets)
+
+    def __getstate__(self):
+        # Do not copy the parent process memory maps to the dataloader workers
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        if isinstance(self._index, np.memmap):
+            state["_index"] = None
+        return state
+
+    def extra_repr(self):
+        return "num_classes={}".format(len(self._classes))
+
+    @property
+    def targets(self):
+        return self._targets
+
+    def get_classes(self):
+        return self._classes
@@ -0,0 +1,220 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+"""
+K-winners kernels with interchangeable winner selection strategies.
+
+All functions select the ``k`` largest units of every sample, where the units
+are all the dimensions except the first (batch) dimension. The available
+strategies are:
+
+- ``topk``: :func:`torch.topk` indices. Exactly ``k`` winners per sample
+- ``kthvalue``: threshold at the k-th largest value (:func:`torch.kthvalue`)
+- ``partial_sort``: threshold at the k-th largest value computed with a two
+  stage tournament: top k of each block followed by the top k of the block
+  winners. The final selection only sees the block winners
+- ``histogram``: approximate threshold using a per sample histogram of the
+  values. Keeps the whole histogram bin of the k-th largest value, so usually
+  slightly more than ``k`` winners
+
+The threshold strategies keep every unit tied with the k-th largest value.
+"""
+import math
+
+import torch
+
+KWINNERS_STRATEGIES = ("topk", "kthvalue", "partial_sort", "histogram")
+
+
+def _threshold_topk(x, k):
+    return x.topk(k, dim=1, sorted=False)[0].min(dim=1, keepdim=True)[0]
+
+
+def _threshold_kthvalue(x, k):
+    return x.kthvalue(x.shape[1] - k + 1, dim=1, keepdim=True)[0]
+
+
+def _threshold_partial_sort(x, k):
+    batch_size, n = x.shape
+    block_size = max(k, int(math.sqrt(n * k)))
+    num_blocks = -(-n // block_size)
+    if num_blocks * k >= n:
+        return _threshold_topk(x, k)
+
+    padding = num_blocks * block_size - n
+    if padding > 0:
+        x = torch.cat((x, x.new_full((batch_size, padding), -math.inf)), dim=1)
+    candidates = x.view(batch_size, num_blocks, block_size).topk(
+        k, dim=2, sorted=False)[0]
+    return _threshold_topk(candidates.view(batch_size, -1), k)
+
+
+def _threshold_histogram(x, k, bins=256):
+    low = x.min(dim=1, keepdim=True)[0]
+    high = x.max(dim=1, keepdim=True)[0]
+    width = (high - low).clamp(min=1e-12) / bins
+    index = ((x - low) / width).long().clamp(max=bins - 1)
+    hist = torch.zeros(x.shape[0], bins, dtype=torch.long, device=x.device)
+    hist.scatter_add_(1, index, torch.ones_like(index))
+
+    # Number of units in each bin or above, find the highest bin with k units
+    above = hist.flip(1).cumsum(1).flip(1)
+    last = (above >= k).sum(dim=1, keepdim=True) - 1
+    return low + last.to(x.dtype) * width
+
+
+_THRESHOLD_FUNCTIONS = {
+    "topk": _threshold_topk,
+    "kthvalue": _threshold_kthvalue,
+    "partial_sort": _threshold_partial_sort,
+    "histogram": _threshold_histogram,
+}
+
+
+def kwinners_threshold(x, k, strategy="kthvalue"):
+    """
+    Compute the k-winners threshold of every sample.
+
+    :param x: Input tensor (batch, ...)
+    :param k: Number of winners per sample
+    :param strategy: One of :data:`KWINNERS_STRATEGIES`
+    :return: (batch, 1) tensor. The winners are the units ``>= threshold``.
+             ``+inf`` when k <= 0, so that there are no winners
+    """
+    flat_x = x.reshape(x.shape[0], -1)
+    if k <= 0:
+        return flat_x.new_full((flat_x.shape[0], 1), math.inf)
+    k = min(k, flat_x.shape[1])
+    return _THRESHOLD_FUNCTIONS[strategy](flat_x, k)
+
+
+def kwinners_mask(x, k, strategy="topk"):
+    """
+    Compute a boolean mask with the k winners of every sample.
+
+    :param x: Input tensor (batch, ...)
+    :param k: Number of winners per sample
+    :param strategy: One of :data:`KWINNERS_STRATEGIES`
+    :return: boolean tensor with the same shape as x
+    """
+    flat_x = x.reshape(x.shape[0], -1)
+    if k <= 0:
+        return torch.zeros_like(x, dtype=torch.bool)
+    if k >= flat_x.shape[1]:
+        return torch.ones_like(x, dtype=torch.bool)
+
+    if strategy == "topk":
+        indices = flat_x.topk(k, dim=1, sorted=False)[1]
+        mask = torch.zeros_like(flat_x, dtype=torch.bool)
+        mask.scatter_(1, indices, True)
+    else:
+        mask = flat_x >= kwinners_threshold(flat_x, k, strategy)
+    return mask.view_as(x)
+
+
+def boost(x, duty_cycle, k, boost_strength):
+    """
+    Boost the units whose duty cycle is below the target density ``k / n``.
+
+    .. math::
+        boosted = x \\times e^{(targetDensity - dutyCycle) \\times boostStrength}
+
+    :param x: Input tensor (batch, ...)
+    :param duty_cycle: Duty cycle of every unit, broadcastable to x.shape[1:]
+    :param k: Number of winners per sample
+    :param boost_strength: Boost strength. 0.0 has no effect
+    """
+    if duty_cycle is None or boost_strength == 0.0:
+        return x
+    target_density = float(k) / x[0].numel()
+    return x * ((target_density - duty_cycle) * boost_strength).exp()
+
+
+def update_duty_cycle_(duty_cycle, mask, period):
+    r"""
+    Update the duty cycle in place with the active units of the current batch:
+
+    .. math::
+        dutyCycle = \frac{dutyCycle \times \left( period - batchSize \right)
+                            + newValue}{period}
+
+    :param duty_cycle: Duty cycle of every unit (mask.shape[1:])
+    :param mask: Boolean mask of the active units (batch, ...)
+    :param period: Duty cycle period, ``min(duty_cycle_period, learning_iterations)``
+    """
+    batch_size = mask.shape[0]
+    duty_cycle.mul_(period - batch_size)
+    duty_cycle.add_(mask.sum(dim=0, dtype=duty_cycle.dtype))
+    duty_cycle.div_(period)
+    return duty_cycle
+
+
+class KWinners(torch.autograd.Function):
+    """
+    K-winners with fused boosting, masking and duty cycle update. The
+    gradient is only passed through the winners.
+
+    See :func:`kwinners`
+    """
+
+    @staticmethod
+    def forward(ctx, x, duty_cycle, k, boost_strength, strategy="topk",
+                inplace=False, period=None):
+        mask = kwinners_mask(boost(x, duty_cycle, k, boost_strength), k, strategy)
+        if inplace:
+            ctx.mark_dirty(x)
+            out = x.masked_fill_(~mask, 0)
+        else:
+            out = x.masked_fill(~mask, 0)
+
+        if period is not None:
+            update_duty_cycle_(duty_cycle, out > 0, period)
+
+        ctx.save_for_backward(mask)
+        return out
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        mask, = ctx.saved_tensors
+        grad_x = None
+        if ctx.needs_input_grad[0]:
+            grad_x = grad_output.masked_fill(~mask, 0)
+        return grad_x, None, None, None, None, None, None
+
+
+def kwinners(x, k, duty_cycle=None, boost_strength=0.0, strategy="topk",
+             inplace=False, period=None):
+    """
+    Keep the k winners of every sample and set the rest of the units to zero.
+    The winners are selected using the boosted input but the output keeps the
+    original values. See :func:`boost`
+
+    :param x: Input tensor (batch, ...)
+    :param k: Number of winners per sample
+    :param duty_cycle: Duty cycle of every unit, required for boosting
+    :param boost_strength: Boost strength. 0.0 has no effect
+    :param strategy: Winner selection strategy, one of :data:`KWINNERS_STRATEGIES`
+    :param inplace: Whether or not to zero the losers in place
+    :param period: If not None, also update the duty cycle in place with the
+                   units active in the output, using this period.
+                   See :func:`update_duty_cycle_`
+    :return: Tensor with the same shape as x
+    """
+    return KWinners.apply(x, duty_cycle, k, boost_strength, strategy, inplace,
+                          period)
@@ -21,9 +21,65 @@
 import os
 
 import numpy as np
+import torch
 from torchvision.utils import save_image
 
 
+def _hash32(x):
+    """Elementwise 32 bit integer hash of int64 tensors holding values in
+    [0, 2^32). The hash is a bijection, distinct inputs give distinct outputs.
+    See https://stackoverflow.com/a/12996028
+    """
+    x = (((x >> 16) ^ x) * 0x45D9F3B) & 0xFFFFFFFF
+    x = (((x >> 16) ^ x) * 0x45D9F3B) & 0xFFFFFFFF
+    return (x >> 16) ^ x
+
+
+def _seeded_keys(seeds, n):
+    """Random sort keys for ``n`` elements of each sample, only depending on the
+    sample seed. Keys are distinct within a sample, so sorting them gives the
+    same permutation on any device."""
+    seeds = _hash32(seeds.view(-1, 1) & 0xFFFFFFFF)
+    elements = torch.arange(n, dtype=torch.long, device=seeds.device)
+    return _hash32(seeds ^ elements)
+
+
+def add_random_noise_(images, noise_level, high_value, low_value, generator=None,
+                      seeds=None):
+    """Batched, in place version of :class:`RandomNoise`. For every image in
+    the batch, set ``int(noise_level * image.numel())`` randomly chosen
+    elements to noise values, half of them to ``high_value`` and the other half
+    to ``low_value``.
+
+    :param images: batch of images (batch, ...)
+    :type images: torch.Tensor
+    :param noise_level: From 0 to 1. Fraction of the elements set to noise
+    :param high_value: Noise value used by the first half of the elements
+    :param low_value: Noise value used by the second half of the elements
+    :param generator: Optional random number generator on the images device
+    :type generator: torch.Generator
+    :param seeds: Optional per image int64 seeds. When given the noise added to
+                  each image only depends on its seed
+    :type seeds: torch.Tensor
+
+    :return: the noisy images
+    """
+    a = images.view(images.shape[0], -1)
+    num_noise_bits = int(a.shape[1] * noise_level)
+    if num_noise_bits == 0:
+        return images
+
+    # One random permutation per image
+    if seeds is None:
+        keys = torch.rand(a.shape, generator=generator, device=a.device)
+    else:
+        keys = _seeded_keys(seeds.to(a.device), a.shape[1])
+    permuted_indices = keys.argsort(dim=1)[:, :num_noise_bits]
+    a.scatter_(1, permuted_indices[:, :num_noise_bits // 2], high_value)
+    a.scatter_(1, permuted_indices[:, num_noise_bits // 2:], low_value)
+    return images
+
+
 class RandomNoise(object):
     """Add noise to random pixels in images."""
 
@@ -34,6 +90,7 @@ class RandomNoise(object):
         low_value=0.1307 + 2 * 0.3081,
         log_dir=None,
         log_probability=0.01,
+        seed=None,
     ):
         """An image transform that adds noise to random elements in the image
         array. Half the time the noise value is high_value and the other half
@@ -50,6 +107,10 @@ class RandomNoise(object):
 
         :param log_probability:
           The percentage of samples to save to the log directory.
+
+        :param seed:
+          Optional seed used by :meth:`apply_batch`. When set, the noise added to
+          each image only depends on the seed and the image index.
         """
         self.noise_level = noise_level
         self.high_value = high_value
@@ -57,6 +118,7 @@ class RandomNoise(object):
         self.iteration = 0
         self.log_dir = log_dir
         self.log_probability = log_probability
+        self.seed = seed
 
     def __call__(self, image):
         self.iteration += 1
@@ -81,3 +143,45 @@ class RandomNoise(object):
                 save_image(image, outfile)
 
         return image
+
+    def apply_batch(self, images, indices=None):
+        """Apply the transform in place to a whole batch of images at once, on
+        the images device, drawing the random numbers for the batch at once.
+
+        :param images: batch of images (batch, ...)
+        :type images: torch.Tensor
+        :param indices: Optional dataset indices of the images. Only used when
+                        the transform is seeded. Default to a running count of
+                        the images seen by this transform.
+        :type indices: torch.Tensor
+
+        :return: the noisy images
+        """
+        batch_size = images.shape[0]
+        first = self.iteration
+        self.iteration += batch_size
+        if self.noise_level > 0.0:
+            seeds = None
+            if self.seed is not None:
+                if indices is None:
+                    indices = torch.arange(first, first + batch_size)
+                seeds = _hash32(torch.as_tensor(indices, dtype=torch.long)
+                                & 0xFFFFFFFF) ^ (self.seed & 0xFFFFFFFF)
+            add_random_noise_(images, self.noise_level, self.high_value,
+                              self.low_value, seeds=seeds)
+
+        # Save a subset of the images for debugging
+        if self.log_dir is not None:
+            selected = torch.rand(batch_size) <= self.log_probability
+            for i in selected.nonzero().view(-1).tolist():
+                outfile = os.path.join(
+                    self.log_dir,
+                    "im_noise_"
+                    + str(int(self.noise_level * 100))
+                    + "_"
+                    + str(first + i + 1).rjust(6, "0")
+                    + ".png",
+                )
+                save_image(images[i], outfile)
+
+        return images
@@ -19,5 +19,5 @@
 #
 
 from .imagenet_experiment import ImagenetExperiment
-from .auto_augment import ImageNetPolicy
+from .auto_augment import ImageNetPolicy, TensorPolicy
 
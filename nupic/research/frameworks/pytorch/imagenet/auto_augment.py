@@ -18,9 +18,12 @@
 #  http://numenta.org/licenses/
 #
 
+import math
 import random
 
 import numpy as np
+import torch
+import torch.nn.functional as F
 from PIL import Image, ImageEnhance, ImageOps
 
 
@@ -108,7 +111,7 @@ class CIFAR10Policy(object):
             SubPolicy(0.1, "invert", 7, 0.2, "contrast", 6, fillcolor),
             SubPolicy(0.7, "rotate", 2, 0.3, "translate_x", 9, fillcolor),
             SubPolicy(0.8, "sharpness", 1, 0.9, "sharpness", 3, fillcolor),
-            SubPolicy(0.5, "shear_y", 8, 0.7, "translateY", 9, fillcolor),
+            SubPolicy(0.5, "shear_y", 8, 0.7, "translate_y", 9, fillcolor),
             SubPolicy(0.5, "autocontrast", 8, 0.9, "equalize", 2, fillcolor),
 
             SubPolicy(0.2, "shear_y", 7, 0.3, "posterize", 7, fillcolor),
@@ -119,7 +122,7 @@ class CIFAR10Policy(object):
 
             SubPolicy(0.7, "color", 7, 0.5, "translate_x", 8, fillcolor),
             SubPolicy(0.3, "equalize", 7, 0.4, "autocontrast", 8, fillcolor),
-            SubPolicy(0.4, "translateY", 3, 0.2, "sharpness", 6, fillcolor),
+            SubPolicy(0.4, "translate_y", 3, 0.2, "sharpness", 6, fillcolor),
             SubPolicy(0.9, "brightness", 6, 0.2, "color", 8, fillcolor),
             SubPolicy(0.5, "solarize", 2, 0.0, "invert", 3, fillcolor),
 
@@ -130,10 +133,10 @@ class CIFAR10Policy(object):
             SubPolicy(0.1, "brightness", 3, 0.7, "color", 0, fillcolor),
 
             SubPolicy(0.4, "solarize", 5, 0.9, "autocontrast", 3, fillcolor),
-            SubPolicy(0.9, "translateY", 9, 0.7, "translateY", 9, fillcolor),
+            SubPolicy(0.9, "translate_y", 9, 0.7, "translate_y", 9, fillcolor),
             SubPolicy(0.9, "autocontrast", 2, 0.8, "solarize", 3, fillcolor),
             SubPolicy(0.8, "equalize", 8, 0.1, "invert", 3, fillcolor),
-            SubPolicy(0.7, "translateY", 9, 0.9, "autocontrast", 1, fillcolor)
+            SubPolicy(0.7, "translate_y", 9, 0.9, "autocontrast", 1, fillcolor)
         ]
 
     def __call__(self, img):
@@ -207,35 +210,31 @@ def rotate_with_fill(img, magnitude):
 
 
 def shear_x(img, magnitude):
-    img.transform(
+    return img.transform(
         img.size, Image.AFFINE,
         (1, magnitude * random.choice([-1, 1]), 0, 0, 1, 0),
         Image.BICUBIC, fillcolor=(128, 128, 128))
-    return img
 
 
 def shear_y(img, magnitude):
-    img.transform(
+    return img.transform(
         img.size, Image.AFFINE,
         (1, 0, 0, magnitude * random.choice([-1, 1]), 1, 0),
         Image.BICUBIC, fillcolor=(128, 128, 128))
-    return img
 
 
 def translate_x(img, magnitude):
-    img.transform(
+    return img.transform(
         img.size, Image.AFFINE,
         (1, 0, magnitude * img.size[0] * random.choice([-1, 1]), 0, 1, 0),
         fillcolor=(128, 128, 128))
-    return img
 
 
 def translate_y(img, magnitude):
-    img.transform(
+    return img.transform(
         img.size, Image.AFFINE,
         (1, 0, 0, 0, 1, magnitude * img.size[1] * random.choice([-1, 1])),
         fillcolor=(128, 128, 128))
-    return img
 
 
 def rotate(img, magnitude):
@@ -282,51 +281,53 @@ def invert(img, magnitude):
     return ImageOps.invert(img)
 
 
+# Magnitude ranges and operations are shared by all sub-policies
+RANGES = {
+    "shear_x": np.linspace(0, 0.3, 10),
+    "shear_y": np.linspace(0, 0.3, 10),
+    "translate_x": np.linspace(0, 150 / 331, 10),
+    "translate_y": np.linspace(0, 150 / 331, 10),
+    "rotate": np.linspace(0, 30, 10),
+    "color": np.linspace(0.0, 0.9, 10),
+    "posterize": np.round(np.linspace(8, 4, 10), 0).astype(int),
+    "solarize": np.linspace(256, 0, 10),
+    "contrast": np.linspace(0.0, 0.9, 10),
+    "sharpness": np.linspace(0.0, 0.9, 10),
+    "brightness": np.linspace(0.0, 0.9, 10),
+    "autocontrast": [0] * 10,
+    "equalize": [0] * 10,
+    "invert": [0] * 10
+}
+
+OPERATIONS = {
+    "shear_x": shear_x,
+    "shear_y": shear_y,
+    "translate_x": translate_x,
+    "translate_y": translate_y,
+    "rotate": rotate,
+    "color": color,
+    "posterize": posterize,
+    "solarize": solarize,
+    "contrast": contrast,
+    "sharpness": sharpness,
+    "brightness": brightness,
+    "autocontrast": autocontrast,
+    "equalize": equalize,
+    "invert": invert
+}
+
+
 class SubPolicy(object):
     def __init__(self, p1, operation1, magnitude_idx1, p2, operation2, magnitude_idx2,
                  fillcolor=(128, 128, 128)):
-        ranges = {
-            "shear_x": np.linspace(0, 0.3, 10),
-            "shear_y": np.linspace(0, 0.3, 10),
-            "translate_x": np.linspace(0, 150 / 331, 10),
-            "translate_y": np.linspace(0, 150 / 331, 10),
-            "rotate": np.linspace(0, 30, 10),
-            "color": np.linspace(0.0, 0.9, 10),
-            "posterize": np.round(np.linspace(8, 4, 10), 0).astype(np.int),
-            "solarize": np.linspace(256, 0, 10),
-            "contrast": np.linspace(0.0, 0.9, 10),
-            "sharpness": np.linspace(0.0, 0.9, 10),
-            "brightness": np.linspace(0.0, 0.9, 10),
-            "autocontrast": [0] * 10,
-            "equalize": [0] * 10,
-            "invert": [0] * 10
-        }
-
-        func = {
-            "shear_x": shear_x,
-            "shear_y": shear_y,
-            "translate_x": translate_x,
-            "translate_y": translate_y,
-            "rotate": rotate,
-            "color": color,
-            "posterize": posterize,
-            "solarize": solarize,
-            "contrast": contrast,
-            "sharpness": sharpness,
-            "brightness": brightness,
-            "autocontrast": autocontrast,
-            "equalize": equalize,
-            "invert": invert
-        }
-
         self.op1name = operation1
         self.op2name = operation2
         self.p1 = p1
-        self.operation1 = func[operation1]
-        self.magnitude1 = ranges[operation1][magnitude_idx1]
+        self.operation1 = OPERATIONS[operation1]
+        self.magnitude1 = RANGES[operation1][magnitude_idx1]
         self.p2 = p2
-        self.operation2 = func[operation2]
-        self.magnitude2 = ranges[operation2][magnitude_idx2]
+        self.operation2 = OPERATIONS[operation2]
+        self.magnitude2 = RANGES[operation2][magnitude_idx2]
 
     def __call__(self, img):
         if random.random() < self.p1:
@@ -336,3 +337,287 @@ class SubPolicy(object):
             img = self.operation2(img, self.magnitude2)
             # print("Applying:", self.op2name, "type:", type(img))
         return img
+
+
+# Tensor implementation of the sub-policy operations. The operations work on
+# batches of uint8 images (batch, channels, height, width) on any device and
+# take one magnitude per image. Point operations are implemented with lookup
+# tables and geometric operations with batched affine grids.
+_LEVELS = 256
+_FILL = 128
+
+
+def _random_sign(n, device):
+    return torch.randint(0, 2, (n,), device=device).float() * 2 - 1
+
+
+def _apply_lut(images, lut):
+    """Apply per image (batch, 256) or per channel (batch, channels, 256) LUTs"""
+    b, c = images.shape[:2]
+    if lut.dim() == 2:
+        lut = lut.unsqueeze(1).expand(b, c, _LEVELS)
+    index = images.reshape(b, c, -1).long()
+    return lut.to(images.dtype).gather(2, index).view_as(images)
+
+
+def _levels(images):
+    return torch.arange(_LEVELS, device=images.device)
+
+
+def _blend(degenerate, images, factor):
+    """Same as :func:`PIL.Image.blend`, used by :mod:`PIL.ImageEnhance`"""
+    factor = factor.view(-1, 1, 1, 1)
+    degenerate = degenerate.float()
+    out = degenerate + factor * (images.float() - degenerate)
+    return out.clamp(0, 255).to(images.dtype)
+
+
+def _grayscale(images):
+    """Same as PIL "L" mode conversion"""
+    if images.shape[1] == 1:
+        return images.float()
+    r, g, b = images.float().unbind(dim=1)
+    return ((r * 299 + g * 587 + b * 114) / 1000).floor().unsqueeze(1)
+
+
+def tensor_posterize(images, magnitude):
+    bits = magnitude.long().view(-1, 1)
+    mask = _LEVELS - (1 << (8 - bits))
+    return _apply_lut(images, _levels(images).unsqueeze(0) & mask)
+
+
+def tensor_solarize(images, magnitude):
+    levels = _levels(images).unsqueeze(0)
+    lut = torch.where(levels < magnitude.view(-1, 1).to(levels.device),
+                      levels, 255 - levels)
+    return _apply_lut(images, lut)
+
+
+def tensor_invert(images, magnitude):
+    return 255 - images
+
+
+def tensor_autocontrast(images, magnitude):
+    b, c = images.shape[:2]
+    flat = images.reshape(b, c, -1)
+    # Same precision as PIL.ImageOps.autocontrast
+    lo = flat.min(dim=2)[0].double().unsqueeze(2)
+    hi = flat.max(dim=2)[0].double().unsqueeze(2)
+    levels = _levels(images).double().view(1, 1, -1)
+    scale = 255.0 / (hi - lo).clamp(min=1)
+    lut = (levels * scale - lo * scale).clamp(0, 255).floor()
+    lut = torch.where(hi > lo, lut, levels.expand_as(lut))
+    return _apply_lut(images, lut.long())
+
+
+def tensor_equalize(images, magnitude):
+    b, c = images.shape[:2]
+    flat = images.reshape(b * c, -1).long()
+    hist = torch.zeros(b * c, _LEVELS, dtype=torch.long, device=images.device)
+    hist.scatter_add_(1, flat, torch.ones_like(flat))
+
+    # Same as PIL.ImageOps.equalize: ignore the count of the last level present
+    last = _LEVELS - 1 - (hist > 0).flip(1).long().argmax(dim=1, keepdim=True)
+    step = (hist.sum(dim=1, keepdim=True) - hist.gather(1, last)) // 255
+    cumsum = hist.cumsum(dim=1) - hist
+    lut = (step // 2 + cumsum) // step.clamp(min=1)
+    levels = _levels(images).unsqueeze(0)
+    lut = torch.where(step > 0, lut.clamp(max=255), levels.expand_as(lut))
+    return _apply_lut(images, lut.view(b, c, _LEVELS))
+
+
+def tensor_color(images, magnitude):
+    factor = 1 + magnitude * _random_sign(len(images), images.device)
+    return _blend(_grayscale(images).expand_as(images), images, factor)
+
+
+def tensor_contrast(images, magnitude):
+    factor = 1 + magnitude * _random_sign(len(images), images.device)
+    mean = _grayscale(images).mean(dim=(1, 2, 3), keepdim=True)
+    mean = (mean + 0.5).floor().expand_as(images)
+    return _blend(mean, images, factor)
+
+
+def tensor_brightness(images, magnitude):
+    factor = 1 + magnitude * _random_sign(len(images), images.device)
+    return _blend(torch.zeros_like(images), images, factor)
+
+
+def tensor_sharpness(images, magnitude):
+    factor = 1 + magnitude * _random_sign(len(images), images.device)
+    c = images.shape[1]
+    kernel = torch.ones(3, 3, device=images.device)
+    kernel[1, 1] = 5
+    kernel = (kernel / 13).expand(c, 1, 3, 3)
+    smooth = F.conv2d(images.float(), kernel, groups=c).round()
+    # PIL keeps the border pixels
+    degenerate = images.float().clone()
+    degenerate[:, :, 1:-1, 1:-1] = smooth
+    return _blend(degenerate, images, factor)
+
+
+def _affine(images, matrix, mode):
+    """
+    Apply PIL style affine transforms, mapping output pixel coordinates to
+    input pixel coordinates, filling the outside with gray.
+
+    :param matrix: (batch, 2, 3) affine matrices in pixel coordinates
+    """
+    b, c, h, w = images.shape
+    device = images.device
+    # Convert to the normalized coordinates used by affine_grid
+    to_norm = torch.tensor([[2.0 / w, 0, -1], [0, 2.0 / h, -1], [0, 0, 1]],
+                           device=device)
+    from_norm = torch.inverse(to_norm)
+    row = torch.tensor([0.0, 0.0, 1.0], device=device).expand(b, 1, 3)
+    matrix = torch.cat((matrix, row), dim=1)
+    theta = to_norm.matmul(matrix).matmul(from_norm)[:, :2]
+
+    grid = F.affine_grid(theta, [b, c, h, w], align_corners=False)
+    ones = torch.ones(b, 1, h, w, device=device)
+    sampled = F.grid_sample(torch.cat((images.float(), ones), dim=1), grid,
+                            mode=mode, padding_mode="zeros", align_corners=False)
+    out, mask = sampled[:, :-1], sampled[:, -1:]
+    out = out + (1 - mask) * _FILL
+    return out.round().clamp(0, 255).to(images.dtype)
+
+
+def _affine_matrix(n, device, a=1.0, b=0.0, c=0.0, d=0.0, e=1.0, f=0.0):
+    values = [torch.as_tensor(v, dtype=torch.float, device=device).expand(n)
+              for v in (a, b, c, d, e, f)]
+    return torch.stack(values, dim=1).view(n, 2, 3)
+
+
+def tensor_shear_x(images, magnitude):
+    shear = magnitude * _random_sign(len(images), images.device)
+    return _affine(images, _affine_matrix(len(images), images.device, b=shear),
+                   mode="bilinear")
+
+
+def tensor_shear_y(images, magnitude):
+    shear = magnitude * _random_sign(len(images), images.device)
+    return _affine(images, _affine_matrix(len(images), images.device, d=shear),
+                   mode="bilinear")
+
+
+def tensor_translate_x(images, magnitude):
+    shift = magnitude * images.shape[3] * _random_sign(len(images), images.device)
+    return _affine(images, _affine_matrix(len(images), images.device, c=shift),
+                   mode="nearest")
+
+
+def tensor_translate_y(images, magnitude):
+    shift = magnitude * images.shape[2] * _random_sign(len(images), images.device)
+    return _affine(images, _affine_matrix(len(images), images.device, f=shift),
+                   mode="nearest")
+
+
+def tensor_rotate(images, magnitude):
+    h, w = images.shape[2:]
+    angle = -magnitude * math.pi / 180
+    cos, sin = torch.cos(angle), torch.sin(angle)
+    # Rotate around the center, same as PIL.Image.rotate
+    cx, cy = w / 2.0, h / 2.0
+    matrix = _affine_matrix(len(images), images.device, a=cos, b=sin,
+                            c=cx - cos * cx - sin * cy, d=-sin, e=cos,
+                            f=cy + sin * cx - cos * cy)
+    return _affine(images, matrix, mode="nearest")
+
+
+TENSOR_OPERATIONS = {
+    "shear_x": tensor_shear_x,
+    "shear_y": tensor_shear_y,
+    "translate_x": tensor_translate_x,
+    "translate_y": tensor_translate_y,
+    "rotate": tensor_rotate,
+    "color": tensor_color,
+    "posterize": tensor_posterize,
+    "solarize": tensor_solarize,
+    "contrast": tensor_contrast,
+    "sharpness": tensor_sharpness,
+    "brightness": tensor_brightness,
+    "autocontrast": tensor_autocontrast,
+    "equalize": tensor_equalize,
+    "invert": tensor_invert
+}
+
+
+class TensorPolicy(object):
+    """
+    Tensor implementation of an AutoAugment policy. Compiles the sub-policies
+    of :class:`ImageNetPolicy`, :class:`CIFAR10Policy` or :class:`SVHNPolicy`
+    into tensors and applies them to uint8 image tensors, either single images
+    (channels, height, width) inside the data loader workers, see
+    :class:`ToByteTensor`, or whole batches (batch, channels, height, width)
+    after collation, on any device. Each image gets its own random sub-policy.
+
+    Example::
+
+        transform = transforms.Compose([
+            transforms.RandomResizedCrop(224),
+            transforms.RandomHorizontalFlip(),
+            ToByteTensor(),
+            TensorPolicy(ImageNetPolicy()),
+            ByteTensorToFloat(),
+            transforms.Normalize(...)])
+
+    :param policy: AutoAugment policy or list of :class:`SubPolicy`
+    """
+
+    def __init__(self, policy):
+        policies = getattr(policy, "policies", policy)
+        self.names = sorted(TENSOR_OPERATIONS.keys())
+        ops = [[self.names.index(p.op1name), self.names.index(p.op2name)]
+               for p in policies]
+        self.ops = torch.tensor(ops, dtype=torch.long)
+        self.probs = torch.tensor([[p.p1, p.p2] for p in policies])
+        self.magnitudes = torch.tensor(
+            [[float(p.magnitude1), float(p.magnitude2)] for p in policies])
+
+    def __call__(self, images):
+        single = images.dim() == 3
+        if single:
+            images = images.unsqueeze(0)
+
+        n = len(images)
+        choice = torch.randint(len(self.ops), (n,))
+        apply = torch.rand(n, 2) < self.probs[choice]
+        ops = self.ops[choice]
+        magnitudes = self.magnitudes[choice].to(images.device)
+
+        images = images.clone()
+        for stage in range(2):
+            for op in ops[apply[:, stage], stage].unique().tolist():
+                selected = (apply[:, stage] & (ops[:, stage] == op))
+                selected = selected.nonzero().view(-1).to(images.device)
+                func = TENSOR_OPERATIONS[self.names[op]]
+                images[selected] = func(images[selected],
+                                        magnitudes[selected, stage])
+
+        return images[0] if single else images
+
+    def __repr__(self):
+        return "AutoAugment Tensor Policy"
+
+
+class ToByteTensor(object):
+    """
+    Convert a PIL image into a uint8 (channels, height, width) tensor, without
+    scaling it. See :class:`TensorPolicy`
+    """
+
+    def __call__(self, img):
+        array = np.asarray(img, dtype=np.uint8)
+        if array.ndim == 2:
+            array = array[:, :, None]
+        return torch.from_numpy(array.transpose(2, 0, 1).copy())
+
+
+class ByteTensorToFloat(object):
+    """
+    Convert uint8 image tensors into float tensors in the range [0, 1], same
+    as :class:`torchvision.transforms.ToTensor`
+    """
+
+    def __call__(self, images):
+        return images.float().div_(255)
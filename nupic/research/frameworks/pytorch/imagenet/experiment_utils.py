@@ -37,11 +37,18 @@ import nupic.research.frameworks.pytorch.models.resnets
 from nupic.research.frameworks.pytorch.dataset_utils import (
     CachedDatasetFolder,
     HDF5Dataset,
+    PackedImageDataset,
+    is_packed_dataset,
 )
 from nupic.research.frameworks.pytorch.lr_scheduler import ComposedLRScheduler
 from nupic.research.frameworks.pytorch.model_utils import deserialize_state_dict
 
-from .auto_augment import ImageNetPolicy
+from .auto_augment import (
+    ByteTensorToFloat,
+    ImageNetPolicy,
+    TensorPolicy,
+    ToByteTensor,
+)
 
 IMAGENET_NUM_CLASSES = {
     10: [
@@ -75,23 +82,43 @@ IMAGENET_NUM_CLASSES = {
 
 def create_train_dataloader(
     data_dir, train_dir, batch_size, workers, distributed, num_classes=1000,
-    use_auto_augment=False,
+    use_auto_augment=False, auto_augment_backend="pil",
 ):
     """
     Configure Imagenet training dataloader
 
-    Creates :class:`torch.utils.data.DataLoader` using :class:`CachedDatasetFolder`
-    or :class:`HDF5Dataset` pre-configured for the training cycle
+    Creates :class:`torch.utils.data.DataLoader` using :class:`CachedDatasetFolder`,
+    :class:`HDF5Dataset` or :class:`PackedImageDataset` pre-configured for the
+    training cycle
 
     :param data_dir: The directory or hdf5 file containing the dataset
-    :param train_dir: The directory or hdf5 group containing the training data
+    :param train_dir: The directory, packed dataset directory or hdf5 group
+                      containing the training data
     :param batch_size: Images per batch
     :param workers: how many data loading subprocesses to use
     :param distributed: Whether or not to use `DistributedSampler`
     :param num_classes: Limit the dataset size to the given number of classes
+    :param use_auto_augment: Whether or not to apply :class:`ImageNetPolicy`
+    :param auto_augment_backend: "pil" to apply the policy to PIL images or
+                                 "tensor" to apply it to uint8 tensors using
+                                 :class:`TensorPolicy`
     :return: torch.utils.data.DataLoader
     """
-    if use_auto_augment:
+    if use_auto_augment and auto_augment_backend == "tensor":
+        transform = transforms.Compose(
+            transforms=[
+                RandomResizedCrop(224),
+                transforms.RandomHorizontalFlip(),
+                ToByteTensor(),
+                TensorPolicy(ImageNetPolicy()),
+                ByteTensorToFloat(),
+                transforms.Normalize(
+                    mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225],
+                    inplace=True
+                ),
+            ],
+        )
+    elif use_auto_augment:
         transform = transforms.Compose(
             transforms=[
                 RandomResizedCrop(224),
@@ -125,6 +152,15 @@ def create_train_dataloader(
         else:
             dataset = HDF5Dataset(hdf5_file=data_dir, root=train_dir,
                                   num_classes=num_classes, transform=transform)
+    elif is_packed_dataset(os.path.join(data_dir, train_dir)):
+        root = os.path.join(data_dir, train_dir)
+        if num_classes in IMAGENET_NUM_CLASSES:
+            classes = IMAGENET_NUM_CLASSES[num_classes]
+            dataset = PackedImageDataset(root=root, classes=classes,
+                                         transform=transform)
+        else:
+            dataset = PackedImageDataset(root=root, num_classes=num_classes,
+                                         transform=transform)
     else:
         dataset = CachedDatasetFolder(root=os.path.join(data_dir, train_dir),
                                       num_classes=num_classes, transform=transform)
@@ -148,11 +184,13 @@ def create_validation_dataloader(data_dir, val_dir, batch_size, workers,
     """
     Configure Imagenet validation dataloader
 
-    Creates :class:`torch.utils.data.DataLoader` using :class:`CachedDatasetFolder`
-    or :class:`HDF5Dataset` pre-configured for the validation cycle.
+    Creates :class:`torch.utils.data.DataLoader` using :class:`CachedDatasetFolder`,
+    :class:`HDF5Dataset` or :class:`PackedImageDataset` pre-configured for the
+    validation cycle.
 
     :param data_dir: The directory or hdf5 file containing the dataset
-    :param val_dir: The directory containing or hdf5 group the validation data
+    :param val_dir: The directory, packed dataset directory or hdf5 group
+                    containing the validation data
     :param batch_size: Images per batch
     :param workers: how many data loading subprocesses to use
     :param num_classes: Limit the dataset size to the given number of classes
@@ -178,6 +216,15 @@ def create_validation_dataloader(data_dir, val_dir, batch_size, workers,
         else:
             dataset = HDF5Dataset(hdf5_file=data_dir, root=val_dir,
                                   num_classes=num_classes, transform=transform)
+    elif is_packed_dataset(os.path.join(data_dir, val_dir)):
+        root = os.path.join(data_dir, val_dir)
+        if num_classes in IMAGENET_NUM_CLASSES:
+            classes = IMAGENET_NUM_CLASSES[num_classes]
+            dataset = PackedImageDataset(root=root, classes=classes,
+                                         transform=transform)
+        else:
+            dataset = PackedImageDataset(root=root, num_classes=num_classes,
+                                         transform=transform)
     else:
         dataset = CachedDatasetFolder(root=os.path.join(data_dir, val_dir),
                                       num_classes=num_classes, transform=transform)
@@ -20,6 +20,7 @@
 import functools
 import io
 import logging
+import math
 import multiprocessing
 import sys
 import time
@@ -91,6 +92,11 @@ class ImagenetExperiment:
         self.seed = 42
         self.profile = False
         self.validate_after_epoch = 0
+        self.prefetch = False
+        self.gradient_accumulation_steps = 1
+        self.callback_interval = 1
+        self.steps_per_epoch = 1
+        self.lr_scheduler_step = 0
 
     def setup_experiment(self, config):
         """
@@ -147,6 +153,16 @@ class ImagenetExperiment:
                                current experiment.
             - validate_after_epoch: will only run validate after this epoch.
                                     Default: epochs - 3
+            - prefetch: Whether or not to fetch the next training batch while
+                        the current batch is computing. Default False
+            - gradient_accumulation_steps: Number of batches to accumulate the
+                                           gradients over before each optimizer
+                                           step. Default 1
+            - callback_interval: Only call "pre_batch" and "post_batch" every
+                                 "callback_interval" batches. Default 1
+            - use_auto_augment: Whether or not to use AutoAugment ImageNet policy
+            - auto_augment_backend: "pil" or "tensor". See "TensorPolicy".
+                                    Default "pil"
         """
         # Configure logger
         log_format = config.get("log_format", logging.BASIC_FORMAT)
@@ -262,9 +278,17 @@ class ImagenetExperiment:
             distributed=self.distributed,
             num_classes=num_classes,
             use_auto_augment=config.get("use_auto_augment", False),
+            auto_augment_backend=config.get("auto_augment_backend", "pil"),
         )
         self.total_batches = len(self.train_loader)
 
+        # Configure training loop
+        self.prefetch = config.get("prefetch", False)
+        self.gradient_accumulation_steps = config.get("gradient_accumulation_steps", 1)
+        self.callback_interval = config.get("callback_interval", 1)
+        self.steps_per_epoch = math.ceil(
+            self.total_batches / self.gradient_accumulation_steps)
+
         # Configure Validation data loader
         val_dir = config.get("val_dir", "val")
         val_batch_size = config.get("val_batch_size", self.batch_size)
@@ -286,7 +310,7 @@ class ImagenetExperiment:
                 optimizer=self.optimizer,
                 lr_scheduler_class=lr_scheduler_class,
                 lr_scheduler_args=lr_scheduler_args,
-                steps_per_epoch=self.total_batches)
+                steps_per_epoch=self.steps_per_epoch)
 
         # Only profile from rank 0
         self.profile = config.get("profile", False) and self.rank == 0
@@ -321,9 +345,13 @@ class ImagenetExperiment:
         return results
 
     def train_epoch(self, epoch):
+        # LR scheduler step before this epoch. Used to keep per-batch LR
+        # schedulers in sync when callbacks are not called on every step
+        if self.lr_scheduler is not None:
+            self.lr_scheduler_step = self.lr_scheduler.last_epoch
         with torch.autograd.profiler.profile(use_cuda=torch.cuda.is_available(),
                                              enabled=self.profile) as prof:
-            train_model(
+            results = train_model(
                 model=self.model,
                 loader=self.train_loader,
                 optimizer=self.optimizer,
@@ -332,16 +360,24 @@ class ImagenetExperiment:
                 batches_in_epoch=self.batches_in_epoch,
                 pre_batch_callback=functools.partial(self.pre_batch, epoch=epoch),
                 post_batch_callback=functools.partial(self.post_batch, epoch=epoch),
+                prefetch=self.prefetch,
+                gradient_accumulation_steps=self.gradient_accumulation_steps,
+                callback_interval=self.callback_interval,
             )
+        self.step_lr_scheduler(self.lr_scheduler_step + results["num_steps"])
         if self.profile and prof is not None:
             self.logger.info(prof.key_averages().table(sort_by="self_cpu_time_total"))
+        self.logger.info("Epoch %s: %.1f samples/s", epoch,
+                         results["samples_per_second"])
+        return results
 
     def run_epoch(self, epoch):
         self.pre_epoch(epoch)
-        self.train_epoch(epoch)
+        train_results = self.train_epoch(epoch)
         self.post_epoch(epoch)
         t1 = time.time()
         ret = self.validate(epoch)
+        ret.update(samples_per_second=train_results["samples_per_second"])
 
         if self.rank == 0:
             self.logger.debug("validate time: %s", time.time() - t1)
@@ -359,9 +395,9 @@ class ImagenetExperiment:
         pass
 
     def post_batch(self, model, loss, batch_idx, epoch, num_images, times):
-        # Update 1cycle learning rate after every batch
-        if isinstance(self.lr_scheduler, (OneCycleLR, ComposedLRScheduler)):
-            self.lr_scheduler.step()
+        # Update 1cycle learning rate after every optimizer step
+        steps = (batch_idx + 1) // self.gradient_accumulation_steps
+        self.step_lr_scheduler(self.lr_scheduler_step + steps)
 
         if self.progress and (batch_idx % 40) == 0:
             total_batches = self.total_batches
@@ -376,6 +412,15 @@ class ImagenetExperiment:
             self.logger.debug("    num_images: %s, rank: %s, times: %s",
                               num_images, self.rank, times)
 
+    def step_lr_scheduler(self, step):
+        """
+        Step 1cycle learning rate schedulers until they reach the given global
+        optimizer step
+        """
+        if isinstance(self.lr_scheduler, (OneCycleLR, ComposedLRScheduler)):
+            while self.lr_scheduler.last_epoch < step:
+                self.lr_scheduler.step()
+
     def post_epoch(self, epoch):
         count_nnz = self.logger.isEnabledFor(logging.DEBUG) and self.rank == 0
         if count_nnz:
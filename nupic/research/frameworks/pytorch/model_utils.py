@@ -20,8 +20,10 @@
 # ----------------------------------------------------------------------
 import gzip
 import pickle
+import queue
 import random
 import sys
+import threading
 import time
 
 import numpy as np
@@ -29,6 +31,100 @@ import torch
 import torch.nn.functional as F
 from tqdm import tqdm
 
+from nupic.research.frameworks.pytorch.image_transforms import RandomNoise
+
+
+def prefetch_to_device(loader, device, non_blocking=False):
+    """Iterate over the ``(data, target)`` batches of the given loader copying
+    batch N+1 to the device before batch N is handed to the caller, so the
+    host side of the next batch (collation, host to device copy) is queued
+    while the current batch is still computing. Copies are issued on the
+    current stream, no additional CUDA streams are used.
+
+    :param loader: iterable of ``(data, target)`` batches
+    :param device: device to copy the batches to
+    :type device: :class:`torch.device`
+    :param non_blocking: Whether or not to use asynchronous copies. Only
+                         effective when the loader memory is pinned
+    :type non_blocking: bool
+    """
+    it = iter(loader)
+    try:
+        data, target = next(it)
+    except StopIteration:
+        return
+    staged = (data.to(device, non_blocking=non_blocking),
+              target.to(device, non_blocking=non_blocking))
+    for data, target in it:
+        current = staged
+        staged = (data.to(device, non_blocking=non_blocking),
+                  target.to(device, non_blocking=non_blocking))
+        yield current
+    yield staged
+
+
+def prefetch_in_background(loader, depth=2):
+    """Iterate over the given loader using a background thread to fetch up to
+    ``depth`` items ahead of the caller. Useful for CPU-only runs where there
+    is no device copy to overlap but the loader itself (collation, in-process
+    transforms) competes with the training step.
+
+    Exceptions raised by the loader are re-raised in the caller thread. Closing
+    the returned generator stops the background thread.
+
+    :param loader: any iterable
+    :param depth: Max number of items to fetch ahead
+    :type depth: int
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            for item in loader:
+                if not put((item, None)):
+                    return
+        except Exception as e:
+            put((done, e))
+            return
+        put((done, None))
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        # Unblock the producer if it is waiting on a full queue
+        while not items.empty():
+            items.get_nowait()
+        thread.join(timeout=1.0)
+
+
+def create_prefetcher(loader, device, non_blocking=False):
+    """Create the prefetching iterator suitable for the given device.
+    See :func:`prefetch_to_device` and :func:`prefetch_in_background`
+    """
+    if torch.device(device).type == "cuda":
+        return prefetch_to_device(loader, device, non_blocking=non_blocking)
+    return prefetch_in_background(loader)
+
 
 def train_model(
     model,
@@ -40,6 +136,9 @@ def train_model(
     pre_batch_callback=None,
     post_batch_callback=None,
     progress_bar=None,
+    prefetch=False,
+    gradient_accumulation_steps=1,
+    callback_interval=1,
 ):
     """Train the given model by iterating through mini batches. An epoch ends
     after one pass through the training set, or if the number of mini batches
@@ -57,28 +156,51 @@ def train_model(
     :type device: :class:`torch.device
     :param criterion: loss function to use
     :type criterion: function
-    :param post_batch_callback: Callback function to be called after every batch
-                                with the following parameters: model, batch_idx
+    :param post_batch_callback: Callback function to be called after every
+                                "callback_interval" batches with the following
+                                parameters: model, loss, batch_idx, num_images,
+                                times
     :type post_batch_callback: function
-    :param pre_batch_callback: Callback function to be called before every batch
-                               with the following parameters: model, batch_idx
+    :param pre_batch_callback: Callback function to be called before every
+                               "callback_interval" batches with the following
+                               parameters: model, batch_idx
     :type pre_batch_callback: function
     :param progress_bar: Optional :class:`tqdm` progress bar args.
                          None for no progress bar
     :type progress_bar: dict or None
+    :param prefetch: Whether or not to fetch the next batch while the current
+                     batch is computing. See :func:`create_prefetcher`
+    :type prefetch: bool
+    :param gradient_accumulation_steps: Number of batches to accumulate the
+                                        gradients over before updating the
+                                        weights
+    :type gradient_accumulation_steps: int
+    :param callback_interval: Only call the batch callbacks every
+                              "callback_interval" batches. The batch times
+                              are only measured on these batches
+    :type callback_interval: int
 
-    :return: mean loss for epoch
-    :rtype: float
+    :return: dictionary with "mean_loss", "num_samples", "num_batches",
+             "num_steps" (optimizer steps), "elapsed_time" and
+             "samples_per_second"
+    :rtype: dict
     """
     model.train()
     # Use asynchronous GPU copies when the memory is pinned
     # See https://pytorch.org/docs/master/notes/cuda.html
     async_gpu = loader.pin_memory
+    device = torch.device(device)
+    total_batches = len(loader)
+
+    prefetcher = None
+    if prefetch:
+        prefetcher = create_prefetcher(loader, device, non_blocking=async_gpu)
+    batches = loader if prefetcher is None else prefetcher
     if progress_bar is not None:
-        loader = tqdm(loader, **progress_bar)
+        batches = tqdm(batches, total=total_batches, **progress_bar)
         # update progress bar total based on batches_in_epoch
-        if batches_in_epoch < len(loader):
-            loader.total = batches_in_epoch
+        if batches_in_epoch < total_batches:
+            batches.total = batches_in_epoch
 
     # Check if training with Apex Mixed Precision
     # FIXME: There should be another way to check if 'amp' is enabled
@@ -91,40 +213,185 @@ def train_model(
                 "Mixed precision requires NVIDA APEX."
                 "Please install apex from https://www.github.com/nvidia/apex")
 
+    total_loss = torch.zeros((), device=device)
+    num_samples = 0
+    num_batches = 0
+    num_steps = 0
+    pending = 0
+    start_time = time.time()
+    try:
+        optimizer.zero_grad()
+        for batch_idx, (data, target) in enumerate(batches):
+            if batch_idx >= batches_in_epoch:
+                break
+            num_images = len(target)
+            callback = batch_idx % callback_interval == 0
+            if callback:
+                t1 = time.time()
+                if pre_batch_callback is not None:
+                    pre_batch_callback(model=model, batch_idx=batch_idx)
+
+            data = data.to(device, non_blocking=async_gpu)
+            target = target.to(device, non_blocking=async_gpu)
+            output = model(data)
+            loss = criterion(output, target)
+            del data, target, output
+
+            pending += 1
+            step = pending == gradient_accumulation_steps
+            if callback:
+                t2 = time.time()
+            if use_amp:
+                with amp.scale_loss(loss / gradient_accumulation_steps, optimizer,
+                                    delay_unscale=not step) as scaled_loss:
+                    scaled_loss.backward()
+            else:
+                (loss / gradient_accumulation_steps).backward()
+
+            if callback:
+                t3 = time.time()
+            if step:
+                optimizer.step()
+                optimizer.zero_grad()
+                num_steps += 1
+                pending = 0
+
+            loss = loss.detach()
+            total_loss += loss * num_images
+            num_samples += num_images
+            num_batches += 1
+
+            if callback and post_batch_callback is not None:
+                t4 = time.time()
+                post_batch_callback(model=model, loss=loss, batch_idx=batch_idx,
+                                    num_images=num_images,
+                                    times=[t2 - t1, t3 - t2, t4 - t3])
+            del loss
+
+        # Apply the gradients accumulated by the last incomplete window
+        if pending > 0:
+            optimizer.step()
+            optimizer.zero_grad()
+            num_steps += 1
+    finally:
+        if progress_bar is not None:
+            batches.n = batches.total
+            batches.close()
+        if prefetcher is not None:
+            # Stop the prefetcher when the epoch ends before the loader
+            prefetcher.close()
+
+    mean_loss = total_loss.item() / num_samples if num_samples > 0 else 0
+    elapsed_time = time.time() - start_time
+    return {
+        "mean_loss": mean_loss,
+        "num_samples": num_samples,
+        "num_batches": num_batches,
+        "num_steps": num_steps,
+        "elapsed_time": elapsed_time,
+        "samples_per_second": num_samples / elapsed_time if elapsed_time > 0 else 0,
+    }
+
+
+class ClassificationMetrics(object):
+    """Accumulate classification metrics as on-device tensors. Nothing is
+    copied back to the host until :meth:`results` is called, so the evaluation
+    loop never waits for the device to catch up.
+
+    :param device: device where the metrics are accumulated
+    :type device: :class:`torch.device`
+    :param topk: Additional top-k accuracies to compute, i.e. (5,)
+    :type topk: tuple
+    :param num_classes: When given, also accumulate the confusion matrix
+                        (rows are targets, columns are predictions)
+    :type num_classes: int
+    """
+
+    def __init__(self, device, topk=(), num_classes=None):
+        self.device = torch.device(device)
+        self.topk = tuple(topk)
+        self.num_classes = num_classes
+        self.reset()
+
+    def reset(self):
+        self.total = 0
+        self.loss = torch.zeros((), dtype=torch.float64, device=self.device)
+        self.correct = torch.zeros((), dtype=torch.long, device=self.device)
+        self.topk_correct = torch.zeros(len(self.topk), dtype=torch.long,
+                                        device=self.device)
+        self.confusion = None
+        if self.num_classes is not None:
+            self.confusion = torch.zeros(self.num_classes, self.num_classes,
+                                         dtype=torch.long, device=self.device)
+
+    @torch.no_grad()
+    def update(self, output, target, loss=None):
+        """Accumulate the metrics for one batch.
+
+        :param output: model output (batch, classes)
+        :param target: target classes (batch,)
+        :param loss: Optional loss summed over the batch
+        """
+        pred = output.argmax(dim=1)
+        self.correct += pred.eq(target).sum()
+        if self.topk:
+            maxk = min(max(self.topk), output.shape[1])
+            hits = output.topk(maxk, dim=1)[1].eq(target.unsqueeze(1))
+            hits = hits.cumsum(dim=1).sum(dim=0)
+            self.topk_correct += hits[[min(k, maxk) - 1 for k in self.topk]]
+        if self.confusion is not None:
+            self.confusion += torch.bincount(
+                target * self.num_classes + pred,
+                minlength=self.num_classes ** 2,
+            ).view(self.num_classes, self.num_classes)
+        if loss is not None:
+            self.loss += loss.detach()
+        self.total += len(target)
+
+    def results(self):
+        """
+        :return: dictionary with computed "mean_accuracy", "mean_loss",
+                 "total_correct", "total_loss" and "total" (number of samples),
+                 plus "mean_accuracy_top<k>" for each "topk" and
+                 "confusion_matrix" when "num_classes" is given
+        :rtype: dict
+        """
+        # Single device to host copy
+        values = torch.cat((self.loss.view(1), self.correct.double().view(1),
+                            self.topk_correct.double())).tolist()
+        loss, correct = values[0], int(values[1])
+        total = self.total
+        results = {
+            "total_correct": correct,
+            "total_loss": loss,
+            "total": total,
+            "mean_loss": loss / total if total > 0 else 0,
+            "mean_accuracy": correct / total if total > 0 else 0,
+        }
+        for k, topk_correct in zip(self.topk, values[2:]):
+            results["mean_accuracy_top{}".format(k)] = \
+                topk_correct / total if total > 0 else 0
+        if self.confusion is not None:
+            results["confusion_matrix"] = self.confusion.cpu().numpy()
+        return results
+
+
+def _evaluate_loader(model, loader, device, metrics, batches_in_epoch, criterion,
+                     progress):
+    async_gpu = loader.pin_memory
+    if progress is not None:
+        loader = tqdm(loader, **progress)
+
     for batch_idx, (data, target) in enumerate(loader):
-        num_images = len(target)
-        t1 = time.time()
         if batch_idx >= batches_in_epoch:
             break
-        if pre_batch_callback is not None:
-            pre_batch_callback(model=model, batch_idx=batch_idx)
-
         data = data.to(device, non_blocking=async_gpu)
         target = target.to(device, non_blocking=async_gpu)
-        optimizer.zero_grad()
-        output = model(data)
-        loss = criterion(output, target)
-        del data, target, output
-
-        t2 = time.time()
-        if use_amp:
-            with amp.scale_loss(loss, optimizer) as scaled_loss:
-                scaled_loss.backward()
-        else:
-            loss.backward()
-
-        t3 = time.time()
-        optimizer.step()
-        t4 = time.time()
 
-        if post_batch_callback is not None:
-            post_batch_callback(model=model, loss=loss.detach(), batch_idx=batch_idx,
-                                num_images=num_images,
-                                times=[t2 - t1, t3 - t2, t4 - t3])
-        del loss
+        output = model(data)
+        metrics.update(output, target, criterion(output, target, reduction="sum"))
 
-    if progress_bar is not None:
-        loader.n = loader.total
+    if progress is not None:
         loader.close()
 
 
@@ -135,6 +402,8 @@ def evaluate_model(
     batches_in_epoch=sys.maxsize,
     criterion=F.nll_loss,
     progress=None,
+    topk=(),
+    num_classes=None,
 ):
     """Evaluate pre-trained model using given test dataset loader.
 
@@ -150,16 +419,100 @@ def evaluate_model(
     :type criterion: function
     :param progress: Optional :class:`tqdm` progress bar args. None for no progress bar
     :type progress: dict or None
+    :param topk: Additional top-k accuracies to compute, i.e. (5,)
+    :type topk: tuple
+    :param num_classes: When given, also compute the confusion matrix
+    :type num_classes: int
 
     :return: dictionary with computed "mean_accuracy", "mean_loss", "total_correct".
+             See :meth:`ClassificationMetrics.results`
     :rtype: dict
     """
+    return evaluate_loaders(
+        model=model,
+        loaders={None: loader},
+        device=device,
+        batches_in_epoch=batches_in_epoch,
+        criterion=criterion,
+        progress=progress,
+        topk=topk,
+        num_classes=num_classes,
+    )[None]
+
+
+def evaluate_loaders(
+    model,
+    loaders,
+    device,
+    batches_in_epoch=sys.maxsize,
+    criterion=F.nll_loss,
+    progress=None,
+    topk=(),
+    num_classes=None,
+):
+    """Evaluate pre-trained model on several test dataset loaders, i.e. one
+    loader per noise level. The metrics for all loaders are kept on the
+    device and only copied to the host once all the loaders are evaluated.
+
+    :param loaders: dict mapping names to test dataset loaders
+    :type loaders: dict
+    :return: dict mapping each loader name to its :func:`evaluate_model`
+             results
+    :rtype: dict
+
+    See :func:`evaluate_model` for the other parameters
+    """
     model.eval()
-    loss = 0
-    correct = 0
-    total = 0
-    async_gpu = loader.pin_memory
+    metrics = {}
+    with torch.no_grad():
+        for name, loader in loaders.items():
+            metrics[name] = ClassificationMetrics(device=device, topk=topk,
+                                                  num_classes=num_classes)
+            _evaluate_loader(model, loader, device, metrics[name],
+                             batches_in_epoch, criterion, progress)
+
+    return {name: m.results() for name, m in metrics.items()}
+
 
+def evaluate_noise(
+    model,
+    loader,
+    device,
+    noise_values,
+    high_value=0.1307 + 2 * 0.3081,
+    low_value=0.1307 + 2 * 0.3081,
+    batches_in_epoch=sys.maxsize,
+    criterion=F.nll_loss,
+    progress=None,
+    topk=(),
+    seed=None,
+):
+    """Evaluate pre-trained model robustness to noise. Every clean batch
+    produced by the loader is copied to the device once and evaluated at all
+    noise levels, generating the noise on the device. See
+    :meth:`RandomNoise.apply_batch`.
+
+    :param loader: clean test dataset loader
+    :type loader: :class:`torch.utils.data.DataLoader`
+    :param noise_values: list of noise levels (from 0 to 1) to evaluate
+    :type noise_values: list
+    :param high_value: Noise high value. See :class:`RandomNoise`
+    :param low_value: Noise low value. See :class:`RandomNoise`
+    :param seed: Optional noise seed. When given, the noise added to each image
+                 only depends on the seed and the image position in the loader
+    :type seed: int
+    :return: dict mapping each noise level to its :func:`evaluate_model` results
+    :rtype: dict
+
+    See :func:`evaluate_model` for the other parameters
+    """
+    model.eval()
+    async_gpu = loader.pin_memory
+    metrics = {noise: ClassificationMetrics(device=device, topk=topk)
+               for noise in noise_values}
+    transforms = {noise: RandomNoise(noise, high_value=high_value,
+                                     low_value=low_value, seed=seed)
+                  for noise in noise_values}
     if progress is not None:
         loader = tqdm(loader, **progress)
 
@@ -170,20 +523,18 @@ def evaluate_model(
             data = data.to(device, non_blocking=async_gpu)
             target = target.to(device, non_blocking=async_gpu)
 
-            output = model(data)
-            loss += criterion(output, target, reduction="sum").item()
-            pred = output.max(1, keepdim=True)[1]
-            correct += pred.eq(target.view_as(pred)).sum().item()
-            total += len(data)
+            for noise in noise_values:
+                noisy = data
+                if noise > 0.0:
+                    noisy = transforms[noise].apply_batch(data.clone())
+                output = model(noisy)
+                metrics[noise].update(output, target,
+                                      criterion(output, target, reduction="sum"))
 
     if progress is not None:
         loader.close()
 
-    return {
-        "total_correct": correct,
-        "mean_loss": loss / total if total > 0 else 0,
-        "mean_accuracy": correct / total if total > 0 else 0,
-    }
+    return {noise: m.results() for noise, m in metrics.items()}
 
 
 def set_random_seed(seed, deterministic_mode=True):
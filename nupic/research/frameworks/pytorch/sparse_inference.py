@@ -0,0 +1,256 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+"""
+Compressed sparse inference for networks with sparse weights.
+
+:func:`export_sparse_model` replaces the :class:`torch.nn.Linear` and
+:class:`torch.nn.Conv2d` layers whose weights are mostly zero with
+:class:`SparseLinear` and :class:`SparseConv2d`. The weights are stored in
+compressed sparse column format and only the non-zero weights are used during
+inference. When the input to a linear layer is sparse, for instance the output
+of a k-winners layer, only the weight columns of the non-zero inputs are used.
+
+Call :func:`remove_batchnorm` before exporting models with batch norm.
+"""
+import copy
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class CompressedWeight(nn.Module):
+    """
+    Sparse weight matrix (out_features, in_features) stored in compressed
+    sparse column format.
+
+    :param weight: dense weight matrix
+    :param activation_density: Only multiply the weight columns of the
+                               non-zero inputs when the fraction of inputs that
+                               are non-zero in any sample of the batch is at
+                               most this value
+    """
+
+    def __init__(self, weight, activation_density=0.1):
+        super(CompressedWeight, self).__init__()
+        self.out_features, self.in_features = weight.shape
+        self.activation_density = activation_density
+
+        weight = weight.detach()
+        cols, rows = weight.t().nonzero().t()
+        counts = torch.bincount(cols, minlength=self.in_features)
+        col_ptr = torch.zeros(self.in_features + 1, dtype=torch.long)
+        col_ptr[1:] = counts.cumsum(0)
+        self.register_buffer("col_ptr", col_ptr)
+        self.register_buffer("row_idx", rows.int())
+        self.register_buffer("values", weight[rows, cols].clone())
+        self._matrix = None
+
+    @property
+    def nnz(self):
+        return self.values.numel()
+
+    def _apply(self, fn):
+        self._matrix = None
+        return super(CompressedWeight, self)._apply(fn)
+
+    def matrix(self):
+        """
+        Weights as a :mod:`torch.sparse` matrix used with dense inputs. Uses
+        the CSR layout when available, otherwise COO.
+        """
+        if self._matrix is None:
+            cols = torch.arange(self.in_features, device=self.col_ptr.device)
+            cols = cols.repeat_interleave(self.col_ptr[1:] - self.col_ptr[:-1])
+            indices = torch.stack((self.row_idx.long(), cols))
+            matrix = torch.sparse_coo_tensor(
+                indices, self.values, (self.out_features, self.in_features)
+            ).coalesce()
+            if hasattr(matrix, "to_sparse_csr"):
+                matrix = matrix.to_sparse_csr()
+            self._matrix = matrix
+        return self._matrix
+
+    def forward(self, x):
+        """
+        Compute ``x @ weight.t()`` for a 2D input (batch, in_features)
+        """
+        active = x.ne(0).any(dim=0)
+        if int(active.sum()) > self.activation_density * self.in_features:
+            return self.dense_input_mm(x.t()).t()
+
+        # Only use the weight columns of the non-zero inputs
+        active = active.nonzero().view(-1)
+        start = self.col_ptr[active]
+        count = self.col_ptr[active + 1] - start
+        offset = torch.arange(int(count.sum()), device=x.device)
+        offset -= (count.cumsum(0) - count).repeat_interleave(count)
+        offset += start.repeat_interleave(count)
+        cols = torch.arange(len(active), device=x.device).repeat_interleave(count)
+        inputs = x.t().index_select(0, active)
+        out = x.new_zeros(self.out_features, len(x))
+        out.index_add_(0, self.row_idx[offset].long(),
+                       inputs[cols] * self.values[offset].unsqueeze(1))
+        return out.t()
+
+    def dense_input_mm(self, x):
+        """
+        Compute ``weight @ x`` for a dense 2D input (in_features, batch)
+        """
+        x = x.contiguous()
+        if self.matrix().layout == torch.sparse_coo:
+            return torch.sparse.mm(self.matrix(), x)
+        return self.matrix().matmul(x)
+
+    def extra_repr(self):
+        return "out_features={}, in_features={}, nnz={}".format(
+            self.out_features, self.in_features, self.nnz)
+
+
+class SparseLinear(nn.Module):
+    """
+    Inference only replacement for :class:`torch.nn.Linear` with sparse weights.
+
+    :param linear: :class:`torch.nn.Linear` to convert
+    :param activation_density: See :class:`CompressedWeight`
+    """
+
+    def __init__(self, linear, activation_density=0.1):
+        super(SparseLinear, self).__init__()
+        self.in_features = linear.in_features
+        self.out_features = linear.out_features
+        self.weight = CompressedWeight(linear.weight,
+                                       activation_density=activation_density)
+        if linear.bias is not None:
+            self.register_buffer("bias", linear.bias.detach().clone())
+        else:
+            self.bias = None
+
+    def forward(self, x):
+        shape = x.shape[:-1]
+        out = self.weight(x.reshape(-1, self.in_features))
+        if self.bias is not None:
+            out += self.bias
+        return out.view(shape + (self.out_features,))
+
+
+class SparseConv2d(nn.Module):
+    """
+    Inference only replacement for :class:`torch.nn.Conv2d` with sparse
+    weights. The input patches are extracted with
+    :func:`torch.nn.functional.unfold` (im2col) and multiplied by the sparse
+    weight matrix.
+    Only supports zero padding and ``groups=1``.
+
+    :param conv: :class:`torch.nn.Conv2d` to convert
+    """
+
+    def __init__(self, conv):
+        super(SparseConv2d, self).__init__()
+        assert conv.groups == 1, "Grouped convolutions are not supported"
+        assert conv.padding_mode == "zeros", "Only zero padding is supported"
+        self.in_channels = conv.in_channels
+        self.out_channels = conv.out_channels
+        self.kernel_size = conv.kernel_size
+        self.stride = conv.stride
+        self.padding = conv.padding
+        self.dilation = conv.dilation
+        self.weight = CompressedWeight(conv.weight.reshape(self.out_channels, -1))
+        if conv.bias is not None:
+            self.register_buffer("bias", conv.bias.detach().clone())
+        else:
+            self.bias = None
+
+    def output_size(self, height, width):
+        size = []
+        for i, dim in enumerate((height, width)):
+            size.append((dim + 2 * self.padding[i]
+                         - self.dilation[i] * (self.kernel_size[i] - 1) - 1)
+                        // self.stride[i] + 1)
+        return size
+
+    def forward(self, x):
+        batch_size = x.shape[0]
+        height, width = self.output_size(*x.shape[2:])
+        columns = F.unfold(x, self.kernel_size, dilation=self.dilation,
+                           padding=self.padding, stride=self.stride)
+        # The inputs of every output location are rarely all zero, so the
+        # activation sparsity is not used here
+        columns = columns.transpose(0, 1).reshape(columns.shape[1], -1)
+        out = self.weight.dense_input_mm(columns)
+        out = out.view(self.out_channels, batch_size, -1).transpose(0, 1)
+        out = out.reshape(batch_size, self.out_channels, height, width)
+        if self.bias is not None:
+            out += self.bias.view(-1, 1, 1)
+        return out
+
+    def extra_repr(self):
+        return "{}, {}, kernel_size={}, stride={}, padding={}".format(
+            self.in_channels, self.out_channels, self.kernel_size, self.stride,
+            self.padding)
+
+
+def _convert(module, min_sparsity, activation_density):
+    if not isinstance(module, (nn.Linear, nn.Conv2d)):
+        return None
+    sparsity = float(module.weight.eq(0).sum()) / module.weight.numel()
+    if sparsity < min_sparsity:
+        return None
+
+    if isinstance(module, nn.Linear):
+        return SparseLinear(module, activation_density=activation_density)
+    if module.groups == 1 and module.padding_mode == "zeros":
+        return SparseConv2d(module)
+    return None
+
+
+def export_sparse_model(model, min_sparsity=0.5, activation_density=0.1):
+    """
+    Return a copy of the model for CPU inference where every linear and conv
+    layer with at least ``min_sparsity`` zero weights is replaced by its
+    compressed sparse version.
+
+    :param model: Model to export. Use :func:`remove_batchnorm` first
+    :param min_sparsity: Minimum fraction of zero weights required to convert
+                         a layer
+    :param activation_density: See :class:`CompressedWeight`
+    :return: The exported model in eval mode
+    """
+    model = copy.deepcopy(model).cpu().eval()
+
+    def replace(parent):
+        for name, child in parent.named_children():
+            sparse = _convert(child, min_sparsity, activation_density)
+            if sparse is None:
+                replace(child)
+            else:
+                setattr(parent, name, sparse)
+
+    with torch.no_grad():
+        replace(model)
+    return model
+
+
+def model_nbytes(model):
+    """
+    Number of bytes used by the model parameters and buffers
+    """
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
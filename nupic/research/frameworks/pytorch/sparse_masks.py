@@ -0,0 +1,125 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+"""
+Random sparse masks and weight indices with an exact number of non-zeros.
+
+The indices of every row are sampled on the target device by selecting the
+largest of a set of random keys, without enumerating the index space. Pass a
+:class:`torch.Generator` (on the same device) to sample reproducible masks.
+"""
+import math
+
+import torch
+
+
+def random_row_indices(rows, cols, k, device=None, generator=None):
+    """
+    Sample ``k`` distinct column indices in ``range(cols)`` for every row.
+
+    :param rows: Number of rows
+    :param cols: Number of columns
+    :param k: Number of indices per row
+    :param device: Device of the returned tensor
+    :param generator: Optional random number generator
+    :return: LongTensor (rows, k) with the unsorted indices of every row
+    """
+    k = min(max(k, 0), cols)
+    keys = torch.rand(rows, cols, device=device, generator=generator)
+    return keys.topk(k, dim=1, sorted=False)[1]
+
+
+def random_mask(shape, num_nonzeros, dim=None, device=None, generator=None):
+    """
+    Random boolean mask with exactly ``num_nonzeros`` True values.
+
+    :param shape: Mask shape
+    :param num_nonzeros: Number of True values in the mask, or in every slice
+                         ``mask.select(dim, i)`` when dim is not None
+    :param dim: None to sample the whole mask at once, otherwise the dimension
+                sampled independently, usually 0 (output units)
+    :param device: Device of the returned mask
+    :param generator: Optional random number generator
+    :return: boolean tensor with the given shape
+    """
+    shape = torch.Size(shape)
+    if dim is None:
+        rows_shape = (1, shape.numel())
+    else:
+        shape = list(shape)
+        shape[0], shape[dim] = shape[dim], shape[0]
+        rows_shape = (shape[0], int(torch.Size(shape[1:]).numel()))
+
+    mask = torch.zeros(rows_shape, dtype=torch.bool, device=device)
+    indices = random_row_indices(*rows_shape, num_nonzeros, device=device,
+                                 generator=generator)
+    mask.scatter_(1, indices, True)
+    mask = mask.view(shape)
+    if dim is not None and dim != 0:
+        mask = mask.transpose(0, dim).contiguous()
+    return mask
+
+
+def rows_to_weight_indices(input_indices):
+    """
+    Convert the (output_size, n) input indices of every output unit to the
+    (2, output_size * n) output and input weight indices
+    """
+    output_size, n = input_indices.shape
+    output_indices = torch.arange(output_size, device=input_indices.device)
+    output_indices = output_indices.view(-1, 1).expand(output_size, n)
+    return torch.stack((output_indices.reshape(-1), input_indices.reshape(-1)))
+
+
+def random_block_zero_indices(output_size, input_size, num_zeros, num_zero_blocks,
+                              block_size=64, group_size=1, device=None,
+                              generator=None):
+    """
+    Sample ``num_zeros`` zero inputs for every output unit such that
+    ``num_zero_blocks`` whole blocks of ``block_size`` consecutive inputs are
+    zero. The last block is shorter when input_size is not a multiple of
+    block_size. The remaining zeros are sampled from the inputs of the other
+    blocks.
+
+    :param output_size: Number of output units
+    :param input_size: Number of inputs of every output unit
+    :param num_zeros: Number of zero inputs per output unit
+    :param num_zero_blocks: Number of all zero blocks per output unit
+    :param block_size: Number of consecutive inputs in a block
+    :param group_size: Consecutive groups of output units sharing the same
+                       zero blocks
+    :param device: Device of the returned tensor
+    :param generator: Optional random number generator
+    :return: LongTensor (output_size, num_zeros) with the sorted zero inputs of
+             every output unit
+    """
+    num_blocks = math.ceil(input_size / block_size)
+    num_groups = math.ceil(output_size / group_size)
+    zero_blocks = random_mask((num_groups, num_blocks), num_zero_blocks, dim=0,
+                              device=device, generator=generator)
+    zero_blocks = zero_blocks.repeat_interleave(group_size, dim=0)[:output_size]
+    blocks = torch.arange(input_size, device=zero_blocks.device) // block_size
+    zero_block_inputs = zero_blocks[:, blocks]
+
+    # Keys above 1 always select the inputs of the zero blocks first
+    keys = torch.rand(output_size, input_size, device=device, generator=generator)
+    keys.masked_fill_(zero_block_inputs, 2.0)
+    num_zeros = min(max(num_zeros, 0), input_size)
+    zeros = keys.topk(num_zeros, dim=1, sorted=False)[1]
+    return zeros.sort(dim=1)[0]
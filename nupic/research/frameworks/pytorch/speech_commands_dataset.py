@@ -32,8 +32,14 @@ import pickle
 
 import librosa
 import numpy as np
+import torch
 from torch.utils.data import Dataset
 
+from nupic.research.frameworks.pytorch.dataset_utils import (
+    FeatureCache,
+    describe_transform,
+)
+
 __all__ = [
     "CLASSES",
     "SpeechCommandsDataset",
@@ -47,6 +53,23 @@ CLASSES = tuple(
 )
 
 
+def balanced_class_weights(targets, nclasses):
+    """
+    Compute the sample weights used to balance the classes with
+    :class:`torch.utils.data.WeightedRandomSampler`.
+
+    adopted from https://discuss.pytorch.org/t/balanced-sampling-between-classes-with-torchvision-dataloader/2703/3.  # noqa: E501
+
+    :param targets: Vector with the target class of every sample
+    :param nclasses: Number of classes
+    :return: Vector with the weight of every sample
+    """
+    targets = np.asarray(targets, dtype=np.int64)
+    count = np.bincount(targets, minlength=nclasses) + 1.0
+    weight_per_class = count.sum() / count
+    return weight_per_class[targets]
+
+
 class SpeechCommandsDataset(Dataset):
     """Google speech commands dataset. Only labels in CLASSES, plus silence,
     are treated as known classes. All other classes are used as 'unknown'
@@ -54,6 +77,30 @@ class SpeechCommandsDataset(Dataset):
 
     Similar to the Kaggle challenge here:
     https://www.kaggle.com/c/tensorflow-speech-recognition-challenge
+
+    Deterministic transforms, i.e. :class:`FixAudioLength` and
+    :class:`ToMelSpectrogram`, can be given as ``cached_transform``. Their
+    results are cached by file, see :class:`FeatureCache`, and only the
+    stochastic ``transform`` applied after them is recomputed on every epoch.
+    The decoded audio files are cached as well when the cache has a disk level.
+    Use :meth:`cache_stats` from the training loop to report the cache hit rate.
+
+    The default cache is kept in memory. Each DataLoader worker has its own copy
+    of it, discarded at the end of every epoch unless the workers are persistent,
+    so use ``num_workers=0`` or pass a :class:`FeatureCache` with a
+    ``cache_dir`` shared by the workers.
+
+    :param folder: Dataset root directory
+    :param transform: Transform applied to every item, after ``cached_transform``
+    :param classes: List of classes to load. See CLASSES for valid options
+    :param silence_percentage: Percentage of the dataset to be filled with silence
+    :param sample_rate: Audio sample rate
+    :param cached_transform: Optional deterministic transform applied to every
+                             item before ``transform``. Its results are cached
+    :param cache: Optional :class:`FeatureCache` used to cache the
+                  ``cached_transform`` results, and the decoded audio when it
+                  has a ``cache_dir``. Defaults to an in memory cache when
+                  ``cached_transform`` is given
     """
 
     def __init__(
@@ -63,7 +110,15 @@ class SpeechCommandsDataset(Dataset):
         classes=CLASSES,
         silence_percentage=0.1,
         sample_rate=16000,
+        cached_transform=None,
+        cache=None,
     ):
+        if cache is None and cached_transform is not None:
+            cache = FeatureCache()
+        self.cache = cache
+        self.cached_transform = cached_transform
+        self._cached_transform_key = describe_transform(cached_transform)
+
         all_classes = [
             d
             for d in os.listdir(folder)
@@ -78,24 +133,30 @@ class SpeechCommandsDataset(Dataset):
                 print("Class ", c, "assigned as unknown")
                 class_to_idx[c] = 0
         data = []
+        keys = []
         for c in all_classes:
             d = os.path.join(folder, c)
             target = class_to_idx[c]
             for f in os.listdir(d):
                 path = os.path.join(d, f)
-                samples, sample_rate = librosa.load(path, sr=sample_rate)
+                key = FeatureCache.file_key(path, sample_rate)
+                samples = self._load_audio(key, path, sample_rate)
                 audio = {"samples": samples, "sample_rate": sample_rate}
                 data.append((audio, target))
+                keys.append(key)
 
         # add silence
         target = class_to_idx["silence"]
         samples = np.zeros(sample_rate, dtype=np.float32)
         silence = {"samples": samples, "sample_rate": sample_rate}
-        data += [(silence, target)] * int(len(data) * silence_percentage)
+        num_silence = int(len(data) * silence_percentage)
+        data += [(silence, target)] * num_silence
+        keys += [FeatureCache.file_key(None, sample_rate)] * num_silence
 
         self.classes = classes
         self.data = data
         self.transform = transform
+        self._keys = keys
 
     def __len__(self):
         return len(self.data)
@@ -108,6 +169,13 @@ class SpeechCommandsDataset(Dataset):
         :rtype: tuple[dict, int]
         """
         data, target = self.data[index]
+        if self.cached_transform is not None:
+            key = FeatureCache.make_key(self._keys[index],
+                                        self._cached_transform_key)
+            data = self.cache.get_or_compute(
+                key, lambda: self.cached_transform(dict(data)))
+        # Transforms update the data in place, never modify the cached data
+        data = dict(data)
         if self.transform is not None:
             data = self.transform(data)
 
@@ -115,19 +183,28 @@ class SpeechCommandsDataset(Dataset):
 
     def make_weights_for_balanced_classes(self):
         """
-        adopted from https://discuss.pytorch.org/t/balanced-sampling-between-classes-with-torchvision-dataloader/2703/3.  # noqa: E501
+        See :func:`balanced_class_weights`
+        """
+        targets = np.fromiter((item[1] for item in self.data), dtype=np.int64,
+                              count=len(self.data))
+        return balanced_class_weights(targets, len(self.classes))
+
+    def cache_stats(self):
         """
-        nclasses = len(self.classes)
-        count = np.ones(nclasses)
-        for item in self.data:
-            count[item[1]] += 1
+        :return: the cache hit rates and time saved, see :meth:`FeatureCache.stats`
+        """
+        if self.cache is None:
+            return {}
+        return self.cache.stats()
+
+    def _load_audio(self, key, path, sample_rate):
+        def load():
+            return librosa.load(path, sr=sample_rate)[0]
 
-        n = float(sum(count))
-        weight_per_class = n / count
-        weight = np.zeros(len(self))
-        for idx, item in enumerate(self.data):
-            weight[idx] = weight_per_class[item[1]]
-        return weight
+        # The decoded audio is kept in self.data, only cache it on disk
+        if self.cache is None or self.cache.cache_dir is None:
+            return load()
+        return self.cache.get_or_compute(FeatureCache.make_key(key, "load"), load)
 
 
 class BackgroundNoiseDataset(Dataset):
@@ -175,22 +252,39 @@ class PreprocessedSpeechDataset(Dataset):
     already applied.
 
     Use the 'process_dataset.py' script to create preprocessed dataset
+
+    By default the items are the preprocessed ``(audio, target)`` tuples. When
+    ``columnar=True`` the ``input_key`` tensor of every preprocessed audio is
+    stacked into a single contiguous tensor, :attr:`inputs`, along with the
+    target vector, :attr:`targets`. In this mode the dataset also accepts a list
+    of indices, returning a whole batch at once. Use
+    :func:`nupic.research.frameworks.pytorch.dataset_utils.create_batch_loader`
+    to load batches directly, bypassing per item indexing and collation.
     """
 
-    def __init__(self, root, subset, classes=CLASSES, silence_percentage=0.1):
+    def __init__(self, root, subset, classes=CLASSES, silence_percentage=0.1,
+                 columnar=False, input_key="input"):
         """
         :param root: Dataset root directory
         :param subset: Which dataset subset to use ("train", "test", "valid", "noise")
         :param classes: List of classes to load. See CLASSES for valid options
         :param silence_percentage: Percentage of the dataset to be filled with silence
+        :param columnar: Whether to keep the dataset as one input tensor plus a
+                         target vector instead of a list of items
+        :param input_key: Key of the preprocessed audio tensor used as input when
+                          ``columnar=True``
         """
         self.classes = classes
 
         self._root = root
         self._subset = subset
         self._silence_percentage = silence_percentage
+        self._columnar = columnar
+        self._input_key = input_key
 
         self.data = None
+        self.inputs = None
+        self.targets = None
 
         # Circular list of all epochs in this dataset
         epochs = sorted(int(e) for e in os.listdir(root) if e.isdigit())
@@ -200,22 +294,25 @@ class PreprocessedSpeechDataset(Dataset):
         self.next_epoch()
 
     def __len__(self):
-        return len(self.data)
+        return len(self.targets)
 
     def __getitem__(self, index):
         """Get item from dataset.
 
-        :param index: index in the dataset
+        :param index: index in the dataset. When ``columnar=True`` it can also
+                      be a list or tensor of indices
         :return: (audio, target) where target is index of the target class.
         :rtype: tuple[dict, int]
         """
+        if self._columnar:
+            return self.inputs[index], self.targets[index]
         return self.data[index]
 
     def next_epoch(self):
         """Load next epoch from disk."""
         epoch = next(self._all_epochs)
         folder = os.path.join(self._root, str(epoch), self._subset)
-        self.data = []
+        commands = []
         silence = None
 
         gc.disable()
@@ -230,31 +327,38 @@ class PreprocessedSpeechDataset(Dataset):
                 silence = audio
             else:
                 target = self.classes.index(os.path.basename(command))
-                self.data.extend(itertools.product(audio, [target]))
+                commands.append((audio, target))
 
         gc.enable()
 
-        target = self.classes.index("silence")
-        self.data += [(silence, target)] * int(
-            len(self.data) * self._silence_percentage
-        )
+        num_samples = sum(len(audio) for audio, _ in commands)
+        num_silence = int(num_samples * self._silence_percentage)
+        silence_target = self.classes.index("silence")
+
+        targets = [np.full(len(audio), target, dtype=np.int64)
+                   for audio, target in commands]
+        targets.append(np.full(num_silence, silence_target, dtype=np.int64))
+        self.targets = torch.from_numpy(np.concatenate(targets))
+
+        if self._columnar:
+            key = self._input_key
+            inputs = [item[key] for audio, _ in commands for item in audio]
+            inputs += [silence[key]] * num_silence
+            self.inputs = torch.stack(inputs)
+            self.data = None
+        else:
+            self.data = [(item, target) for audio, target in commands
+                         for item in audio]
+            self.data += [(silence, silence_target)] * num_silence
+            self.inputs = None
+
         return epoch
 
     def make_weights_for_balanced_classes(self):
         """
-        adopted from https://discuss.pytorch.org/t/balanced-sampling-between-classes-with-torchvision-dataloader/2703/3.  # noqa E501
+        See :func:`balanced_class_weights`
         """
-        nclasses = len(self.classes)
-        count = np.ones(nclasses)
-        for item in self.data:
-            count[item[1]] += 1
-
-        n = float(sum(count))
-        weight_per_class = n / count
-        weight = np.zeros(len(self.data))
-        for idx, item in enumerate(self.data):
-            weight[idx] = weight_per_class[item[1]]
-        return weight
+        return balanced_class_weights(self.targets.numpy(), len(self.classes))
 
     @staticmethod
     def is_valid(folder, epoch=0):
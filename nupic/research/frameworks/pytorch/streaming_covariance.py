@@ -0,0 +1,159 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+"""
+Streaming mean and covariance of the features of a sequence of batches.
+
+The statistics are updated batch by batch on the device of the inputs, merging
+the moments of every batch with the running moments (Chan et al.), which is
+numerically stable without keeping the inputs. Three modes trade accuracy for
+memory on very wide layers:
+
+- ``full``: exact (n, n) co-moment matrix
+- ``diagonal``: exact variances only, O(n) memory
+- ``lowrank``: exact variances and a Frequent Directions sketch of the
+  co-moment matrix with ``2 * rank`` rows, O(rank * n) memory
+"""
+import math
+
+import torch
+
+COVARIANCE_MODES = ("full", "diagonal", "lowrank")
+
+
+class StreamingCovariance(object):
+    """
+    Accumulate the mean and covariance of the features of every batch.
+
+    :param mode: One of :data:`COVARIANCE_MODES`
+    :param rank: Rank of the sketch in ``lowrank`` mode
+    :param dtype: Precision of the accumulated moments
+    """
+
+    def __init__(self, mode="full", rank=64, dtype=torch.float32):
+        if mode not in COVARIANCE_MODES:
+            raise ValueError("Unknown covariance mode: {}".format(mode))
+        self.mode = mode
+        self.rank = rank
+        self.dtype = dtype
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = None
+        self.m2_diag = None
+        self.m2 = None
+        self.sketch = None
+
+    def update(self, x):
+        """
+        Add a batch of samples.
+
+        :param x: Tensor (batch, ...). Every sample is flattened to a vector of
+                  features
+        """
+        batch_size = x.shape[0]
+        if batch_size == 0:
+            return
+        x = x.detach().reshape(batch_size, -1).to(self.dtype)
+
+        batch_mean = x.mean(dim=0)
+        centered = x - batch_mean
+        if self.count == 0:
+            num_features = x.shape[1]
+            self.mean = torch.zeros_like(batch_mean)
+            self.m2_diag = torch.zeros_like(batch_mean)
+            if self.mode == "full":
+                self.m2 = x.new_zeros(num_features, num_features)
+            elif self.mode == "lowrank":
+                self.sketch = x.new_zeros(0, num_features)
+
+        count = self.count + batch_size
+        delta = batch_mean - self.mean
+        correction = self.count * batch_size / count
+
+        self.mean += delta * (batch_size / count)
+        self.m2_diag += centered.pow(2).sum(dim=0) + delta.pow(2) * correction
+        if self.mode == "full":
+            self.m2 += centered.t().mm(centered)
+            self.m2 += torch.ger(delta, delta) * correction
+        elif self.mode == "lowrank":
+            rows = (self.sketch, centered,
+                    (delta * math.sqrt(correction)).unsqueeze(0))
+            self.sketch = torch.cat(rows)
+            if self.sketch.shape[0] > 2 * self.rank:
+                self._shrink_sketch()
+        self.count = count
+
+    def _shrink_sketch(self):
+        """Frequent Directions: keep the top rank directions of the sketch"""
+        _, s, v = torch.svd(self.sketch)
+        s2 = s.pow(2)
+        shrink = s2[self.rank] if len(s2) > self.rank else s2.new_zeros(())
+        s = (s2[:self.rank] - shrink).clamp(min=0).sqrt()
+        self.sketch = s.unsqueeze(1) * v[:, :self.rank].t()
+
+    def _check_samples(self):
+        if self.count == 0:
+            raise ValueError("No samples were accumulated")
+
+    def variance(self):
+        """Population variance of every feature"""
+        self._check_samples()
+        return self.m2_diag / self.count
+
+    def covariance(self):
+        """
+        Population covariance matrix. Approximate in ``lowrank`` mode, except
+        for the diagonal. Not available in ``diagonal`` mode
+        """
+        if self.mode == "diagonal":
+            raise ValueError("The covariance matrix is not tracked in "
+                             "diagonal mode")
+        self._check_samples()
+        if self.mode == "full":
+            return self.m2 / self.count
+        cov = self.sketch.t().mm(self.sketch) / self.count
+        cov.diagonal().copy_(self.variance())
+        return cov
+
+    def correlation(self):
+        """Pearson correlation matrix. See :meth:`covariance`"""
+        std = self.variance().sqrt()
+        return self.covariance() / torch.ger(std, std).clamp(min=1e-12)
+
+    def off_diagonal_sum_of_squares(self):
+        """
+        Sum of the squares of the covariances between distinct features,
+        counting every pair once. Computed from the ``2 * rank`` rows of the
+        sketch in ``lowrank`` mode, without forming the covariance matrix
+        """
+        if self.mode == "diagonal":
+            raise ValueError("The covariance matrix is not tracked in "
+                             "diagonal mode")
+        self._check_samples()
+        if self.mode == "full":
+            cov = self.covariance()
+            total = cov.pow(2).sum() - cov.diagonal().pow(2).sum()
+        else:
+            # ||S^T S||_F = ||S S^T||_F
+            sketch = self.sketch / math.sqrt(self.count)
+            gram = sketch.mm(sketch.t())
+            total = gram.pow(2).sum() - sketch.pow(2).sum(dim=0).pow(2).sum()
+        return total / 2
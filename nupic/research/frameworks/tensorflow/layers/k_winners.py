@@ -87,19 +87,12 @@ def compute_kwinners(x, k, duty_cycles, boost_strength):
 
     # Take the boosted version of the input x, find the top k winners.
     # Compute an output that contains the values of x corresponding to the top k
-    # boosted values
+    # boosted values. Units tied with the k-th largest boosted value are kept
     boosted = tf.reshape(boosted, [batch_size, -1])
     flat_x = tf.reshape(x, [batch_size, -1])
-    top_k, indices = tf.math.top_k(input=boosted, k=k, sorted=False)
-    dim_range = tf.expand_dims(tf.range(0, tf.shape(indices)[0]), 1)
-    dim_range = tf.tile(dim_range, [1, k])
-    full_indices = tf.concat(
-        [tf.expand_dims(dim_range, -1), tf.expand_dims(indices, -1)], axis=2
-    )
-    full_indices = tf.reshape(full_indices, [-1, 2])
-
-    updates = tf.gather_nd(params=flat_x, indices=full_indices)
-    res = tf.scatter_nd(indices=full_indices, updates=updates, shape=flat_x.shape)
+    top_k, _ = tf.math.top_k(input=boosted, k=k, sorted=False)
+    threshold = tf.reduce_min(top_k, axis=1, keepdims=True)
+    res = tf.where(boosted >= threshold, flat_x, tf.zeros_like(flat_x))
     return tf.reshape(res, x.shape)
 
 
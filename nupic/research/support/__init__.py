@@ -19,3 +19,4 @@
 #
 from .parse_config import parse_config
 from .ray_utils import load_ray_tune_experiment, load_ray_tune_experiments
+from .results_loader import load_trial_results
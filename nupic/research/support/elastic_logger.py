@@ -17,18 +17,26 @@
 #
 #  http://numenta.org/licenses/
 #
+import functools
+import json
+import logging
 import os
+import queue
 import re
 import subprocess
+import threading
+import time
 from datetime import datetime
 
 from elasticsearch import Elasticsearch, helpers
 from elasticsearch.client.xpack import SqlClient
-from elasticsearch.helpers import BulkIndexError
+from elasticsearch.exceptions import TransportError
 from pandas import DataFrame
 from pandas.io.json import json_normalize
 from ray.tune.logger import Logger
 
+logger = logging.getLogger(__name__)
+
 
 def create_elastic_client(**kwargs):
     """
@@ -60,6 +68,269 @@ def create_elastic_client(**kwargs):
     return Elasticsearch(**elasticsearch_args)
 
 
+@functools.lru_cache(maxsize=None)
+def _git_info(cwd):
+    def git(*args):
+        return subprocess.check_output(
+            ("git",) + args, cwd=cwd).decode("ascii").strip()
+
+    return dict(
+        remote=git("ls-remote", "--get-url"),
+        branch=git("rev-parse", "--abbrev-ref", "HEAD"),
+        sha=git("rev-parse", "HEAD"),
+        user=git("log", "-n", "1", "--pretty=format:%an"),
+        root=git("rev-parse", "--show-toplevel"),
+    )
+
+
+def get_git_info():
+    """
+    Return the last git commit information of the current working directory.
+    The information is computed once per process and directory.
+
+    :return: dictionary with the git "remote", "branch", "sha", "user" and
+             repository "root"
+    :rtype: dict
+    """
+    return dict(_git_info(os.getcwd()))
+
+
+def _json_default(obj):
+    # numpy scalars and arrays
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    return str(obj)
+
+
+class ElasticsearchShipper(object):
+    """
+    Ship bulk actions to elasticsearch from a background thread without
+    blocking the caller.
+
+    The actions are queued in a bounded queue and sent in batches, whenever the
+    batch reaches ``batch_size`` actions or ``batch_bytes`` bytes, or when
+    ``flush_interval`` seconds passed since the first queued action. Failed
+    batches are retried with exponential backoff. Batches that still fail and
+    actions that do not fit in the queue are appended to a local journal file,
+    which is replayed after the next successful batch.
+
+    :param client: Configured elasticsearch client.
+                   See :func:`create_elastic_client`
+    :type client: :class:`elasticsearch.Elasticsearch`
+    :param journal: Path of the append-only spill journal (JSON lines).
+                    None to drop the actions that could not be shipped
+    :type journal: str
+    :param max_queue_size: Maximum number of queued actions
+    :type max_queue_size: int
+    :param batch_size: Maximum number of actions per bulk request
+    :type batch_size: int
+    :param batch_bytes: Maximum (approximate) size of a bulk request in bytes
+    :type batch_bytes: int
+    :param flush_interval: Maximum time in seconds an action waits in the queue
+    :type flush_interval: float
+    :param max_retries: Number of times a failed batch is retried
+    :type max_retries: int
+    :param backoff: Initial backoff in seconds, doubled after every retry
+    :type backoff: float
+    :param max_backoff: Maximum backoff in seconds
+    :type max_backoff: float
+    """
+
+    def __init__(self, client, journal=None, max_queue_size=10000, batch_size=500,
+                 batch_bytes=5 * 1024 * 1024, flush_interval=5.0, max_retries=3,
+                 backoff=1.0, max_backoff=30.0):
+        self.client = client
+        self.journal = journal
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.journal_lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.pending = 0
+        self.idle = threading.Condition()
+
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name="ElasticsearchShipper")
+        self.thread.start()
+
+    def put(self, action):
+        """
+        Queue a bulk action without blocking. When the queue is full the action
+        is appended to the journal.
+        """
+        with self.idle:
+            self.pending += 1
+        try:
+            self.queue.put_nowait(action)
+        except queue.Full:
+            self._spill([action])
+            self._done(1)
+
+    def flush(self, timeout=None):
+        """
+        Send the queued actions now.
+
+        :param timeout: Seconds to wait for the queued actions to be shipped or
+                        spilled. 0 to return immediately, None to wait forever
+        :return: True if all queued actions were shipped or spilled
+        """
+        self.flush_event.set()
+        if timeout == 0:
+            return self.pending == 0
+        with self.idle:
+            return self.idle.wait_for(lambda: self.pending == 0, timeout)
+
+    def close(self, timeout=None):
+        """
+        Ship the remaining actions and stop the background thread. Actions that
+        were not shipped before the timeout are appended to the journal.
+        """
+        self.stop_event.set()
+        self.flush_event.set()
+        self.thread.join(timeout)
+        # Also covers a background thread that stopped unexpectedly
+        actions = self._drain()
+        self._spill(actions)
+        self._done(len(actions))
+
+    def _done(self, count):
+        with self.idle:
+            self.pending -= count
+            self.idle.notify_all()
+
+    def _drain(self):
+        actions = []
+        while True:
+            try:
+                actions.append(self.queue.get_nowait())
+            except queue.Empty:
+                return actions
+
+    def _next_batch(self):
+        """
+        Wait for the next batch of actions. Returns an empty batch when a flush
+        was requested or the shipper is stopping and the queue is empty
+        """
+        batch = []
+        size = 0
+        deadline = None
+        while len(batch) < self.batch_size and size < self.batch_bytes:
+            flushing = self.flush_event.is_set() or self.stop_event.is_set()
+            try:
+                if flushing:
+                    action = self.queue.get_nowait()
+                else:
+                    timeout = 0.1 if deadline is None else deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    # Wake up regularly to check for flush requests
+                    action = self.queue.get(timeout=min(timeout, 0.1))
+            except queue.Empty:
+                if flushing:
+                    self.flush_event.clear()
+                    break
+                continue
+
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            batch.append(action)
+            size += len(json.dumps(action, default=_json_default))
+        return batch
+
+    def _run(self):
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                if self._send_with_retry(batch):
+                    self._replay_journal()
+                else:
+                    self._spill(batch)
+            except Exception:
+                # Keep the thread alive, e.g. on journal errors
+                logger.exception("Failed to ship %d action(s)", len(batch))
+                self._spill(batch)
+            finally:
+                self._done(len(batch))
+
+    def _send(self, actions):
+        _, errors = helpers.bulk(self.client, actions, raise_on_error=False)
+        if errors:
+            logger.warning("%d document(s) failed to index: %s", len(errors),
+                           errors[:3])
+
+    def _send_with_retry(self, actions):
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._send(actions)
+                return True
+            except TransportError as e:
+                logger.warning("Failed to ship %d action(s) to elasticsearch "
+                               "(attempt %d): %s", len(actions), attempt + 1, e)
+            except Exception:
+                # Not a connection problem (e.g. SerializationError), retrying
+                # the same batch will not help
+                logger.exception("Failed to ship %d action(s) to elasticsearch",
+                                 len(actions))
+                return False
+            if attempt < self.max_retries:
+                # Do not wait when stopping
+                if self.stop_event.wait(delay):
+                    break
+                delay = min(delay * 2, self.max_backoff)
+        return False
+
+    def _spill(self, actions):
+        if not actions:
+            return
+        if self.journal is None:
+            logger.warning("Dropped %d action(s)", len(actions))
+            return
+        try:
+            with self.journal_lock:
+                with open(self.journal, "a") as f:
+                    for action in actions:
+                        f.write(json.dumps(action, default=_json_default) + "\n")
+        except (OSError, TypeError, ValueError):
+            logger.exception("Dropped %d action(s), unable to write the journal",
+                             len(actions))
+
+    def _replay_journal(self):
+        """Ship the journal actions after reconnecting"""
+        if self.journal is None:
+            return
+        with self.journal_lock:
+            if not os.path.exists(self.journal):
+                return
+            replay = self.journal + ".replay"
+            os.replace(self.journal, replay)
+
+        actions = []
+        with open(replay) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    actions.append(json.loads(line))
+                except ValueError:
+                    # e.g. a line truncated by a crash while spilling
+                    logger.warning("Skipped invalid journal line: %.80s", line)
+        for i in range(0, len(actions), self.batch_size):
+            batch = actions[i:i + self.batch_size]
+            if not self._send_with_retry(batch):
+                self._spill(actions[i:])
+                break
+        os.remove(replay)
+
+
 class ElasticsearchLogger(Logger):
     """
     Elasticsearch Logging interface for `ray.tune`.
@@ -83,6 +354,13 @@ class ElasticsearchLogger(Logger):
     The elasticsearch index name is based on the current results root path. You
     may override this behavior and use a specific index name for your experiment
     using the configuration key `elasticsearch_index`.
+
+    The results are shipped from a background thread, see
+    :class:`ElasticsearchShipper`. Use the configuration key
+    `elasticsearch_shipper` to pass a dictionary with extra parameters to the
+    shipper. Its `close_timeout` entry (removed before creating the shipper)
+    is the maximum time in seconds to wait for the remaining results when the
+    logger is closed, 30 seconds by default.
     """
 
     def _init(self):
@@ -90,24 +368,19 @@ class ElasticsearchLogger(Logger):
         elasticsearch_args = self.config.get("elasticsearch_client", {})
         self.client = create_elastic_client(**elasticsearch_args)
 
-        # Save git information
-        self.git_remote = subprocess.check_output(
-            ["git", "ls-remote", "--get-url"]).decode("ascii").strip()
-        self.git_branch = subprocess.check_output(
-            ["git", "rev-parse", "--abbrev-ref", "HEAD"]).decode("ascii").strip()
-        self.git_sha = subprocess.check_output(
-            ["git", "rev-parse", "HEAD"]).decode("ascii").strip()
-        self.git_user = subprocess.check_output(
-            ["git", "log", "-n", "1", "--pretty=format:%an"]).decode("ascii").strip()
+        # Save git information, computed once per process
+        git_info = get_git_info()
+        self.git_remote = git_info["remote"]
+        self.git_branch = git_info["branch"]
+        self.git_sha = git_info["sha"]
+        self.git_user = git_info["user"]
 
         # Check for elasticsearch index name in configuration
         index_name = self.config.get("elasticsearch_index")
         if index_name is None:
             # Create default index name based on log path and git repo name
-            git_root = subprocess.check_output(
-                ["git", "rev-parse", "--show-toplevel"]).decode("ascii").strip()
             repo_name = os.path.basename(self.git_remote).rstrip(".git")
-            path_name = os.path.relpath(self.config["path"], git_root)
+            path_name = os.path.relpath(self.config["path"], git_info["root"])
             index_name = os.path.join(repo_name, path_name)
 
             # slugify index name
@@ -115,9 +388,15 @@ class ElasticsearchLogger(Logger):
 
         self.index_name = index_name
 
+        # Ship the results from a background thread. Results that could not be
+        # shipped are saved in the trial directory and replayed on reconnect
+        shipper_args = dict(journal=os.path.join(self.logdir, "elasticsearch.journal"))
+        shipper_args.update(self.config.get("elasticsearch_shipper", {}))
+        self.close_timeout = shipper_args.pop("close_timeout", 30.0)
+        self.shipper = ElasticsearchShipper(self.client, **shipper_args)
+
         self.logdir = os.path.basename(self.logdir)
         self.experiment_name = self.config["name"]
-        self.buffer = []
 
     def on_result(self, result):
         """Given a result, appends it to the existing log."""
@@ -135,23 +414,18 @@ class ElasticsearchLogger(Logger):
         result["timestamp"] = datetime.utcfromtimestamp(timestamp).isoformat()
 
         log_entry.update(result)
-        self.buffer.append(log_entry)
+        self.shipper.put({
+            "_index": self.index_name,
+            "_type": self.experiment_name,
+            "_source": log_entry,
+        })
 
     def close(self):
-        self.flush()
+        self.shipper.close(timeout=self.close_timeout)
 
     def flush(self):
-        if len(self.buffer) > 0:
-            results = helpers.parallel_bulk(client=self.client,
-                                            actions=self.buffer,
-                                            index=self.index_name,
-                                            doc_type=self.experiment_name)
-            errors = [status for success, status in results if not success]
-            if errors:
-                raise BulkIndexError("{} document(s) failed to index.".
-                                     format(len(errors)), errors)
-
-            self.buffer.clear()
+        # Do not wait for the results to be shipped
+        self.shipper.flush(timeout=0)
 
 
 def elastic_dsl(client, dsl, index, **kwargs):
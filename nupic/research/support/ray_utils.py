@@ -21,6 +21,8 @@ import glob
 import json
 import os
 
+from .results_loader import load_trial_results
+
 
 def load_ray_tune_experiments(
     experiment_path, load_results=False
@@ -83,24 +85,23 @@ def load_ray_tune_experiment(
         raise RuntimeError("Experiment state is invalid; no checkpoints found!")
 
     all_experiments = experiment_state["checkpoints"]
-    for experiment in all_experiments:
+    if load_results:
         # Make logs relative to experiment path
-        logdir = experiment["logdir"]
-        logpath = os.path.join(experiment_path, os.path.basename(logdir))
+        trials = load_trial_results(
+            experiment_path,
+            [os.path.basename(e["logdir"]) for e in all_experiments],
+            read_results=True,
+        )
+
+    for experiment in all_experiments:
         experiment["results"] = None
 
         if load_results:
             # Load results
-            result_file = os.path.join(logpath, "result.json")
-            if not result_file:
-                print("No results for experiment:", experiment["experiment_tag"])
+            results = trials[os.path.basename(experiment["logdir"])]["results"]
+            if not results:
+                print("No data for experiment:", experiment["experiment_tag"])
                 continue
-
-            with open(result_file) as f:
-                rows = f.readlines()
-                if not rows:
-                    print("No data for experiment:", experiment["experiment_tag"])
-                    continue
-                experiment["results"] = [json.loads(s) for s in rows]
+            experiment["results"] = results
 
     return experiment_state
@@ -0,0 +1,185 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+"""
+Load the results of the trials of a ray tune experiment directory.
+
+The files of every trial (``progress.csv``, ``params.json`` and optionally
+``result.json``) are read in a process pool and saved in a single cache file
+per experiment directory. Subsequent loads only read the trials whose files
+changed since the cache was written.
+"""
+import json
+import multiprocessing
+import os
+import pickle
+import warnings
+
+import pandas as pd
+
+CACHE_FILENAME = ".results_cache.pkl"
+CACHE_VERSION = 1
+
+TRIAL_FILES = ("progress.csv", "params.json", "result.json")
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def trial_signature(trial_dir):
+    """
+    Modification time and size of every trial file, used to detect the trials
+    that changed since they were cached
+    """
+    return tuple(_file_signature(os.path.join(trial_dir, f)) for f in TRIAL_FILES)
+
+
+def read_trial(trial_dir, read_results=False):
+    """
+    Read the files of a single trial.
+
+    :param trial_dir: ray tune trial directory
+    :param read_results: Whether or not to read the rows of ``result.json``
+
+    :return: dictionary with the trial "progress" dataframe, "params" dict and
+             "results" list of dicts (when read_results is True). Missing or
+             empty files are returned as None
+    :rtype: dict
+    """
+    trial = dict(progress=None, params=None)
+
+    csv = os.path.join(trial_dir, "progress.csv")
+    # check if file size is > 0 before proceeding
+    if os.path.isfile(csv) and os.stat(csv).st_size:
+        trial["progress"] = pd.read_csv(csv)
+
+    params_file = os.path.join(trial_dir, "params.json")
+    if os.path.isfile(params_file):
+        with open(params_file) as f:
+            trial["params"] = json.load(f)
+
+    if read_results:
+        trial["results"] = None
+        result_file = os.path.join(trial_dir, "result.json")
+        if os.path.isfile(result_file):
+            with open(result_file) as f:
+                rows = f.readlines()
+            if rows:
+                trial["results"] = [json.loads(s) for s in rows]
+
+    return trial
+
+
+def _read_trial_with_results(trial_dir):
+    return read_trial(trial_dir, read_results=True)
+
+
+def _load_cache(cache_file):
+    try:
+        with open(cache_file, "rb") as f:
+            cache = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache["trials"]
+
+
+def _save_cache(cache_file, trials):
+    tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+    try:
+        with open(tmp_file, "wb") as f:
+            pickle.dump(dict(version=CACHE_VERSION, trials=trials), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        warnings.warn("Unable to write results cache {}: {}".format(cache_file, e))
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def load_trial_results(experiment_path, trial_dirs=None, read_results=False,
+                       processes=None, use_cache=True):
+    """
+    Load the results of the trials of a ray tune experiment directory.
+
+    :param experiment_path: ray tune experiment directory
+    :type experiment_path: str
+    :param trial_dirs: trial directory names relative to experiment_path.
+                       None for every sub directory with a "params.json" file
+    :type trial_dirs: list(str)
+    :param read_results: Whether or not to read the rows of ``result.json``
+    :type read_results: bool
+    :param processes: Number of processes used to read the trials that are not
+                      cached. None for ``os.cpu_count()``
+    :type processes: int
+    :param use_cache: Whether or not to use and update the results cache file
+                      in the experiment directory
+    :type use_cache: bool
+
+    :return: dictionary mapping every trial directory name to its results.
+             See :func:`read_trial`
+    :rtype: dict
+    """
+    experiment_path = os.path.abspath(os.path.expanduser(experiment_path))
+    if trial_dirs is None:
+        trial_dirs = sorted(
+            d for d in os.listdir(experiment_path)
+            if os.path.isfile(os.path.join(experiment_path, d, "params.json"))
+        )
+    trial_dirs = list(dict.fromkeys(trial_dirs))
+
+    cache_file = os.path.join(experiment_path, CACHE_FILENAME)
+    cache = _load_cache(cache_file) if use_cache else {}
+
+    signatures = {}
+    stale = []
+    for trial_dir in trial_dirs:
+        signatures[trial_dir] = trial_signature(
+            os.path.join(experiment_path, trial_dir))
+        cached = cache.get(trial_dir)
+        if (
+            cached is None
+            or cached["signature"] != signatures[trial_dir]
+            or (read_results and "results" not in cached["trial"])
+        ):
+            stale.append(trial_dir)
+
+    if stale:
+        read_fn = _read_trial_with_results if read_results else read_trial
+        paths = [os.path.join(experiment_path, d) for d in stale]
+        processes = min(processes or os.cpu_count() or 1, len(paths))
+        if processes > 1:
+            with multiprocessing.Pool(processes) as pool:
+                trials = pool.map(read_fn, paths,
+                                  chunksize=max(1, len(paths) // (4 * processes)))
+        else:
+            trials = [read_fn(path) for path in paths]
+
+        for trial_dir, trial in zip(stale, trials):
+            cache[trial_dir] = dict(signature=signatures[trial_dir], trial=trial)
+        if use_cache:
+            _save_cache(cache_file, cache)
+
+    return {trial_dir: cache[trial_dir]["trial"] for trial_dir in trial_dirs}
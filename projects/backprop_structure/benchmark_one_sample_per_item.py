@@ -0,0 +1,110 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the training throughput and peak memory of BinaryGatedConv2d with
+one_sample_per_item when sampling the weights of the whole batch at once
+against sampling them in chunks under a memory budget, across batch sizes.
+"""
+
+import argparse
+from time import time
+
+import torch
+
+from nupic.research.frameworks.backprop_structure.modules import BinaryGatedConv2d
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def time_step(layer, x, device, repeats):
+    """Mean forward + backward time and peak CUDA memory (MB) of a train step"""
+    def step():
+        layer.zero_grad()
+        layer(x).sum().backward()
+
+    step()
+    synchronize(device)
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+    t0 = time()
+    for _ in range(repeats):
+        step()
+    synchronize(device)
+    elapsed = (time() - t0) / repeats
+    peak = (torch.cuda.max_memory_allocated(device) / 2 ** 20
+            if device.type == "cuda" else float("nan"))
+    return elapsed, peak
+
+
+def main(args):
+    device = torch.device(args.device)
+    layer = BinaryGatedConv2d(args.channels, args.channels, 3, padding=1,
+                              one_sample_per_item=True).to(device)
+    layer.train()
+    budget = int(args.budget_mb * 2 ** 20)
+
+    print(
+        "{:>6} {:>7} {:>14} {:>14} {:>12} {:>12}".format(
+            "batch", "chunk", "full (img/s)", "chunk (img/s)", "full (MB)",
+            "chunk (MB)"
+        )
+    )
+    for batch_size in args.batch_sizes:
+        x = torch.randn(batch_size, args.channels, args.size, args.size,
+                        device=device)
+        layer.sample_memory_budget = None
+        t_full, m_full = time_step(layer, x, device, args.repeats)
+        layer.sample_memory_budget = budget
+        t_chunk, m_chunk = time_step(layer, x, device, args.repeats)
+        print(
+            "{:>6} {:>7} {:>14.1f} {:>14.1f} {:>12.1f} {:>12.1f}".format(
+                batch_size,
+                layer.samples_per_chunk(batch_size),
+                batch_size / t_full,
+                batch_size / t_chunk,
+                m_full,
+                m_chunk,
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--device", default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--size", type=int, default=16, help="Input height/width")
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[16, 64, 128, 256]
+    )
+    parser.add_argument(
+        "--budget-mb",
+        type=float,
+        default=64,
+        help="sample_memory_budget of the chunked layer in MB",
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,94 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the epoch rollover time and resident memory of the preprocessed GSC
+dataset when loading each seed from ".npz" files versus memory mapping their
+".npy" copies. Each variant runs in its own process so the resident memory
+measurements do not interfere.
+"""
+
+import argparse
+import multiprocessing
+import os
+from time import time
+
+from torch.utils.data import DataLoader
+
+from nupic.research.frameworks.dynamic_sparse.common.dataloaders import (
+    PreprocessedSpeechDataset,
+)
+
+
+def resident_memory_mb():
+    """Current resident set size of this process (Linux only)"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def run(root, memory_map, epochs, batch_size, queue):
+    t0 = time()
+    dataset = PreprocessedSpeechDataset(root, "train", memory_map=memory_map)
+    results = dict(init=time() - t0, rollover=[], epoch=[], rss=[])
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    for _ in range(epochs):
+        t0 = time()
+        for _ in loader:
+            pass
+        results["epoch"].append(time() - t0)
+        results["rss"].append(resident_memory_mb())
+
+        t0 = time()
+        dataset.next_seed()
+        results["rollover"].append(time() - t0)
+    queue.put(results)
+
+
+def main(args):
+    root = os.path.expanduser(args.data_dir)
+    for memory_map in (False, True):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=run, args=(root, memory_map, args.epochs, args.batch_size, queue)
+        )
+        process.start()
+        results = queue.get()
+        process.join()
+
+        print("memory_map={}".format(memory_map))
+        print("  init:             {:.2f}s".format(results["init"]))
+        print("  epoch rollover:   {}".format(
+            ", ".join("{:.2f}s".format(t) for t in results["rollover"])))
+        print("  epoch iteration:  {}".format(
+            ", ".join("{:.2f}s".format(t) for t in results["epoch"])))
+        print("  resident memory:  {}".format(
+            ", ".join("{:.0f}MB".format(m) for m in results["rss"])))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data-dir", default="~/nta/datasets/gsc")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=64)
+    main(parser.parse_args())
@@ -0,0 +1,108 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the batched DSLinear coactivation update against the original
+per-sample `torch.ger` loop across batch and layer sizes.
+"""
+
+import argparse
+from time import time
+
+import torch
+
+from nupic.research.frameworks.dynamic_sparse.networks import DSLinear
+
+
+def loop_coactivations(x, y, binary):
+    """The original implementation: one outer product per sample."""
+    if binary:
+        x, y = (x > 0).float(), (y > 0).float()
+    outer = 0
+    for s in range(x.shape[0]):
+        outer += torch.ger(y[s], x[s])
+    return outer
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def time_fn(fn, device, repeats):
+    fn()
+    synchronize(device)
+    t0 = time()
+    for _ in range(repeats):
+        fn()
+    synchronize(device)
+    return (time() - t0) / repeats
+
+
+def main(args):
+    device = torch.device(args.device)
+    print(
+        "{:>6} {:>6} {:>7} {:>12} {:>12} {:>8}".format(
+            "batch", "size", "binary", "loop (ms)", "batched (ms)", "speedup"
+        )
+    )
+    for size in args.layer_sizes:
+        layer = DSLinear(size, size).to(device)
+        layer.init_coactivation_tracking()
+        layer.train()
+        for batch_size in args.batch_sizes:
+            x = torch.randn(batch_size, size, device=device)
+            with torch.no_grad():
+                y = layer(x)
+            for binary in (True, False):
+                layer.use_binary_coactivations = binary
+
+                def run_loop():
+                    layer.coactivations.add_(loop_coactivations(x, y, binary))
+
+                def run_batched():
+                    layer._update_coactivations(x, y)
+
+                t_loop = time_fn(run_loop, device, args.repeats)
+                t_batched = time_fn(run_batched, device, args.repeats)
+                print(
+                    "{:>6} {:>6} {:>7} {:>12.3f} {:>12.3f} {:>7.1f}x".format(
+                        batch_size,
+                        size,
+                        str(binary),
+                        t_loop * 1000,
+                        t_batched * 1000,
+                        t_loop / t_batched,
+                    )
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--device", default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[16, 64, 128, 256]
+    )
+    parser.add_argument("--layer-sizes", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--repeats", type=int, default=10)
+    main(parser.parse_args())
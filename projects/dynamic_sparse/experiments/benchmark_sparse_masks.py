@@ -0,0 +1,126 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the sparse mask initialization of SparseModule against the original
+implementation enumerating every weight index with `itertools.product`,
+across layer sizes.
+"""
+
+import argparse
+from itertools import product
+from time import time
+
+import numpy as np
+import torch
+
+from nupic.research.frameworks.pytorch.sparse_masks import random_mask
+
+LAYER_SHAPES = {
+    "linear 300x784": (300, 784),
+    "linear 1000x1000": (1000, 1000),
+    "conv 64x64x3x3": (64, 64, 3, 3),
+    "conv 256x256x3x3": (256, 256, 3, 3),
+    "conv 512x512x3x3": (512, 512, 3, 3),
+    "linear 4096x4096": (4096, 4096),
+}
+
+
+def product_mask_fixed(shape, on_perc):
+    """The original SparseModule._mask_fixed"""
+    all_idxs = np.array(list(product(*[range(s) for s in shape])))
+    num_add = int(on_perc * np.prod(shape))
+    sampled_idxs = np.random.choice(range(len(all_idxs)), num_add, replace=False)
+    selected = all_idxs[sampled_idxs]
+    mask = torch.zeros(shape, dtype=torch.bool)
+    mask[tuple(zip(*selected))] = True
+    return mask
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def time_fn(fn, device, repeats):
+    fn()
+    synchronize(device)
+    t0 = time()
+    for _ in range(repeats):
+        fn()
+    synchronize(device)
+    return (time() - t0) / repeats
+
+
+def main(args):
+    device = torch.device(args.device)
+    print(
+        "{:>18} {:>10} {:>13} {:>13} {:>14} {:>8}".format(
+            "layer", "params", "product (ms)", "random (ms)", "per out (ms)", "speedup"
+        )
+    )
+    for name, shape in LAYER_SHAPES.items():
+        num_params = int(np.prod(shape))
+        num_add = int(args.on_perc * num_params)
+        num_add_per_output = int(args.on_perc * num_params // shape[0])
+
+        t_random = time_fn(
+            lambda: random_mask(shape, num_add, device=device), device, args.repeats
+        )
+        t_per_output = time_fn(
+            lambda: random_mask(shape, num_add_per_output, dim=0, device=device),
+            device,
+            args.repeats,
+        )
+        if num_params <= args.max_product_params:
+            t_product = time_fn(
+                lambda: product_mask_fixed(shape, args.on_perc).to(device), device, 1
+            )
+            product_ms = "{:>13.1f}".format(t_product * 1000)
+            speedup = "{:>7.0f}x".format(t_product / t_random)
+        else:
+            product_ms, speedup = "{:>13}".format("-"), "{:>8}".format("-")
+        print(
+            "{:>18} {:>10} {} {:>13.3f} {:>14.3f} {}".format(
+                name,
+                num_params,
+                product_ms,
+                t_random * 1000,
+                t_per_output * 1000,
+                speedup,
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--device", default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    parser.add_argument("--on-perc", type=float, default=0.1)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument(
+        "--max-product-params",
+        type=int,
+        default=1000000,
+        help="Largest layer timed with the original implementation",
+    )
+    main(parser.parse_args())
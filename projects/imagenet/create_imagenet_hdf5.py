@@ -17,14 +17,27 @@
 #
 #  http://numenta.org/licenses/
 #
+"""
+Convert the imagenet image folders into a single HDF5 file compatible with
+:class:`HDF5Dataset`, including the ``.__hdf5_index__`` file with the image names.
+
+The images are read (and optionally resized) by a pool of worker processes
+while the main process is the only writer, keeping the HDF5 file open for the
+whole conversion. Images already saved in the HDF5 file are skipped, allowing
+the conversion to be resumed after an interruption.
+"""
+import argparse
 import multiprocessing
+import posixpath
 from concurrent.futures import ProcessPoolExecutor
 from functools import partial
+from io import BytesIO
 from pathlib import Path
 
 import h5py
 import numpy as np
 from PIL import Image
+from torchvision.datasets.folder import is_image_file
 from tqdm import tqdm
 
 TRAIN_DIR = "train"
@@ -33,10 +46,6 @@ VAL_DIR = "val"
 # VAL_DIR = "sz/160/val"
 
 DATA_PATH = Path("~/nta/data/imagenet").expanduser()
-TRAIN_PATH = DATA_PATH / TRAIN_DIR
-VAL_PATH = DATA_PATH / VAL_DIR
-TRAIN_FILES = TRAIN_PATH.glob("*/*.JPEG")
-VAL_FILES = VAL_PATH.glob("*/*.JPEG")
 HDF5_FILE = DATA_PATH / "imagenet.hdf5"
 
 
@@ -45,51 +54,116 @@ def resize(sz, image_path):
         # Resize image preserving aspect ratio
         w, h = img.size
         ratio = min(h / sz, w / sz)
-        resized_img = img.resize((int(w / ratio), int(h / ratio)),
-                                 resample=Image.BICUBIC)
+        resized_img = img.convert("RGB").resize((int(w / ratio), int(h / ratio)),
+                                                resample=Image.BICUBIC)
     return resized_img
 
 
-def hdf5_save(group_name, lock, image_path):
+def read_image(image_path, sz=None):
     """
-    Save imagenet images to HDF5
+    Read imagenet image data, optionally resizing the image. Called by the
+    worker processes.
 
-    :param group_name: top level group name ("train", "val", etc)
-    :param lock: Lock object used to control write access to hdf5 file
     :param image_path: Path object for the image file
+    :param sz: Resize the smaller image dimension to this size. Keep the
+               original image when None.
+    :return: tuple with (wnid, image_name, image_data)
     """
-    image_name = image_path.name
-    wnid = image_path.parent.name
-    image_data = image_path.read_bytes()
-
-    lock.acquire()
-    hdf5_file = h5py.File(name=HDF5_FILE, mode="a")
-    try:
-        main_group = hdf5_file.require_group(group_name)
-        wnid_group = main_group.require_group(wnid)
-        wnid_group.create_dataset(image_name, data=np.void(image_data))
-    finally:
-        hdf5_file.close()
-        lock.release()
+    if sz is None:
+        image_data = image_path.read_bytes()
+    else:
+        with BytesIO() as buffer:
+            resize(sz, image_path).save(buffer, format="JPEG", quality=95)
+            image_data = buffer.getvalue()
 
-    return image_name
+    return image_path.parent.name, image_path.name, image_data
 
 
-def main():
-    with ProcessPoolExecutor(multiprocessing.cpu_count()) as executor, \
-            multiprocessing.Manager() as manager:
+def hdf5_save(hdf5_file, group_name, image_files, executor, sz=None,
+              batch_size=1024, chunksize=1):
+    """
+    Save imagenet images to HDF5. The images are read by the executor workers in
+    batches while the previous batch is written to the HDF5 file.
+
+    :param hdf5_file: HDF5 file opened for writing
+    :param group_name: top level group name ("train", "val", etc)
+    :param image_files: List of Path objects for the image files
+    :param executor: Executor used to read the images
+    :param sz: Optional image size. See :func:`read_image`
+    :param batch_size: Number of images written between flushes
+    :param chunksize: Number of images sent to each worker at once
+
+    :return: List with the absolute path names of all images within the HDF5 file
+    """
+    image_files = sorted(filter(lambda x: is_image_file(x.name), image_files))
+
+    # Create all class groups upfront and skip images saved by a previous run
+    main_group = hdf5_file.require_group(group_name)
+    wnid_groups = {}
+    saved = set()
+    for wnid in sorted({p.parent.name for p in image_files}):
+        wnid_group = main_group.require_group(wnid)
+        wnid_groups[wnid] = wnid_group
+        saved.update((wnid, name) for name in wnid_group)
+    pending = [p for p in image_files if (p.parent.name, p.name) not in saved]
+
+    read = partial(read_image, sz=sz)
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    with tqdm(total=len(image_files), initial=len(image_files) - len(pending),
+              desc="Saving {} dataset".format(group_name)) as progress:
+        results = []
+        for next_batch in batches + [[]]:
+            # Keep the workers busy reading the next batch while saving this one
+            current = results
+            results = executor.map(read, next_batch, chunksize=chunksize)
+
+            for wnid, image_name, image_data in current:
+                wnid_groups[wnid].create_dataset(image_name, data=np.void(image_data))
+                progress.update()
+            hdf5_file.flush()
+
+    return [posixpath.join("/", group_name, p.parent.name, p.name)
+            for p in image_files]
+
+
+def hdf5_save_index(hdf5_file_name, group_name, images):
+    """
+    Save the image names index used by :class:`HDF5Dataset` to skip scanning
+    the HDF5 file on initialization.
+
+    :param hdf5_file_name: HDF5 file path
+    :param group_name: top level group name ("train", "val", etc)
+    :param images: List with the absolute path names of the images
+    """
+    index_file = Path(hdf5_file_name).with_suffix(".__hdf5_index__")
+    with h5py.File(name=index_file, mode="a") as hdf5_idx:
+        if group_name in hdf5_idx:
+            del hdf5_idx[group_name]
+        hdf5_idx_root = hdf5_idx.create_group(group_name)
+        hdf5_idx_root.create_dataset("images", data=np.array(images, dtype="S"))
 
-        lock = manager.Lock()
-        hdf5_val = partial(hdf5_save, VAL_DIR, lock)
-        results = executor.map(hdf5_val, VAL_FILES)
-        for _ in tqdm(results, desc="Saving validation dataset"):
-            pass
 
-        hdf5_train = partial(hdf5_save, TRAIN_DIR, lock)
-        results = executor.map(hdf5_train, TRAIN_FILES)
-        for _ in tqdm(results, desc="Saving training dataset"):
-            pass
+def main(data_path, hdf5_file_name, sz, workers, batch_size):
+    with ProcessPoolExecutor(workers) as executor, \
+            h5py.File(name=hdf5_file_name, mode="a") as hdf5_file:
+        for group_name in (VAL_DIR, TRAIN_DIR):
+            image_files = list((data_path / group_name).glob("*/*"))
+            images = hdf5_save(hdf5_file, group_name, image_files, executor,
+                               sz=sz, batch_size=batch_size,
+                               chunksize=max(1, batch_size // (4 * workers)))
+            hdf5_save_index(hdf5_file_name, group_name, images)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data", type=Path, default=DATA_PATH,
+                        help="Directory with the imagenet image folders")
+    parser.add_argument("--output", type=Path, default=HDF5_FILE,
+                        help="HDF5 file")
+    parser.add_argument("--size", type=int, default=None,
+                        help="Resize the smaller image dimension to this size")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=1024,
+                        help="Number of images written between flushes")
+    args = parser.parse_args()
+    main(args.data, args.output, args.size, args.workers, args.batch_size)
@@ -0,0 +1,73 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+"""
+Convert an imagenet HDF5 file or image folder into the packed format used by
+:class:`PackedImageDataset`. The packed dataset is saved into
+``OUTPUT_PATH/{train,val}`` and can be used by passing ``OUTPUT_PATH`` as the
+``data`` of the imagenet experiments.
+"""
+import argparse
+import os
+from pathlib import Path
+
+import h5py
+from tqdm import tqdm
+
+from nupic.research.frameworks.pytorch.dataset_utils import (
+    CachedDatasetFolder,
+    HDF5Dataset,
+    create_packed_dataset,
+)
+
+TRAIN_DIR = "train"
+VAL_DIR = "val"
+
+DATA_PATH = Path("~/nta/data/imagenet").expanduser()
+OUTPUT_PATH = DATA_PATH / "packed"
+
+
+def main(data, output, shard_size):
+    for split in (VAL_DIR, TRAIN_DIR):
+        if h5py.is_hdf5(data):
+            dataset = HDF5Dataset(hdf5_file=data, root=split)
+        else:
+            dataset = CachedDatasetFolder(root=os.path.join(data, split))
+
+        create_packed_dataset(
+            dataset,
+            output_dir=os.path.join(output, split),
+            shard_size=shard_size,
+            progress=lambda x: tqdm(x, total=len(dataset), desc=split),
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--data", default=str(DATA_PATH),
+        help="Imagenet HDF5 file or directory with the image folders",
+    )
+    parser.add_argument("--output", default=str(OUTPUT_PATH))
+    parser.add_argument(
+        "--shard-size", type=int, default=2 ** 32,
+        help="Maximum size in bytes of each shard file",
+    )
+    args = parser.parse_args()
+    main(args.data, args.output, args.shard_size)
@@ -35,6 +35,8 @@ import numpy as np
 import pandas as pd
 from ray.tune.util import flatten_dict
 
+from nupic.research.support.results_loader import load_trial_results
+
 warnings.filterwarnings("ignore")
 
 
@@ -43,11 +45,15 @@ def load(experiment_path):
     experiment_path = os.path.abspath(experiment_path)
     experiment_states = _get_experiment_states(experiment_path, exit_on_fail=True)
 
+    # read the trials of every experiment state at once
+    trial_dirs = [d for state, _ in experiment_states for d in _trial_dirs(state)]
+    trials = load_trial_results(experiment_path, trial_dirs)
+
     # run once per experiment state
     # columns might differ between experiments
     dataframes = []
     for exp_state, exp_name in experiment_states:
-        progress, params = _read_experiment(exp_state, experiment_path)
+        progress, params = _read_experiment(exp_state, experiment_path, trials)
         if progress:
             dataframes.append(_get_value(progress, params, exp_name))
 
@@ -65,30 +71,37 @@ def load_many(experiment_paths):
     return dfs
 
 
-def _read_experiment(experiment_state, experiment_path):
+def _trial_dirs(experiment_state):
+    """Trial directory name of every checkpoint with a logdir"""
+    return [
+        os.path.basename(exp["logdir"])
+        for exp in experiment_state["checkpoints"]
+        if exp.get("logdir", None) is not None
+    ]
+
+
+def _read_experiment(experiment_state, experiment_path, trials=None):
+    """
+    Return the progress dataframe and params of every trial of the experiment
+    state, indexed by experiment tag. The trial files are read with
+    :func:`load_trial_results` unless already loaded in trials
+    """
     checkpoint_dicts = experiment_state["checkpoints"]
     checkpoint_dicts = [flatten_dict(g) for g in checkpoint_dicts]
+    if trials is None:
+        trials = load_trial_results(experiment_path, _trial_dirs(experiment_state))
+
     progress = {}
     params = {}
-    # TODO: no real use for exp_directories outside this function, why get it?
-    exp_directories = {}
     for exp in checkpoint_dicts:
         if exp.get("logdir", None) is None:
             continue
-        exp_dir = os.path.basename(exp["logdir"])
-        exp_tag = exp["experiment_tag"]
-        csv = os.path.join(experiment_path, exp_dir, "progress.csv")
-        # check if file size is > 0 before proceeding
-        if os.path.isfile(csv) and os.stat(csv).st_size:
-            progress[exp_tag] = pd.read_csv(csv)
-            exp_directories[exp_tag] = os.path.abspath(
-                os.path.join(experiment_path, exp_dir)
-            )
-
-            # Read in the configs for this experiment
-            params_file = os.path.join(experiment_path, exp_dir, "params.json")
-            with open(params_file) as f:
-                params[exp_tag] = json.load(f)
+        trial = trials[os.path.basename(exp["logdir"])]
+        # skip trials with an empty progress file
+        if trial["progress"] is not None:
+            exp_tag = exp["experiment_tag"]
+            progress[exp_tag] = trial["progress"]
+            params[exp_tag] = trial["params"]
 
     return progress, params
 
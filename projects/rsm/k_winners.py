@@ -24,7 +24,7 @@ import numpy as np
 import torch
 import torch.nn as nn
 
-import nupic.torch.functions as F
+from nupic.research.frameworks.pytorch.functions import kwinners
 from nupic.torch.duty_cycle_metrics import binary_entropy, max_entropy
 
 
@@ -147,6 +147,7 @@ class KWinners(KWinnersBase):
         boost_strength=1.0,
         boost_strength_factor=0.9,
         duty_cycle_period=1000,
+        strategy="topk",
     ):
         """Applies K-Winner function to the input tensor.
 
@@ -177,6 +178,11 @@ class KWinners(KWinnersBase):
         :param duty_cycle_period:
           The period used to calculate duty cycles
         :type duty_cycle_period: int
+
+        :param strategy:
+          Winner selection strategy.
+          See :data:`nupic.research.frameworks.pytorch.functions.KWINNERS_STRATEGIES`
+        :type strategy: str
         """
         super(KWinners, self).__init__(
             percent_on=percent_on,
@@ -189,6 +195,7 @@ class KWinners(KWinnersBase):
         self.k = int(round(n * percent_on))
         self.k_inference = int(self.k * self.k_inference_factor)
         self.stoch_sd = stoch_sd
+        self.strategy = strategy
         self.register_buffer("duty_cycle", torch.zeros(self.n))
 
     def forward(self, x):
@@ -197,15 +204,14 @@ class KWinners(KWinnersBase):
         else:
             k = self.k
         if self.training:
-            x = F.KWinners.apply(x, self.duty_cycle, k, self.boost_strength)
-            self.update_duty_cycle(x)
+            # Update the duty cycle together with the winner selection
+            self.learning_iterations += x.shape[0]
+            period = min(self.duty_cycle_period, self.learning_iterations)
+            x = kwinners(x, k, self.duty_cycle, self.boost_strength,
+                         strategy=self.strategy, period=period)
         else:
-            x = F.KWinners.apply(
-                x,
-                self.duty_cycle,
-                int(k * self.k_inference_factor),
-                self.boost_strength,
-            )
+            x = kwinners(x, int(k * self.k_inference_factor), self.duty_cycle,
+                         self.boost_strength, strategy=self.strategy)
 
         return x
 
@@ -25,20 +25,11 @@ from torch import nn
 from active_dendrite import ActiveDendriteLayer
 # from nupic.torch.modules.k_winners import KWinners
 from k_winners import KWinners
+from nupic.research.frameworks.pytorch.functions import kwinners_mask
 from nupic.torch.modules.sparse_weights import SparseWeights
 from util import activity_square, count_parameters, get_grad_printer
 
 
-def topk_mask(x, k=2):
-    """
-    Simple functional version of KWinnersMask/KWinners since
-    autograd function apparently not currently exportable by JIT
-    """
-    res = torch.zeros_like(x)
-    topk, indices = x.topk(k, sorted=False)
-    return res.scatter(-1, indices, 1)
-
-
 class RSMPredictor(torch.nn.Module):
     def __init__(self, d_in=28 * 28, d_out=10, hidden_size=20):
         """
@@ -644,52 +635,59 @@ class RSMLayer(torch.nn.Module):
 
         return sigma  # total_cells
 
-    def _update_duty_cycle(self, winners):
+    def _update_duty_cycle(self, col_winners):
         """
         For tracking layer entropy (across both inhibition/boosting approaches)
+
+        :param col_winners: boolean column winners (bsz x m). Every cell of a
+                            winning column counts as active
         """
-        batch_size = winners.shape[0]
+        batch_size = col_winners.shape[0]
         self.learning_iterations += batch_size
         period = min(1000, self.learning_iterations)
-        self.duty_cycle.mul_(period - batch_size)
-        self.duty_cycle.add_(winners.gt(0).sum(dim=0, dtype=torch.float))
-        self.duty_cycle.div_(period)
-
-    def _k_winners(self, sigma, pi):
-        bsz = pi.size(0)
+        duty_cycle = self.duty_cycle.view(self.m, self.n)
+        duty_cycle.mul_(period - batch_size)
+        duty_cycle.add_(col_winners.sum(dim=0, dtype=torch.float).unsqueeze(1))
+        duty_cycle.div_(period)
 
-        # Group-wise max pooling
-        if not self.flattened:
-            lambda_ = self._group_max(pi)
-        else:
-            lambda_ = pi
+    def _group_winners(self, pi):
+        """
+        Compute the group-wise max and the cell winners of each group from a
+        single reduction over the cells.
 
-        # Cell-level mask: Make a bsz x total_cells binary mask of top 1 cell / column
+        :param pi: cell activity (bsz x total_cells)
+        :return: tuple with the max of each group (bsz x m) and a boolean mask
+                 with the top k_winner_cells of each group (bsz x m x n), or
+                 None if all the cells are winners
+        """
         if self.n == self.k_winner_cells:
             # Usually just in flattened case, no need to choose winners
-            m_pi = torch.ones(bsz, self.total_cells, device=sigma.device)
-        else:
-            mask = topk_mask(pi.view(bsz * self.m, self.n), self.k_winner_cells)
-            m_pi = mask.view(bsz, self.total_cells).detach()
+            return self._group_max(pi), None
+
+        pi = pi.view(-1, self.m, self.n)
+        if self.k_winner_cells == 1:
+            lambda_, indices = pi.max(dim=2, keepdim=True)
+            cells = torch.arange(self.n, device=pi.device)
+            return lambda_.squeeze(2), cells == indices
+
+        values, indices = pi.topk(self.k_winner_cells, dim=2)
+        cell_mask = torch.zeros_like(pi, dtype=torch.bool)
+        cell_mask.scatter_(2, indices, True)
+        return values[:, :, 0], cell_mask
+
+    def _k_winners(self, sigma, pi):
+        bsz = pi.size(0)
+
+        # Group-wise max pooling and cell-level winners (top cells / column)
+        lambda_, cell_winners = self._group_winners(pi)
 
         if self.boost_strat == "rsm_inhibition":
             # Standard RSM-style inhibition via phi matrix
 
             self._debug_log({"lambda_": lambda_})
 
-            # Column-level mask: Make a bsz x total_cells binary mask of top k columns
-            mask = topk_mask(lambda_, self.k)
-            m_lambda = (
-                mask.view(bsz, self.m, 1)
-                .repeat(1, 1, self.n)
-                .view(bsz, self.total_cells)
-                .detach()
-            )
-            col_winners = m_lambda
-
-            self._debug_log({"m_pi": m_pi, "m_lambda": m_lambda})
-
-            y_pre_act = m_pi * m_lambda * sigma
+            # Column-level winners: top k columns
+            col_winners = kwinners_mask(lambda_, self.k)
 
         elif self.boost_strat == "col_boosting":
             # HTM style boosted k-winner
@@ -705,23 +703,23 @@ class RSMLayer(torch.nn.Module):
                 if self.kwinners_rec is not None:
                     winners_rec = self.kwinners_rec(lambda_[:, -m_rec:])
                     winners.append(winners_rec)
-                m_lambda = (torch.cat(winners, 1).abs() > 0).float()
+                col_winners = torch.cat(winners, 1) != 0
             else:
-                winning_cols = (
-                    self.kwinners_col(lambda_).view(bsz, self.m, 1).abs() > 0
-                ).float()
-                m_lambda = winning_cols.repeat(1, 1, self.n).view(bsz, self.total_cells)
-                col_winners = winning_cols
-
-            self._debug_log({"m_lambda": m_lambda})
-            y_pre_act = m_pi * m_lambda * sigma
+                col_winners = self.kwinners_col(lambda_) != 0
+            col_winners = col_winners.detach()
 
-        self._update_duty_cycle(col_winners.squeeze())
+        # Broadcast the column winners over the cells instead of building
+        # bsz x total_cells masks
+        mask = col_winners.view(bsz, self.m, 1)
+        if cell_winners is not None:
+            mask = mask & cell_winners
+            self._debug_log({"m_pi": cell_winners})
+        self._debug_log({"m_lambda": col_winners})
 
-        del m_pi
-        del m_lambda
+        y_pre_act = sigma.view(bsz, self.m, self.n).masked_fill(~mask, 0)
+        self._update_duty_cycle(col_winners)
 
-        return y_pre_act
+        return y_pre_act.view(bsz, self.total_cells)
 
     def _inhibited_winners(self, sigma, phi):
         """
@@ -26,16 +26,14 @@ from functools import partial, reduce
 import torch
 import torchvision.utils as vutils
 from torch.utils.data import DataLoader
-from torchvision import transforms
 
 from nupic.torch.duty_cycle_metrics import binary_entropy
 from ptb import lang_util
 from rsm import RSMNet, RSMPredictor
 from rsm_samplers import (
-    MNISTBufferedDataset,
-    MNISTSequenceSampler,
+    MNISTTensorDataset,
+    MNISTTensorSequenceSampler,
     PTBSequenceSampler,
-    pred_sequence_collate,
     ptb_pred_sequence_collate,
 )
 from util import (
@@ -98,6 +96,8 @@ class RSMExperiment(object):
         self.pause_after_epochs = config.get("pause_after_epochs", 0)
         self.pause_eval_interval = config.get("pause_eval_interval", 10)
         self.pause_min_epoch = config.get("pause_min_epoch", 0)
+        # Truncated BPTT: number of timesteps per backward pass
+        self.tbptt_chunk_len = config.get("tbptt_chunk_len", 1)
 
         # Data parameters
         self.input_size = config.get("input_size", (1, 28, 28))
@@ -196,17 +196,16 @@ class RSMExperiment(object):
     def _build_dataloader(self):
         self.val_loader = self.corpus = None
         if self.dataset_kind == "mnist":
-            transform = transforms.Compose(
-                [transforms.ToTensor(), transforms.Normalize((0.1307,), (0.3081,))]
+            # Normalized MNIST images are kept on the device and each batch
+            # is drawn with a single gather
+            self.dataset = MNISTTensorDataset(
+                self.data_dir, download=True, train=True, device=self.device
             )
-            self.dataset = MNISTBufferedDataset(
-                self.data_dir, download=True, train=True, transform=transform
-            )
-            self.val_dataset = MNISTBufferedDataset(
-                self.data_dir, download=True, transform=transform
+            self.val_dataset = MNISTTensorDataset(
+                self.data_dir, download=True, device=self.device
             )
 
-            self.train_sampler = MNISTSequenceSampler(
+            self.train_sampler = MNISTTensorSequenceSampler(
                 self.dataset,
                 sequences=self.sequences,
                 batch_size=self.batch_size,
@@ -222,7 +221,7 @@ class RSMExperiment(object):
                 # match to ensure same digit prototype used for each sequence item.
                 self.val_sampler = self.train_sampler
             else:
-                self.val_sampler = MNISTSequenceSampler(
+                self.val_sampler = MNISTTensorSequenceSampler(
                     self.val_dataset,
                     sequences=self.sequences,
                     batch_size=self.batch_size,
@@ -234,13 +233,13 @@ class RSMExperiment(object):
                 )
             self.train_loader = DataLoader(
                 self.dataset,
-                batch_sampler=self.train_sampler,
-                collate_fn=pred_sequence_collate,
+                sampler=self.train_sampler,
+                batch_size=None,
             )
             self.val_loader = DataLoader(
                 self.val_dataset,
-                batch_sampler=self.val_sampler,
-                collate_fn=pred_sequence_collate,
+                sampler=self.val_sampler,
+                batch_size=None,
             )
 
         elif self.dataset_kind == "ptb":
@@ -529,7 +528,7 @@ class RSMExperiment(object):
         ll = (labels_one_hot * torch.log(predictions)).sum(dim=[0, 1])
         interp_loss = -ll  # sum negative log likelihood
 
-        return interp_loss.item()
+        return interp_loss.detach().double()
 
     def _do_prediction(
         self, inputs, pred_targets, pcounts, train=False, batch_idx=0, loader=None
@@ -553,11 +552,12 @@ class RSMExperiment(object):
                 predictor_dist, pred_targets, loader=loader, train=train
             )
 
+            # Accumulate on the device, see _pcounts_to_float
             _, class_predictions = torch.max(predictor_dist, 1)
             pcounts["total_samples"] += pred_targets.size(0)
             correct_arr = class_predictions == pred_targets
-            pcounts["correct_samples"] += correct_arr.sum().item()
-            pred_loss_ = pred_loss.item()
+            pcounts["correct_samples"] += correct_arr.sum().double()
+            pred_loss_ = pred_loss.detach().double()
             pcounts["total_pred_loss"] += pred_loss_
             pcounts["total_interp_loss"] += interp_loss
             if train:
@@ -569,7 +569,7 @@ class RSMExperiment(object):
             print("Finished batch %d" % batch_idx)
             if self.predictor:
                 batch_acc = correct_arr.float().mean() * 100
-                batch_ppl = lang_util.perpl(pred_loss_ / pred_targets.size(0))
+                batch_ppl = lang_util.perpl(pred_loss_.item() / pred_targets.size(0))
                 print(
                     "Partial pred acc - "
                     "batch acc: %.3f%%, pred ppl: %.1f" % (batch_acc, batch_ppl)
@@ -577,6 +577,10 @@ class RSMExperiment(object):
 
         return (pcounts, class_predictions, correct_arr)
 
+    def _pcounts_to_float(self, pcounts):
+        """Copy the prediction counts accumulated on the device to the host"""
+        return {key: float(value) for key, value in pcounts.items()}
+
     def _compute_loss(self, predicted_outputs, targets):
         """
         Compute loss across multiple layers (if applicable).
@@ -735,6 +739,7 @@ class RSMExperiment(object):
                 self.model.RSM_1.duty_cycle.fill_(0.0)  # Clear duty cycle
 
             num_batches = _b_idx + 1
+            pcounts = self._pcounts_to_float(pcounts)
             num_samples = pcounts["total_samples"]
             ret["val_loss"] = val_loss = total_loss / num_batches
             if self.predictor:
@@ -777,6 +782,10 @@ class RSMExperiment(object):
         """
         Do one epoch of training and testing.
 
+        The model is trained with truncated BPTT: the hidden state is detached,
+        and the loss of the last "tbptt_chunk_len" timesteps is backpropagated,
+        once every "tbptt_chunk_len" timesteps.
+
         Returns:
             A dict that describes progress of this epoch.
             The dict includes the key 'stop'. If set to one, this network
@@ -789,8 +798,8 @@ class RSMExperiment(object):
         if self.predictor:
             self.predictor.train()
 
-        # Performance metrics
-        total_loss = 0.0
+        # Performance metrics, accumulated on the device
+        total_loss = torch.zeros((), dtype=torch.float64, device=self.device)
         pcounts = {
             "total_samples": 0.0,
             "correct_samples": 0.0,
@@ -799,6 +808,8 @@ class RSMExperiment(object):
         }
 
         bsz = self.batch_size
+        chunk_len = self.tbptt_chunk_len
+        chunk_loss = None
 
         hidden = self.train_hidden_buffer[-1] if self.train_hidden_buffer else None
         if hidden is None:
@@ -814,9 +825,10 @@ class RSMExperiment(object):
                 targets = targets[:bsz]
                 pred_targets = pred_targets[:bsz]
 
-            hidden = self._repackage_hidden(hidden)
-
-            self.optimizer.zero_grad()
+            if batch_idx % chunk_len == 0:
+                # Start of a new chunk, truncate the history
+                hidden = self._repackage_hidden(hidden)
+                self.optimizer.zero_grad()
             if self.pred_optimizer:
                 self.pred_optimizer.zero_grad()
 
@@ -829,18 +841,17 @@ class RSMExperiment(object):
 
             x_b, pred_input = self._get_prediction_and_loss_inputs(hidden)
 
-            self.train_hidden_buffer.append(hidden)
-
             # Loss
             loss_targets = (targets, x_b)
             loss = self._compute_loss(output, loss_targets)
             if loss is not None:
-                total_loss += loss.item()
+                total_loss += loss.detach().double()
                 if not self.model_learning_paused:
-                    self._backward_and_optimize(loss)
+                    chunk_loss = loss if chunk_loss is None else chunk_loss + loss
 
-            # Keep only latest batch states around
-            self.train_hidden_buffer = self.train_hidden_buffer[-1:]
+            if chunk_loss is not None and (batch_idx + 1) % chunk_len == 0:
+                self._backward_and_optimize(chunk_loss)
+                chunk_loss = None
 
             pcounts, class_predictions, correct_arr = self._do_prediction(
                 pred_input,
@@ -858,6 +869,18 @@ class RSMExperiment(object):
                 )
                 break
 
+        if chunk_loss is not None:
+            # Last partial chunk
+            self._backward_and_optimize(chunk_loss)
+
+        # Keep only latest batch states around
+        self.train_hidden_buffer = [hidden]
+
+        num_batches = batch_idx + 1
+        total_loss = total_loss.item()
+        pcounts = self._pcounts_to_float(pcounts)
+        loop_time = time.time() - t1
+
         ret["stop"] = 0
         self.model._post_train_epoch(epoch)  # Update kwinners duty cycles, etc
 
@@ -869,7 +892,6 @@ class RSMExperiment(object):
         train_time = time.time() - t1
         self._post_epoch(epoch)
 
-        num_batches = batch_idx + 1
         ret["train_loss"] = total_loss / num_batches
         if self.predictor:
             num_samples = num_batches * self.batch_size
@@ -881,6 +903,7 @@ class RSMExperiment(object):
                 100 * pcounts["correct_samples"] / pcounts["total_samples"]
             )
 
+        ret["train_tokens_per_sec"] = num_batches * self.batch_size / loop_time
         ret["epoch_time_train"] = train_time
         ret["epoch_time"] = time.time() - t1
         ret["learning_rate"] = self.learning_rate
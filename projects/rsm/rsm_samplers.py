@@ -17,6 +17,8 @@
 #
 #  http://numenta.org/licenses/
 
+import os
+
 import numpy as np
 import torch
 from PIL import Image
@@ -119,17 +121,23 @@ class MNISTSequenceSampler(Sampler):
             torch.tensor(self.sequences), batch_first=True, padding_value=-99
         )
 
+        self._build_label_indices()
+
+    def _build_label_indices(self):
         # Get index for each digit (that appears in a passed sequence)
-        for seq in sequences:
+        for seq in self.sequences:
             for digit in seq:
                 if digit != -1 and digit not in self.label_indices:
-                    mask = (data_source.targets == digit).nonzero().flatten()
-                    idx = torch.randperm(mask.size(0))
-                    if self.use_mnist_pct < 1.0:
-                        idx = idx[: int(self.use_mnist_pct * len(idx))]
-                    self.label_indices[digit] = mask[idx]
+                    self.label_indices[digit] = self._shuffled_digit_indices(digit)
                     self.label_cursors[digit] = 0
 
+    def _shuffled_digit_indices(self, digit):
+        mask = (self.data_source.targets == digit).nonzero().flatten()
+        idx = torch.randperm(mask.size(0))
+        if self.use_mnist_pct < 1.0:
+            idx = idx[: int(self.use_mnist_pct * len(idx))]
+        return mask[idx]
+
     def _init_sequence_ids(self):
         return torch.LongTensor(self.bsz).random_(0, self.n_sequences)
 
@@ -156,20 +164,20 @@ class MNISTSequenceSampler(Sampler):
             ).random_(0, self.n_sequences)
             self.sequence_cursor[1, roll_mask] = 0
 
-    def _get_next_batch(self):
+    def _next_labels(self):
         """
+        Return the digit labels of the current inputs and of the next
+        (predicted) inputs, and move every sequence forward by one item
         """
         # First row is current inputs
         inp_labels_batch = self.sequences_mat[
             self.sequence_id[0], self.sequence_cursor[0]
         ]
-        inp_idxs = [self._get_sample_image(digit.item()) for digit in inp_labels_batch]
 
         # Second row is next (predicted) inputs
         tgt_labels_batch = self.sequences_mat[
             self.sequence_id[1], self.sequence_cursor[1]
         ]
-        tgt_idxs = [self._get_sample_image(digit.item()) for digit in tgt_labels_batch]
 
         # Roll next to current
         self.sequence_id[0] = self.sequence_id[1]
@@ -177,6 +185,14 @@ class MNISTSequenceSampler(Sampler):
 
         self._increment_next()
 
+        return inp_labels_batch, tgt_labels_batch
+
+    def _get_next_batch(self):
+        """
+        """
+        inp_labels_batch, tgt_labels_batch = self._next_labels()
+        inp_idxs = [self._get_sample_image(digit.item()) for digit in inp_labels_batch]
+        tgt_idxs = [self._get_sample_image(digit.item()) for digit in tgt_labels_batch]
         return inp_idxs + tgt_idxs
 
     def _get_sample_image(self, digit):
@@ -208,6 +224,131 @@ class MNISTSequenceSampler(Sampler):
         return self.max_batches if self.max_batches else len(self.data_source)
 
 
+class MNISTTensorDataset(datasets.MNIST):
+    """
+    MNIST kept as a single tensor of normalized and flattened images, on the
+    given device. Indexed with a whole batch of image ids produced by
+    :class:`MNISTTensorSequenceSampler`: the first half are the inputs and the
+    second half the next (predicted) inputs. Index -1 generates a white noise
+    image with a random label, see :class:`MNISTBufferedDataset`.
+
+    Use with ``DataLoader(dataset, sampler=sampler, batch_size=None)`` to get
+    the same batches as :func:`pred_sequence_collate`.
+    """
+
+    def __init__(
+        self,
+        root,
+        train=True,
+        download=False,
+        mean=0.1307,
+        std=0.3081,
+        device=None,
+    ):
+        super(MNISTTensorDataset, self).__init__(
+            root, train=train, download=download
+        )
+        self.mean = mean
+        self.std = std
+        images = self.data.view(self.data.size(0), -1).float().div_(255)
+        self.images = images.sub_(mean).div_(std).to(device)
+        self.labels = self.targets.to(device)
+
+    # Share the files downloaded for MNISTBufferedDataset. torchvision names
+    # the folders after the class
+    @property
+    def raw_folder(self):
+        return os.path.join(self.root, MNISTBufferedDataset.__name__, "raw")
+
+    @property
+    def processed_folder(self):
+        return os.path.join(self.root, MNISTBufferedDataset.__name__, "processed")
+
+    def __getitem__(self, indices):
+        """
+        :param indices: LongTensor with the image ids of the inputs followed
+                        by the image ids of the next inputs (2 x batch_size)
+
+        :return: tuple (inputs, targets, target labels, input labels)
+        """
+        indices = torch.as_tensor(indices)
+        noise = indices == -1
+        has_noise = bool(noise.any())
+        device = self.images.device
+        indices = indices.clamp(min=0).to(device)
+
+        images = self.images.index_select(0, indices)
+        labels = self.labels.index_select(0, indices)
+        if has_noise:
+            noise = noise.to(device)
+            n_noise = int(noise.sum())
+            noise_images = torch.rand(n_noise, images.size(1), device=device)
+            images[noise] = noise_images.sub_(self.mean).div_(self.std)
+            labels[noise] = torch.randint(
+                10, (n_noise,), dtype=labels.dtype, device=device
+            )
+
+        bsz = indices.size(0) // 2
+        return images[:bsz], images[bsz:], labels[bsz:], labels[:bsz]
+
+
+class MNISTTensorSequenceSampler(MNISTSequenceSampler):
+    """
+    Tensorized :class:`MNISTSequenceSampler` yielding one LongTensor of image
+    ids per batch (inputs followed by next inputs, -1 for noise) to be used as
+    sampler of :class:`MNISTTensorDataset`.
+
+    The shuffled image ids of every digit are kept in one padded matrix and the
+    images of the whole batch are drawn with a single gather. When a digit does
+    not have enough images left for the batch, its images are shuffled again
+    and drawn from the beginning.
+    """
+
+    def _build_label_indices(self):
+        digits = sorted({d for seq in self.sequences for d in seq if d != -1})
+        pools = [self._shuffled_digit_indices(digit) for digit in digits]
+
+        # Digit -> row in pools
+        self.digit_rows = torch.zeros(10, dtype=torch.long)
+        self.digit_rows[digits] = torch.arange(len(digits))
+        self.pools = pad_sequence(pools, batch_first=True)
+        self.pool_lengths = torch.tensor([len(pool) for pool in pools])
+        self.pool_cursors = torch.zeros(len(pools), dtype=torch.long)
+
+    def _shuffle_pool(self, row):
+        length = self.pool_lengths[row]
+        self.pools[row, :length] = self.pools[row, torch.randperm(length)]
+        self.pool_cursors[row] = 0
+
+    def _get_next_batch(self):
+        labels = torch.cat(self._next_labels())
+        noise = labels == -1
+        rows = self.digit_rows[labels.clamp(min=0)]
+
+        if self.random_mnist_images:
+            # Successive images of each digit, in batch order
+            one_hot = torch.zeros(len(labels), len(self.pools), dtype=torch.long)
+            one_hot.scatter_(1, rows.unsqueeze(1), (~noise).long().unsqueeze(1))
+            counts = one_hot.sum(dim=0)
+            ranks = (one_hot.cumsum(dim=0) - one_hot).gather(1, rows.unsqueeze(1))
+
+            wrap = self.pool_cursors + counts > self.pool_lengths
+            for row in wrap.nonzero().flatten().tolist():
+                # Begin from beginning & shuffle
+                self._shuffle_pool(row)
+
+            positions = self.pool_cursors[rows] + ranks.squeeze(1)
+            positions %= self.pool_lengths[rows]
+            self.pool_cursors += counts
+        else:
+            # Always take the first image of each digit
+            positions = self.pool_cursors[rows]
+
+        idxs = self.pools[rows, positions]
+        idxs[noise] = -1
+        return idxs
+
+
 def pred_sequence_collate(batch):
     """
     """
@@ -27,6 +27,8 @@ from torchvision import transforms
 from rsm_samplers import (
     MNISTBufferedDataset,
     MNISTSequenceSampler,
+    MNISTTensorDataset,
+    MNISTTensorSequenceSampler,
     pred_sequence_collate,
 )
 
@@ -172,5 +174,71 @@ class StochasticMNISTTest(unittest.TestCase):
         self.assertAlmostEqual(n_zeros / n_ones, 2.0, delta=0.4)
 
 
+class TensorMNISTTest(unittest.TestCase):
+    """
+    Test that the tensorized sampler and dataset produce the same kind of batches
+    """
+
+    def setUp(self):
+        self.BSZ = 2
+        self.SEQ = [[0, 1, 2, 3], [0, 3, 2, 4]]
+        self.dataset = MNISTTensorDataset("~/nta/datasets", download=True)
+        self.reference = MNISTBufferedDataset(
+            "~/nta/datasets",
+            download=True,
+            transform=transforms.Compose(
+                [transforms.ToTensor(), transforms.Normalize((0.1307,), (0.3081,))]
+            ),
+        )
+
+    def _loader(self, **kwargs):
+        sampler = MNISTTensorSequenceSampler(
+            self.dataset,
+            sequences=self.SEQ,
+            batch_size=self.BSZ,
+            randomize_sequence_cursors=False,
+            **kwargs
+        )
+        return DataLoader(self.dataset, sampler=sampler, batch_size=None)
+
+    def test_sequences(self):
+        batches = [batch for _i, batch in zip(range(8), self._loader())]
+        inputs = torch.stack([batch[0] for batch in batches])
+        target_labels = torch.stack([batch[2] for batch in batches])
+        input_labels = torch.stack([batch[3] for batch in batches])
+        self.assertEqual(inputs.shape, (8, self.BSZ, 28 * 28))
+
+        # Digit images with same label are different
+        self.assertTrue(inputs[0, 0].sum() != inputs[0, 1].sum())
+
+        for col in range(self.BSZ):
+            for seq in (input_labels[:4, col], input_labels[4:, col]):
+                self.assertIn(list(seq), self.SEQ)
+            for seq in (target_labels[:3, col], target_labels[4:-1, col]):
+                self.assertIn(list(seq), [s[1:] for s in self.SEQ])
+
+    def test_matches_transforms(self):
+        sampler = self._loader().sampler
+        idxs = next(iter(sampler))
+        inputs, targets, target_labels, input_labels = self.dataset[idxs]
+        expected = torch.stack([self.reference[i][0] for i in idxs.tolist()])
+        expected = expected.view(len(idxs), -1)
+        self.assertTrue(torch.allclose(inputs, expected[: self.BSZ], atol=1e-6))
+        self.assertTrue(torch.allclose(targets, expected[self.BSZ:], atol=1e-6))
+        self.assertEqual(input_labels.tolist(),
+                         self.dataset.targets[idxs[: self.BSZ]].tolist())
+
+    def test_fixed_digit_sampling(self):
+        inputs = next(iter(self._loader(random_mnist_images=False)))[0]
+        self.assertTrue(inputs[0].sum() == inputs[1].sum())
+
+    def test_noise_buffer(self):
+        loader = self._loader(noise_buffer=True)
+        labels = torch.cat([idxs for _i, idxs in zip(range(10), loader.sampler)])
+        self.assertTrue((labels == -1).any())
+        for batch in zip(range(10), loader):
+            self.assertEqual(batch[1][0].shape, (self.BSZ, 28 * 28))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,146 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+import math
+import unittest
+from unittest import mock
+
+import torch
+
+from rsm_experiment import RSMExperiment
+
+CONFIG = dict(
+    input_size=(1, 4, 4),
+    batch_size=3,
+    m_groups=8,
+    n_cells_per_group=2,
+    k_winners=2,
+    predictor_hidden_size=6,
+    predictor_output_size=4,
+    optimizer="sgd",
+    learning_rate=0.1,
+    eval_interval=0,
+)
+
+NUM_BATCHES = 7
+
+
+def make_experiment(**kwargs):
+    config = dict(CONFIG, **kwargs)
+    exp = RSMExperiment(config)
+    torch.manual_seed(42)
+    with mock.patch.object(RSMExperiment, "_build_dataloader"):
+        exp.model_setup(config)
+    exp.device = torch.device("cpu")
+    exp.model.to(exp.device)
+    exp.predictor.to(exp.device)
+    return exp
+
+
+def make_batches():
+    generator = torch.Generator().manual_seed(7)
+    batches = []
+    for _ in range(NUM_BATCHES):
+        inputs = torch.rand((3, 16), generator=generator)
+        targets = torch.rand((3, 16), generator=generator)
+        pred_targets = torch.randint(4, (3,), generator=generator)
+        batches.append((inputs, targets, pred_targets, pred_targets))
+    return batches
+
+
+def train_per_step(exp, batches):
+    """
+    Reference training loop, backpropagating the loss of every timestep on its
+    own, as train_epoch did before truncated BPTT chunks were introduced.
+    """
+    exp.model.train()
+    exp.predictor.train()
+    pcounts = {
+        "total_samples": 0.0,
+        "correct_samples": 0.0,
+        "total_pred_loss": 0.0,
+        "total_interp_loss": 0.0,
+    }
+    total_loss = 0.0
+    hidden = exp._init_hidden(exp.batch_size)
+    for batch_idx, (inputs, targets, pred_targets, _) in enumerate(batches):
+        hidden = exp._repackage_hidden(hidden)
+        exp.optimizer.zero_grad()
+        exp.pred_optimizer.zero_grad()
+        output, hidden = exp.model(inputs, hidden)
+        x_b, pred_input = exp._get_prediction_and_loss_inputs(hidden)
+        loss = exp._compute_loss(output, (targets, x_b))
+        total_loss += loss.item()
+        exp._backward_and_optimize(loss)
+        exp._do_prediction(
+            pred_input, pred_targets, pcounts, train=True, batch_idx=batch_idx
+        )
+    return total_loss / len(batches)
+
+
+class TruncatedBPTTTest(unittest.TestCase):
+    """
+    Test RSMExperiment.train_epoch with different truncated BPTT chunk lengths.
+    """
+
+    def test_chunk_len_one_matches_per_step(self):
+        expected = make_experiment()
+        expected_loss = train_per_step(expected, make_batches())
+
+        exp = make_experiment(tbptt_chunk_len=1)
+        exp.train_loader = make_batches()
+        ret = exp.train_epoch(1)
+
+        self.assertAlmostEqual(ret["train_loss"], expected_loss, places=5)
+        for name, param in exp.model.named_parameters():
+            expected_param = dict(expected.model.named_parameters())[name]
+            self.assertTrue(
+                torch.allclose(param, expected_param, atol=1e-6), name
+            )
+        for param, expected_param in zip(
+            exp.predictor.parameters(), expected.predictor.parameters()
+        ):
+            self.assertTrue(torch.allclose(param, expected_param, atol=1e-6))
+
+    def test_chunked(self):
+        chunk_len = 3
+        exp = make_experiment(tbptt_chunk_len=chunk_len)
+        exp.train_loader = make_batches()
+        initial = [param.clone() for param in exp.model.parameters()]
+
+        with mock.patch.object(
+            exp.optimizer, "step", wraps=exp.optimizer.step
+        ) as step:
+            ret = exp.train_epoch(1)
+
+        # Two full chunks, then the trailing partial chunk is flushed
+        self.assertEqual(step.call_count, math.ceil(NUM_BATCHES / chunk_len))
+        self.assertTrue(math.isfinite(ret["train_loss"]))
+        self.assertTrue(
+            any(
+                not torch.equal(before, after)
+                for before, after in zip(initial, exp.model.parameters())
+            )
+        )
+        self.assertEqual(len(exp.train_hidden_buffer), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
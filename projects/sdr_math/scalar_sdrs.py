@@ -58,6 +58,8 @@ import numpy as np  # noqa E402
 import torch  # noqa E402
 from matplotlib.figure import figaspect  # noqa E402
 
+from nupic.research.frameworks.pytorch.sparse_masks import random_mask  # noqa E402
+
 
 def get_sparse_tensor(num_nonzeros, input_size, output_size,
                       only_positive=False,
@@ -76,20 +78,8 @@ def get_sparse_tensor(num_nonzeros, input_size, output_size,
 
     # Zero out weights for sparse weight matrices
     if num_nonzeros < input_size:
-        num_zeros = input_size - num_nonzeros
-
-        output_indices = np.arange(output_size)
-        input_indices = np.array([np.random.permutation(input_size)[:num_zeros]
-                                 for _ in output_indices], dtype=np.long)
-
-        # Create tensor indices for all non-zero weights
-        zero_indices = np.empty((output_size, num_zeros, 2), dtype=np.long)
-        zero_indices[:, :, 0] = output_indices[:, None]
-        zero_indices[:, :, 1] = input_indices
-        zero_indices = torch.LongTensor(zero_indices.reshape(-1, 2))
-
-        zero_weights = (zero_indices[:, 0], zero_indices[:, 1])
-        w.data[zero_weights] = 0.0
+        mask = random_mask(w.shape, num_nonzeros, dim=0)
+        w.data[~mask] = 0.0
 
     return w
 
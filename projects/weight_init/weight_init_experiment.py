@@ -31,11 +31,10 @@ import numpy as np
 import requests
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader
 from torchvision import datasets, transforms
 
-from nupic.research.frameworks.pytorch.image_transforms import RandomNoise
-from nupic.research.frameworks.pytorch.model_utils import evaluate_model, train_model
+from nupic.research.frameworks.pytorch.dataset_utils import create_cifar10_test_loader
+from nupic.research.frameworks.pytorch.model_utils import evaluate_noise, train_model
 from nupic.torch.modules import (
     Flatten,
     KWinners,
@@ -51,30 +50,6 @@ def cnn_size(width, kernel_size, padding=1, stride=1):
     return (width - kernel_size + 2 * padding) / stride + 1
 
 
-def create_test_loaders(noise_values, batch_size, data_dir):
-    """Create a list of data loaders, one for each noise value."""
-    print("Creating test loaders for noise values:", noise_values)
-    loaders = []
-    for noise in noise_values:
-
-        transform_noise_test = transforms.Compose(
-            [
-                transforms.ToTensor(),
-                transforms.Normalize(
-                    (0.4914, 0.4822, 0.4465), (0.2023, 0.1994, 0.2010)
-                ),
-                RandomNoise(noise, high_value=0.5 + 2 * 0.20, low_value=0.5 - 2 * 0.2),
-            ]
-        )
-
-        testset = datasets.CIFAR10(
-            root=data_dir, train=False, transform=transform_noise_test
-        )
-        loaders.append(DataLoader(testset, batch_size=batch_size, shuffle=False))
-
-    return loaders
-
-
 class TinyCIFARWeightInit(object):
     """Generic class for creating tiny CIFAR models. This can be used with Ray
     tune or PyExperimentSuite, to run a single trial or repetition of a
@@ -204,8 +179,8 @@ class TinyCIFARWeightInit(object):
         self.first_loader = torch.utils.data.DataLoader(
             train_dataset, batch_size=first_epoch_batch_size, shuffle=True
         )
-        self.test_loaders = create_test_loaders(
-            self.noise_values, self.test_batch_size, self.data_dir
+        self.test_loader = create_cifar10_test_loader(
+            self.test_batch_size, self.data_dir
         )
 
         if network_type == "vgg":
@@ -241,7 +216,7 @@ class TinyCIFARWeightInit(object):
         self._post_epoch(epoch)
         train_time = time.time() - t1
 
-        ret = self.run_noise_tests(self.noise_values, self.test_loaders, epoch)
+        ret = self.run_noise_tests(self.noise_values, self.test_loader, epoch)
 
         # Hard coded early stopping criteria for quicker experimentation
         if (
@@ -455,33 +430,36 @@ class TinyCIFARWeightInit(object):
                 self.learning_rate = self.lr_scheduler.get_lr()[0]
                 print("Reducing learning rate to:", self.learning_rate)
 
-    def run_noise_tests(self, noise_values, loaders, epoch):
+    def run_noise_tests(self, noise_values, loader, epoch):
         """
         Test the model with different noise values and return test metrics.
+        All the noise values are evaluated in a single pass over the clean
+        test set loader.
         """
         ret = self.last_noise_results
 
         # Just do noise tests every 3 iterations, about a 2X overall speedup
         if epoch % 3 == 0 or ret is None:
-            ret = {"noise_values": noise_values, "noise_accuracies": []}
-            accuracy = 0.0
-            loss = 0.0
-            for _noise, loader in zip(noise_values, loaders):
-                test_result = evaluate_model(
-                    model=self.model,
-                    loader=loader,
-                    device=self.device,
-                    batches_in_epoch=self.test_batches_in_epoch,
-                    criterion=self.loss_function,
-                )
-                accuracy += test_result["mean_accuracy"]
-                loss += test_result["mean_loss"]
-                ret["noise_accuracies"].append(test_result["mean_accuracy"])
-
-            ret["mean_accuracy"] = accuracy / len(noise_values)
+            results = evaluate_noise(
+                model=self.model,
+                loader=loader,
+                device=self.device,
+                noise_values=noise_values,
+                high_value=0.5 + 2 * 0.20,
+                low_value=0.5 - 2 * 0.2,
+                batches_in_epoch=self.test_batches_in_epoch,
+                criterion=self.loss_function,
+            )
+            ret = {
+                "noise_values": noise_values,
+                "noise_accuracies": [results[noise]["mean_accuracy"]
+                                     for noise in noise_values],
+            }
+            ret["mean_accuracy"] = sum(ret["noise_accuracies"]) / len(noise_values)
             ret["test_accuracy"] = ret["noise_accuracies"][0]
             ret["noise_accuracy"] = ret["noise_accuracies"][-1]
-            ret["mean_loss"] = loss / len(noise_values)
+            ret["mean_loss"] = sum(results[noise]["mean_loss"]
+                                   for noise in noise_values) / len(noise_values)
 
             self.last_noise_results = ret
 
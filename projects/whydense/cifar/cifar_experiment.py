@@ -30,8 +30,9 @@ import torch.nn as nn
 from torch.utils.data import DataLoader
 from torchvision import datasets, transforms
 
+from nupic.research.frameworks.pytorch.dataset_utils import create_cifar10_test_loader
 from nupic.research.frameworks.pytorch.image_transforms import RandomNoise
-from nupic.research.frameworks.pytorch.model_utils import evaluate_model, train_model
+from nupic.research.frameworks.pytorch.model_utils import evaluate_noise, train_model
 from nupic.research.frameworks.pytorch.models import VGGSparseNet
 from nupic.torch.modules import rezero_weights, update_boost_strength
 
@@ -193,8 +194,8 @@ class TinyCIFAR(object):
             train_dataset, batch_size=first_epoch_batch_size, shuffle=True,
             pin_memory=True,
         )
-        self.test_loaders = create_test_loaders(
-            self.noise_values, self.test_batch_size, self.data_dir
+        self.test_loader = create_cifar10_test_loader(
+            self.test_batch_size, self.data_dir, pin_memory=True
         )
 
         if network_type == "vgg":
@@ -230,7 +231,7 @@ class TinyCIFAR(object):
         self._post_epoch(epoch)
         train_time = time.time() - t1
 
-        ret = self.run_noise_tests(self.noise_values, self.test_loaders, epoch)
+        ret = self.run_noise_tests(self.noise_values, self.test_loader, epoch)
 
         # Hard coded early stopping criteria for quicker experimentation
         if (
@@ -342,33 +343,36 @@ class TinyCIFAR(object):
                 self.learning_rate = self.lr_scheduler.get_lr()[0]
                 print("Reducing learning rate to:", self.learning_rate)
 
-    def run_noise_tests(self, noise_values, loaders, epoch):
+    def run_noise_tests(self, noise_values, loader, epoch):
         """
         Test the model with different noise values and return test metrics.
+        All the noise values are evaluated in a single pass over the clean
+        test set loader.
         """
         ret = self.last_noise_results
 
         # Just do noise tests every 3 iterations, about a 2X overall speedup
         if epoch % 3 == 0 or ret is None:
-            ret = {"noise_values": noise_values, "noise_accuracies": []}
-            accuracy = 0.0
-            loss = 0.0
-            for _noise, loader in zip(noise_values, loaders):
-                test_result = evaluate_model(
-                    model=self.model,
-                    loader=loader,
-                    device=self.device,
-                    batches_in_epoch=self.test_batches_in_epoch,
-                    criterion=self.loss_function,
-                )
-                accuracy += test_result["mean_accuracy"]
-                loss += test_result["mean_loss"]
-                ret["noise_accuracies"].append(test_result["mean_accuracy"])
-
-            ret["mean_accuracy"] = accuracy / len(noise_values)
+            results = evaluate_noise(
+                model=self.model,
+                loader=loader,
+                device=self.device,
+                noise_values=noise_values,
+                high_value=0.5 + 2 * 0.20,
+                low_value=0.5 - 2 * 0.2,
+                batches_in_epoch=self.test_batches_in_epoch,
+                criterion=self.loss_function,
+            )
+            ret = {
+                "noise_values": noise_values,
+                "noise_accuracies": [results[noise]["mean_accuracy"]
+                                     for noise in noise_values],
+            }
+            ret["mean_accuracy"] = sum(ret["noise_accuracies"]) / len(noise_values)
             ret["test_accuracy"] = ret["noise_accuracies"][0]
             ret["noise_accuracy"] = ret["noise_accuracies"][-1]
-            ret["mean_loss"] = loss / len(noise_values)
+            ret["mean_loss"] = sum(results[noise]["mean_loss"]
+                                   for noise in noise_values) / len(noise_values)
 
             self.last_noise_results = ret
 
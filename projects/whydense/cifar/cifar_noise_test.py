@@ -28,6 +28,7 @@ import numpy as np
 import torch
 from torchvision import datasets
 
+from nupic.research.frameworks.pytorch.dataset_utils import create_cifar10_test_loader
 from nupic.research.support.parse_config import parse_config
 from projects.whydense.cifar.cifar_experiment import TinyCIFAR, create_test_loaders
 
@@ -310,15 +311,13 @@ def run_noise_tests(config, options, project_dir):
         options.checkpoint_path or os.path.join(path, tiny_cifar.model_filename)
     )
 
-    # Create new loaders with batch size 1
+    # All noise values are evaluated from the same clean test loader
     noise_values = [0.0, 0.025, 0.05, 0.075, 0.1, 0.125, 0.15, 0.175]
-    loaders = create_test_loaders(
-        noise_values, batch_size=64, data_dir=tiny_cifar.data_dir
-    )
+    loader = create_cifar10_test_loader(batch_size=64, data_dir=tiny_cifar.data_dir)
 
     print("Running full noise tests using noise values", noise_values)
 
-    ret = tiny_cifar.run_noise_tests(noise_values, loaders, 300)
+    ret = tiny_cifar.run_noise_tests(noise_values, loader, 300)
 
     print(ret)
 
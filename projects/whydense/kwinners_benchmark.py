@@ -0,0 +1,100 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the k-winners selection strategies across batch sizes, unit counts and
+k, including boosting and the duty cycle update of a training step.
+"""
+
+import argparse
+from time import time
+
+import torch
+
+from nupic.research.frameworks.pytorch.functions import (
+    KWINNERS_STRATEGIES,
+    kwinners,
+)
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def time_fn(fn, device, repeats):
+    fn()
+    synchronize(device)
+    t0 = time()
+    for _ in range(repeats):
+        fn()
+    synchronize(device)
+    return (time() - t0) / repeats
+
+
+def main(args):
+    device = torch.device(args.device)
+    print(
+        "{:>6} {:>8} {:>7} ".format("batch", "units", "k")
+        + " ".join("{:>13}".format(s + " (ms)") for s in args.strategies)
+    )
+    for units in args.units:
+        duty_cycle = torch.zeros(units, device=device)
+        for batch_size in args.batch_sizes:
+            x = torch.randn(batch_size, units, device=device)
+            for percent_on in args.percent_on:
+                k = max(int(units * percent_on), 1)
+                times = []
+                for strategy in args.strategies:
+
+                    def run():
+                        kwinners(x, k, duty_cycle, args.boost_strength,
+                                 strategy=strategy, period=args.period)
+
+                    times.append(time_fn(run, device, args.repeats))
+                print(
+                    "{:>6} {:>8} {:>7} ".format(batch_size, units, k)
+                    + " ".join("{:>13.3f}".format(t * 1000) for t in times)
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--device", default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[16, 64, 256]
+    )
+    parser.add_argument(
+        "--units", type=int, nargs="+", default=[1000, 1600, 64 * 14 * 14]
+    )
+    parser.add_argument(
+        "--percent-on", type=float, nargs="+", default=[0.05, 0.1, 0.2]
+    )
+    parser.add_argument(
+        "--strategies", nargs="+", default=list(KWINNERS_STRATEGIES),
+        choices=KWINNERS_STRATEGIES
+    )
+    parser.add_argument("--boost-strength", type=float, default=1.5)
+    parser.add_argument("--period", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,166 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+Compare the CPU inference latency and memory of the dense models against their
+compressed sparse export. See :func:`export_sparse_model`
+"""
+import time
+
+import click
+import torch
+from tabulate import tabulate
+
+from nupic.research.frameworks.pytorch.models.le_sparse_net import LeSparseNet
+from nupic.research.frameworks.pytorch.remove_batchnorm import remove_batchnorm
+from nupic.research.frameworks.pytorch.sparse_inference import (
+    export_sparse_model,
+    model_nbytes,
+)
+from nupic.research.support import parse_config
+from nupic.torch.modules import rezero_weights
+
+
+def create_model(params, num_classes=12):
+    model = LeSparseNet(
+        input_shape=params.get("input_shape", (1, 32, 32)),
+        cnn_out_channels=params["cnn_out_channels"],
+        cnn_activity_percent_on=params["cnn_percent_on"],
+        cnn_weight_percent_on=params["cnn_weight_sparsity"],
+        linear_n=params["linear_n"],
+        linear_activity_percent_on=params["linear_percent_on"],
+        linear_weight_percent_on=params["weight_sparsity"],
+        boost_strength=params["boost_strength"],
+        boost_strength_factor=params["boost_strength_factor"],
+        use_batch_norm=params["use_batch_norm"],
+        num_classes=num_classes,
+        k_inference_factor=params["k_inference_factor"],
+        activation_fct_before_max_pool=params.get(
+            "activation_fct_before_max_pool", False),
+    )
+    model.apply(rezero_weights)
+    model.eval()
+    if params["use_batch_norm"]:
+        model = remove_batchnorm(model)
+    return model
+
+
+def measure_latency(model, x, iterations):
+    """Mean inference time in milliseconds"""
+    with torch.no_grad():
+        model(x)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            model(x)
+        return (time.perf_counter() - start) * 1000.0 / iterations
+
+
+@click.command()
+@click.option(
+    "-c",
+    "--config",
+    metavar="FILE",
+    type=open,
+    default="gsc/experiments.cfg",
+    show_default=True,
+    help="your experiments config file",
+)
+@click.option(
+    "-e",
+    "--experiment",
+    default=["denseCNN2", "sparseCNN2", "SuperSparseCNN2"],
+    multiple=True,
+    help="Selected experiments to compare.",
+)
+@click.option(
+    "-b",
+    "--batch-size",
+    default=[1, 64],
+    type=int,
+    multiple=True,
+    show_default=True,
+    help="Inference batch sizes",
+)
+@click.option(
+    "-n",
+    "--iterations",
+    default=100,
+    show_default=True,
+    help="Number of inference iterations to average",
+)
+@click.option(
+    "--threads",
+    default=1,
+    show_default=True,
+    help="Number of CPU threads. See 'torch.set_num_threads'",
+)
+@click.option(
+    "-f",
+    "--format",
+    "tablefmt",
+    help="Table format",
+    type=click.Choice(choices=["grid", "latex"]),
+    show_default=True,
+    default="grid",
+)
+@click.option(
+    "-l",
+    "--list",
+    "show_list",
+    is_flag=True,
+    help="show list of available experiments.",
+)
+def main(config, experiment, batch_size, iterations, threads, tablefmt,
+         show_list):
+    configs = parse_config(config, experiment, globals_param=globals())
+    if show_list:
+        print("Experiments:", list(configs.keys()))
+        return
+
+    torch.set_num_threads(threads)
+    torch.manual_seed(42)
+    table = [["Network", "Batch size", "Dense (ms)", "Sparse (ms)", "Speedup",
+              "Dense (KB)", "Sparse (KB)", "Compression"]]
+    for name, params in configs.items():
+        dense = create_model(params)
+        sparse = export_sparse_model(dense)
+        dense_bytes = model_nbytes(dense)
+        sparse_bytes = model_nbytes(sparse)
+        input_shape = tuple(params.get("input_shape", (1, 32, 32)))
+        for size in batch_size:
+            x = torch.randn((size,) + input_shape)
+            dense_time = measure_latency(dense, x, iterations)
+            sparse_time = measure_latency(sparse, x, iterations)
+            table.append([
+                name, size,
+                "{0:.3f}".format(dense_time),
+                "{0:.3f}".format(sparse_time),
+                "{0:.2f}x".format(dense_time / sparse_time),
+                "{0:,.0f}".format(dense_bytes / 1024),
+                "{0:,.0f}".format(sparse_bytes / 1024),
+                "{0:.2f}x".format(dense_bytes / sparse_bytes),
+            ])
+
+    print(tabulate(table, headers="firstrow", tablefmt=tablefmt,
+                   stralign="center", floatfmt=".3f", numalign="center"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+
+import unittest
+
+import torch
+
+from nupic.research.frameworks.backprop_structure.modules import BinaryGatedConv2d
+
+
+class OneSamplePerItemTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(42)
+        self.x = torch.randn(10, 4, 6, 6)
+
+    def create_layer(self, **kwargs):
+        layer = BinaryGatedConv2d(4, 6, 3, one_sample_per_item=True,
+                                  use_baseline_bias=True, **kwargs)
+        layer.train()
+        return layer
+
+    def test_samples_per_chunk(self):
+        layer = self.create_layer()
+        self.assertEqual(layer.samples_per_chunk(10), 10)
+        item_bytes = 6 * layer.exc_weight.numel() * 4
+        layer.sample_memory_budget = 3 * item_bytes
+        self.assertEqual(layer.samples_per_chunk(10), 3)
+        layer.sample_memory_budget = 1
+        self.assertEqual(layer.samples_per_chunk(10), 1)
+
+    def test_chunked_matches_full_batch(self):
+        """With saturated gates the sampled weights don't depend on the chunks"""
+        full = self.create_layer()
+        full.exc_p1.data.bernoulli_(0.5).mul_(2).sub_(0.5)
+        full.inh_p1.data.bernoulli_(0.5).mul_(2).sub_(0.5)
+        chunked = self.create_layer(sample_memory_budget=1)
+        chunked.load_state_dict(full.state_dict())
+
+        expected = full(self.x)
+        result = chunked(self.x)
+        self.assertTrue(torch.allclose(expected, result, atol=1e-6))
+
+        expected.sum().backward()
+        result.sum().backward()
+        for name in ["exc_p1", "inh_p1", "exc_weight", "inh_weight"]:
+            self.assertTrue(torch.allclose(getattr(full, name).grad,
+                                           getattr(chunked, name).grad,
+                                           atol=1e-5))
+
+    def test_sampled_gate_statistics(self):
+        layer = self.create_layer()
+        layer.exc_p1.data.fill_(0.25)
+        u = layer.uniform_samples(4000)
+        self.assertEqual(u.shape, (4000,) + layer.exc_p1.shape)
+        self.assertAlmostEqual((u < 0.25).float().mean().item(), 0.25, places=2)
+
+    def test_uniform_buffer(self):
+        # Without a budget the samples are allocated on every call
+        layer = self.create_layer()
+        layer(self.x)
+        self.assertIsNone(layer._uniform_buffer)
+
+        # With a budget the buffer holds one chunk and is reused
+        item_bytes = 6 * layer.exc_weight.numel() * 4
+        layer = self.create_layer(sample_memory_budget=3 * item_bytes)
+        layer(self.x)
+        buf = layer._uniform_buffer
+        self.assertEqual(buf.shape, (3,) + layer.exc_p1.shape)
+        layer(self.x)
+        self.assertIs(layer._uniform_buffer, buf)
+
+        # Shrinks with the batch size, matches the parameters dtype
+        layer(self.x[:2])
+        self.assertEqual(layer._uniform_buffer.size(0), 2)
+        layer.double()
+        layer(self.x.double())
+        self.assertEqual(layer._uniform_buffer.dtype, torch.float64)
+
+        # Freed for evaluation
+        layer.eval()
+        self.assertIsNone(layer._uniform_buffer)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+
+import unittest
+
+import torch
+
+from nupic.research.frameworks.backprop_structure.modules import (
+    BinaryGatedConv2d,
+    BinaryGatedLinear,
+    HardConcreteGatedConv2d,
+    HardConcreteGatedLinear,
+)
+
+
+def loop_inference_mask(p1):
+    """Reference per unit implementation of the non deterministic mask"""
+    p1 = p1.clamp(0, 1)
+    mask = torch.zeros_like(p1)
+    counts = p1.sum(dim=tuple(range(1, len(p1.shape)))).round().int()
+    for i in range(p1.size(0)):
+        _, indices = torch.topk(p1[i].flatten(), counts[i].item())
+        mask[i].flatten().scatter_(-1, indices, 1)
+    return mask
+
+
+class InferenceMaskTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(42)
+        self.layers = [
+            BinaryGatedLinear(30, 20, optimize_inference=True),
+            BinaryGatedConv2d(3, 8, 3, optimize_inference=True),
+        ]
+        for layer in self.layers:
+            layer.exc_p1.data.uniform_(-0.5, 1.5)
+            layer.inh_p1.data.uniform_(-0.5, 1.5)
+
+    def test_matches_reference(self):
+        for layer in self.layers:
+            exc_mask, inh_mask = layer.get_inference_mask()
+            self.assertTrue(torch.equal(exc_mask, loop_inference_mask(layer.exc_p1)))
+            self.assertTrue(torch.equal(inh_mask, loop_inference_mask(layer.inh_p1)))
+
+    def test_cache_invalidation(self):
+        layer = self.layers[0]
+        layer.eval()
+        x = torch.randn(4, 30)
+        with torch.no_grad():
+            y1 = layer(x)
+            self.assertIs(layer.get_inference_weight(),
+                          layer.get_inference_weight())
+
+            # In place update of the parameters
+            layer.exc_p1.mul_(-1)
+            y2 = layer(x)
+            expected = layer._compute_inference_weight()
+        self.assertFalse(torch.equal(y1, y2))
+        self.assertTrue(torch.equal(layer.get_inference_weight(), expected))
+
+        # Direct update of the data requires clearing the cache
+        layer.inh_p1.data.mul_(-1)
+        layer.clear_inference_cache()
+        exc_mask, inh_mask = layer.get_inference_mask()
+        self.assertTrue(torch.equal(inh_mask, loop_inference_mask(layer.inh_p1)))
+
+    def test_gradient_in_eval(self):
+        layer = self.layers[1]
+        layer.eval()
+        layer(torch.randn(2, 3, 8, 8)).sum().backward()
+        self.assertIsNotNone(layer.exc_weight.grad)
+
+
+class HardConcreteInferenceTest(unittest.TestCase):
+    def test_cached_inference(self):
+        torch.manual_seed(42)
+        for layer, x in [(HardConcreteGatedLinear(30, 20), torch.randn(4, 30)),
+                         (HardConcreteGatedConv2d(3, 8, 3),
+                          torch.randn(4, 3, 8, 8))]:
+            layer.loga.data.normal_(0, 3)
+            layer.eval()
+            with torch.no_grad():
+                y1 = layer(x)
+                weight = layer.get_inference_weight()
+                self.assertIs(weight, layer.get_inference_weight())
+                self.assertTrue(torch.equal(
+                    weight, layer.get_inference_gates() * layer.weight))
+                self.assertTrue(torch.equal(
+                    layer.get_inference_nonzeros(),
+                    (weight != 0).flatten(1).sum(dim=1)))
+
+                layer.loga.add_(1.0)
+                y2 = layer(x)
+            self.assertFalse(torch.equal(y1, y2))
+
+            layer.train()
+            self.assertEqual(layer.__dict__["_inference_cache"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
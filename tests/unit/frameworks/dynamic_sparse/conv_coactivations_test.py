@@ -174,6 +174,50 @@ class CoactivationsTest(unittest.TestCase):
         )
         self.assertTrue(conv.coactivations.allclose(coacts, atol=0, rtol=0))
 
+    def test_backend_equivalence(self):
+        """The unfold and grouped_conv backends should give the same results."""
+        shapes = [
+            dict(in_channels=3, out_channels=5, kernel_size=3, stride=1, padding=0),
+            dict(in_channels=4, out_channels=6, kernel_size=3, stride=2, padding=1),
+            dict(
+                in_channels=2,
+                out_channels=7,
+                kernel_size=(2, 3),
+                stride=1,
+                padding=(1, 0),
+            ),
+        ]
+        for shape in shapes:
+            for test in ["variance", "correlation", "correlation_proxy"]:
+                conv = DSConv2d(**shape, config=dict(coactivation_test=test))
+                input_tensor = torch.relu(torch.randn(8, shape["in_channels"], 9, 9))
+                with torch.no_grad():
+                    output_tensor = torch.relu(conv(input_tensor))
+
+                conv.coactivation_backend = "grouped_conv"
+                expected = conv.calc_coactivations(input_tensor, output_tensor)
+
+                # Use a tiny budget to exercise chunking over output channels.
+                conv.coactivation_backend = "unfold"
+                conv.coactivation_memory_budget = 1
+                actual = conv.calc_coactivations(input_tensor, output_tensor)
+
+                self.assertEqual(actual.shape, conv.weight.shape)
+                self.assertTrue(
+                    actual.allclose(expected, atol=1e-4, rtol=1e-4),
+                    "Backends differ for {} with {}".format(test, shape),
+                )
+
+    def test_load_legacy_state_dict(self):
+        """Checkpoints with the grouped_conv helper weights load strictly."""
+        legacy = DSConv2d(2, 3, 3, config=dict(coactivation_backend="grouped_conv"))
+        state_dict = legacy.state_dict()
+        state_dict["grouped_conv.weight"] = legacy.grouped_conv.weight.detach()
+        model = torch.nn.Sequential(DSConv2d(2, 3, 3))
+        model.load_state_dict({"0." + k: v for k, v in state_dict.items()})
+        self.assertTrue(model[0].weight.equal(legacy.weight))
+        self.assertIsNone(model[0].grouped_conv)
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
@@ -0,0 +1,101 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+
+import unittest
+
+import torch
+
+from nupic.research.frameworks.dynamic_sparse.networks import DSLinear
+
+
+def loop_coactivations(x, y, binary):
+    """Reference implementation: accumulate one outer product per sample."""
+    if binary:
+        x, y = (x > 0).float(), (y > 0).float()
+    outer = 0
+    for s in range(x.shape[0]):
+        outer += torch.ger(y[s], x[s])
+    return outer
+
+
+class LinearCoactivationsTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(42)
+
+    def _run(self, config, binary=True, num_batches=3):
+        layer = DSLinear(20, 10, config=config)
+        layer.use_binary_coactivations = binary
+        layer.init_coactivation_tracking()
+        layer.train()
+
+        alpha = config.get("moving_average_alpha", None)
+        expected = torch.zeros_like(layer.coactivations)
+        for _ in range(num_batches):
+            x = torch.randn(16, 20)
+            y = layer(x)
+            new_coacts = loop_coactivations(x, y.detach(), binary)
+            if alpha:
+                expected = (1 - alpha) * expected + alpha * new_coacts
+            else:
+                expected = expected + new_coacts
+
+        return layer, expected
+
+    def test_binary(self):
+        layer, expected = self._run(dict())
+        self.assertTrue(torch.equal(layer.coactivations, expected))
+
+    def test_real_valued(self):
+        layer, expected = self._run(dict(), binary=False)
+        self.assertTrue(torch.allclose(layer.coactivations, expected, atol=1e-4))
+
+    def test_moving_average(self):
+        layer, expected = self._run(dict(moving_average_alpha=0.3))
+        self.assertTrue(torch.allclose(layer.coactivations, expected, atol=1e-5))
+
+    def test_update_func(self):
+        def update_func(coacts, new_coacts):
+            return torch.max(coacts, new_coacts)
+
+        layer = DSLinear(20, 10, config=dict(update_func=update_func))
+        layer.init_coactivation_tracking()
+        layer.train()
+
+        expected = torch.zeros_like(layer.coactivations)
+        for _ in range(3):
+            x = torch.randn(16, 20)
+            y = layer(x)
+            expected = torch.max(expected, loop_coactivations(x, y.detach(), True))
+
+        self.assertTrue(torch.equal(layer.coactivations, expected))
+
+    def test_calc_coactivations(self):
+        layer = DSLinear(20, 10)
+        x = torch.randn(16, 20)
+        y = layer(x)
+        self.assertTrue(
+            torch.equal(
+                layer.calc_coactivations(x, y), loop_coactivations(x, y.detach(), True)
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,191 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+
+import unittest
+
+import numpy as np
+import torch
+
+from nupic.research.frameworks.dynamic_sparse.models.mask_updates import (
+    hebbian_add_masks,
+    hebbian_keep_masks,
+    magnitude_keep_masks,
+    random_add_masks,
+)
+
+
+# The original per module masks of DSNNHeb, used as reference
+def get_hebbian_mask(weight, corr, active_synapses, prune_perc):
+    num_synapses = np.prod(weight.shape)
+    total_active = torch.sum(active_synapses).item()
+    corr_active = corr[active_synapses]
+    kth = int(prune_perc * total_active)
+    if kth == 0:
+        hebbian_mask = active_synapses
+    elif kth >= num_synapses:
+        hebbian_mask = torch.zeros(weight.shape)
+    else:
+        keep_threshold, _ = torch.kthvalue(corr_active, kth)
+        hebbian_mask = (corr > keep_threshold) & active_synapses
+    return hebbian_mask
+
+
+def get_inverse_hebbian_mask(weight, corr, active_synapses, prune_perc):
+    num_synapses = np.prod(weight.shape)
+    total_active = torch.sum(active_synapses).item()
+    corr_active = corr[active_synapses]
+    kth = int((1 - prune_perc) * total_active)
+    if kth == 0:
+        hebbian_mask = torch.zeros(weight.shape).bool()
+    elif kth >= num_synapses:
+        hebbian_mask = active_synapses
+    else:
+        keep_threshold, _ = torch.kthvalue(corr_active, kth)
+        hebbian_mask = (corr <= keep_threshold) & active_synapses
+    return hebbian_mask
+
+
+def get_magnitude_mask(weight, active_synapses, prune_perc):
+    weight_pos = weight[weight > 0]
+    pos_kth = int(prune_perc * len(weight_pos))
+    if len(weight_pos) > 0:
+        if pos_kth == 0:
+            pos_threshold = -1
+        else:
+            pos_threshold, _ = torch.kthvalue(weight_pos, pos_kth)
+    else:
+        pos_threshold = 0
+
+    weight_neg = weight[weight < 0]
+    neg_kth = int((1 - prune_perc) * len(weight_neg))
+    if len(weight_neg) > 0:
+        if neg_kth == 0:
+            neg_threshold = torch.min(weight_neg).item() - 1
+        else:
+            neg_threshold, _ = torch.kthvalue(weight_neg, neg_kth)
+    else:
+        neg_threshold = -1
+
+    partial_weight_mask = (weight > pos_threshold) | (weight <= neg_threshold)
+    return partial_weight_mask & active_synapses
+
+
+def get_hebbian_add_mask(corr, nonactive_synapses, num_add):
+    total_nonactive = torch.sum(nonactive_synapses).item()
+    kth = int(total_nonactive - num_add)
+    corr_nonactive = corr[nonactive_synapses]
+    add_threshold, _ = torch.kthvalue(corr_nonactive, kth)
+    return (corr > add_threshold) & nonactive_synapses
+
+
+def get_inverse_add_mask(corr, nonactive_synapses, num_add):
+    kth = int(num_add)
+    if kth > 0:
+        corr_nonactive = corr[nonactive_synapses]
+        add_threshold, _ = torch.kthvalue(corr_nonactive, kth)
+        return (corr <= add_threshold) & nonactive_synapses
+    return torch.zeros(nonactive_synapses.shape).bool()
+
+
+def assert_masks_equal(test, masks, expected):
+    for mask, expected_mask in zip(masks, expected):
+        test.assertTrue(torch.equal(mask, expected_mask.bool()))
+
+
+class MaskUpdatesTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(42)
+        self.weights = [torch.randn(50, 40), torch.randn(8, 3, 3, 3)]
+        self.actives = [torch.rand(w.shape) < 0.5 for w in self.weights]
+        for weight, active in zip(self.weights, self.actives):
+            weight.mul_(active.float())
+
+        # Half of the coactivations are zero, many ties
+        self.corrs = [torch.rand(w.shape) * (torch.rand(w.shape) < 0.5).float()
+                      for w in self.weights]
+
+    def test_weighted_magnitude_keep_masks(self):
+        """Zero products are pruned as in the original masks"""
+        products = [w * c for w, c in zip(self.weights, self.corrs)]
+        for perc in [0.1, 0.3, 0.9]:
+            masks = magnitude_keep_masks(products, self.actives, [perc, perc])
+            expected = [get_magnitude_mask(w, a, perc)
+                        for w, a in zip(products, self.actives)]
+            assert_masks_equal(self, masks, expected)
+
+    def test_magnitude_keep_masks(self):
+        for percs in ([0.2, 0.5], [1.0, 0.7]):
+            masks = magnitude_keep_masks(self.weights, self.actives, percs)
+            expected = [get_magnitude_mask(w, a, p)
+                        for w, a, p in zip(self.weights, self.actives, percs)]
+            assert_masks_equal(self, masks, expected)
+
+    def test_magnitude_keep_masks_no_pruned_positive(self):
+        """
+        Keeps every positive weight. Unlike the original mask, the negative
+        weights above -1 are pruned as usual
+        """
+        weight = torch.tensor([0.5, 0.2, -0.3, -0.6, 0.0])
+        active = weight != 0
+        mask, = magnitude_keep_masks([weight], [active], [0.1])
+        self.assertEqual(mask.tolist(), [True, True, False, True, False])
+        mask, = magnitude_keep_masks([weight], [active], [0.5])
+        self.assertEqual(mask.tolist(), [True, False, False, True, False])
+
+    def test_hebbian_keep_masks(self):
+        for percs in ([0.1, 0.4], [0.6, 0.0], [1.0, 1.0]):
+            masks = hebbian_keep_masks(self.corrs, self.actives, percs)
+            expected = [get_hebbian_mask(w, c, a, p) for w, c, a, p in zip(
+                self.weights, self.corrs, self.actives, percs)]
+            assert_masks_equal(self, masks, expected)
+
+            masks = hebbian_keep_masks(self.corrs, self.actives, percs,
+                                       inverse=True)
+            expected = [get_inverse_hebbian_mask(w, c, a, p) for w, c, a, p in zip(
+                self.weights, self.corrs, self.actives, percs)]
+            assert_masks_equal(self, masks, expected)
+
+    def test_hebbian_add_masks(self):
+        nonactives = [~active for active in self.actives]
+        for adds in ([50, 30], [900, 1]):
+            num_adds = torch.tensor(adds)
+            masks = hebbian_add_masks(self.corrs, nonactives, num_adds)
+            expected = [get_hebbian_add_mask(c, n, a)
+                        for c, n, a in zip(self.corrs, nonactives, adds)]
+            assert_masks_equal(self, masks, expected)
+
+            masks = hebbian_add_masks(self.corrs, nonactives, num_adds,
+                                      inverse=True)
+            expected = [get_inverse_add_mask(c, n, a)
+                        for c, n, a in zip(self.corrs, nonactives, adds)]
+            assert_masks_equal(self, masks, expected)
+
+    def test_random_add_masks(self):
+        nonactives = [~active for active in self.actives]
+        num_adds = torch.tensor([50, 1000])
+        masks = random_add_masks(nonactives, num_adds)
+        for mask, nonactive, num_add in zip(masks, nonactives, num_adds):
+            self.assertFalse((mask & ~nonactive).any())
+            self.assertEqual(int(mask.sum()),
+                             min(int(num_add), int(nonactive.sum())))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+import unittest
+
+import librosa
+import numpy as np
+import torch
+
+from nupic.research.frameworks.pytorch.audio_transforms import (
+    BatchAddBackgroundNoise,
+    BatchChangeAmplitude,
+    BatchChangeSpeedAndPitch,
+    BatchMelSpectrogram,
+    BatchTimeshift,
+)
+
+
+class BatchAudioTransformsTest(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+        self.samples = torch.rand(8, 16000) * 2 - 1
+
+    def test_change_amplitude(self):
+        transform = BatchChangeAmplitude(amplitude_range=(0.5, 0.5), prob=1.0)
+        self.assertTrue(torch.allclose(transform(self.samples), self.samples * 0.5))
+
+        transform = BatchChangeAmplitude(prob=0.0)
+        self.assertTrue(torch.equal(transform(self.samples), self.samples))
+
+    def test_change_speed(self):
+        transform = BatchChangeSpeedAndPitch(max_scale=0.0, prob=1.0)
+        self.assertTrue(torch.allclose(transform(self.samples), self.samples))
+
+        transform = BatchChangeSpeedAndPitch(max_scale=0.2, prob=1.0)
+        resampled = transform(self.samples)
+        self.assertEqual(resampled.shape, self.samples.shape)
+        # The first sample is never moved
+        self.assertTrue(torch.allclose(resampled[:, 0], self.samples[:, 0]))
+
+    def test_timeshift(self):
+        transform = BatchTimeshift(max_shift_seconds=0.01, prob=1.0)
+        shifted = transform(self.samples)
+        for x, y in zip(self.samples, shifted):
+            # Find the shift used by each sample
+            matches = [
+                shift for shift in range(-160, 161)
+                if torch.equal(y[max(0, -shift):16000 - max(0, shift)],
+                               x[max(0, shift):16000 - max(0, -shift)])
+            ]
+            self.assertEqual(len(matches), 1)
+
+    def test_background_noise(self):
+        bg_dataset = [{"samples": np.full(16000, 0.5, dtype=np.float32)}]
+        transform = BatchAddBackgroundNoise(bg_dataset, max_percentage=0.45,
+                                            prob=1.0)
+        noisy = transform(torch.zeros(8, 16000))
+        self.assertTrue((noisy <= 0.5 * 0.45).all())
+        self.assertTrue((noisy == noisy[:, :1]).all())
+
+    def test_mel_spectrogram(self):
+        transform = BatchMelSpectrogram(n_mels=32)
+        mel = transform(self.samples)
+        self.assertEqual(mel.shape, (8, 32, 32))
+        for x, y in zip(self.samples.numpy(), mel.numpy()):
+            s = librosa.feature.melspectrogram(y=x, sr=16000, n_mels=32,
+                                               pad_mode="reflect")
+            expected = librosa.power_to_db(s, ref=np.max)
+            np.testing.assert_allclose(y, expected, atol=1e-3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+import unittest
+from unittest import mock
+
+import numpy as np
+import torch
+from PIL import Image
+
+from nupic.research.frameworks.pytorch.imagenet.auto_augment import (
+    OPERATIONS,
+    TENSOR_OPERATIONS,
+    CIFAR10Policy,
+    ImageNetPolicy,
+    SVHNPolicy,
+    TensorPolicy,
+    ToByteTensor,
+)
+
+
+class TensorOperationsTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        arrays = (rng.rand(4, 20, 24, 3) * 200 + 20).astype(np.uint8)
+        self.images = [Image.fromarray(a) for a in arrays]
+        self.tensors = torch.stack([ToByteTensor()(img) for img in self.images])
+
+    def assert_same(self, pil_op, tensor_op, magnitude, max_diff=0):
+        # Draw the same random signs used by the tensor operations
+        torch.manual_seed(42)
+        signs = (torch.randint(0, 2, (4,)) * 2 - 1).tolist()
+        with mock.patch("random.choice", side_effect=signs):
+            expected = np.stack([np.asarray(pil_op(img, magnitude))
+                                 for img in self.images])
+        torch.manual_seed(42)
+        actual = tensor_op(self.tensors, torch.full((4,), float(magnitude)))
+        diff = np.abs(expected.transpose(0, 3, 1, 2).astype(int)
+                      - actual.numpy().astype(int))
+        self.assertLessEqual(diff.max(), max_diff)
+
+    def test_lut_operations(self):
+        """Point operations are identical to PIL.ImageOps"""
+        self.assert_same(OPERATIONS["posterize"], TENSOR_OPERATIONS["posterize"], 5)
+        self.assert_same(OPERATIONS["solarize"], TENSOR_OPERATIONS["solarize"], 100)
+        for name in ("invert", "autocontrast", "equalize"):
+            self.assert_same(OPERATIONS[name], TENSOR_OPERATIONS[name], 0)
+
+    def test_enhance_operations(self):
+        """Blend operations are within rounding of PIL.ImageEnhance"""
+        for name in ("color", "contrast", "brightness", "sharpness"):
+            self.assert_same(OPERATIONS[name], TENSOR_OPERATIONS[name], 0.5,
+                             max_diff=1)
+
+    def test_geometric_operations(self):
+        """Translate and rotate are identical to PIL"""
+        self.assert_same(OPERATIONS["translate_x"], TENSOR_OPERATIONS["translate_x"],
+                         0.2)
+        self.assert_same(OPERATIONS["translate_y"], TENSOR_OPERATIONS["translate_y"],
+                         0.2)
+        self.assert_same(OPERATIONS["rotate"], TENSOR_OPERATIONS["rotate"], 15)
+
+
+class TensorPolicyTest(unittest.TestCase):
+
+    def test_shapes(self):
+        """Applies to single images and batches of images"""
+        images = torch.randint(0, 256, (8, 3, 16, 16), dtype=torch.uint8)
+        for policy in (ImageNetPolicy(), CIFAR10Policy(), SVHNPolicy()):
+            policy = TensorPolicy(policy)
+            batch = policy(images)
+            self.assertEqual(batch.shape, images.shape)
+            self.assertEqual(batch.dtype, torch.uint8)
+            single = policy(images[0])
+            self.assertEqual(single.shape, images[0].shape)
+
+    def test_sub_policy(self):
+        """Applies the sub-policy operations with the sub-policy probability"""
+        policy = ImageNetPolicy()
+        policy.policies = [p for p in policy.policies
+                           if p.op1name == p.op2name == "equalize"]
+        policy.policies[0].p1 = 1.0
+        images = torch.randint(0, 128, (4, 3, 16, 16), dtype=torch.uint8)
+        actual = TensorPolicy(policy.policies[:1])(images)
+        expected = TENSOR_OPERATIONS["equalize"](images, None)
+        self.assertTrue(torch.equal(actual, expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
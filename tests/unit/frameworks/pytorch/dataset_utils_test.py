@@ -18,10 +18,32 @@
 #  http://numenta.org/licenses/
 #
 
+import os
+import tempfile
 import unittest
+from io import BytesIO
+from pathlib import Path
 from unittest import TestCase
 
-from nupic.research.frameworks.pytorch.dataset_utils import ProgressiveRandomResizedCrop
+import h5py
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, TensorDataset
+from torchvision.datasets import ImageFolder
+from torchvision.transforms import Compose, RandomResizedCrop
+
+from nupic.research.frameworks.pytorch.dataset_utils import (
+    FeatureCache,
+    HDF5Dataset,
+    PackedImageDataset,
+    ProgressiveRandomResizedCrop,
+    create_batch_loader,
+    create_packed_dataset,
+    describe_transform,
+    is_packed_dataset,
+    npz_to_npy,
+)
 
 
 class ProgressiveRandomResizedCropTest(TestCase):
@@ -40,5 +62,205 @@ class ProgressiveRandomResizedCropTest(TestCase):
         self.assertEqual(expected, actual)
 
 
+class PackedImageDatasetTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+
+        # Create small image folder and equivalent HDF5 file
+        rng = np.random.RandomState(42)
+        self.hdf5_file = self.root / "images.hdf5"
+        with h5py.File(self.hdf5_file, mode="w") as hdf5:
+            for c in ["a", "b", "c"]:
+                class_dir = self.root / "train" / c
+                class_dir.mkdir(parents=True)
+                for i in range(4):
+                    data = rng.randint(0, 255, size=(8, 8, 3), dtype=np.uint8)
+                    buffer = BytesIO()
+                    Image.fromarray(data).save(buffer, format="png")
+                    image_data = buffer.getvalue()
+                    (class_dir / "{}.png".format(i)).write_bytes(image_data)
+                    group = hdf5.require_group("train/{}".format(c))
+                    group.create_dataset("{}.png".format(i), data=np.void(image_data))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assertSameImages(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for (x1, y1), (x2, y2) in zip(expected, actual):
+            self.assertEqual(y1, y2)
+            self.assertTrue(np.array_equal(np.array(x1), np.array(x2)))
+
+    def test_from_folder(self):
+        folder = ImageFolder(self.root / "train")
+        packed_dir = self.root / "packed"
+        count = create_packed_dataset(folder, packed_dir, shard_size=1)
+        self.assertEqual(count, 12)
+        self.assertTrue(is_packed_dataset(packed_dir))
+        self.assertEqual(len(list(packed_dir.glob("shard_*.bin"))), 12)
+
+        packed = PackedImageDataset(packed_dir)
+        self.assertSameImages(folder, packed)
+
+    def test_from_hdf5(self):
+        hdf5 = HDF5Dataset(hdf5_file=self.hdf5_file, root="train")
+        packed_dir = self.root / "packed"
+        create_packed_dataset(hdf5, packed_dir)
+        self.assertEqual(len(list(packed_dir.glob("shard_*.bin"))), 1)
+
+        packed = PackedImageDataset(packed_dir)
+        self.assertSameImages(hdf5, packed)
+
+        # Select classes
+        hdf5 = HDF5Dataset(hdf5_file=self.hdf5_file, root="train", classes=["c", "a"])
+        packed = PackedImageDataset(packed_dir, classes=["c", "a"])
+        self.assertEqual(len(packed), 8)
+        self.assertSameImages(hdf5, packed)
+
+        # Limit number of classes
+        packed = PackedImageDataset(packed_dir, num_classes=2)
+        self.assertEqual(len(packed), 8)
+        self.assertEqual(set(packed.targets), {0, 1})
+
+
+class BatchLoaderTest(TestCase):
+    def test_same_batches(self):
+        dataset = TensorDataset(torch.randn(10, 3), torch.arange(10))
+        expected = list(DataLoader(dataset, batch_size=4))
+        actual = list(create_batch_loader(dataset, batch_size=4))
+        self.assertEqual(len(expected), len(actual))
+        for (x1, y1), (x2, y2) in zip(expected, actual):
+            self.assertTrue(torch.equal(x1, x2))
+            self.assertTrue(torch.equal(y1, y2))
+
+    def test_shuffle(self):
+        dataset = TensorDataset(torch.arange(10))
+        loader = create_batch_loader(dataset, batch_size=3, shuffle=True,
+                                     drop_last=True)
+        batches = [x for x, in loader]
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(len(set(torch.cat(batches).tolist())), 9)
+
+
+class FeatureCacheTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.tmpdir.name) / "cache"
+        self.calls = 0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def compute(self, value):
+        def compute():
+            self.calls += 1
+            return np.full(1024, value, dtype=np.float32)
+        return compute
+
+    def test_memory_and_disk(self):
+        cache = FeatureCache(self.cache_dir)
+        key = FeatureCache.make_key("a", 1)
+        for _ in range(3):
+            np.testing.assert_equal(cache.get_or_compute(key, self.compute(1.0)),
+                                    1.0)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.stats()["memory_hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+        # New process, empty memory
+        cache = FeatureCache(self.cache_dir)
+        np.testing.assert_equal(cache.get_or_compute(key, self.compute(1.0)), 1.0)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        self.assertEqual(cache.stats()["hit_rate"], 1.0)
+
+    def test_lru_eviction(self):
+        cache = FeatureCache(self.cache_dir, max_memory=4096 * 2,
+                             max_disk=4200 * 3)
+        keys = [FeatureCache.make_key(i) for i in range(4)]
+        for i, key in enumerate(keys):
+            cache.get_or_compute(key, self.compute(i))
+        self.assertEqual(self.calls, 4)
+        self.assertEqual(len(cache._memory), 2)
+        self.assertEqual(len(list(self.cache_dir.glob("*/*.pkl"))), 2)
+
+        cache = FeatureCache(self.cache_dir)
+        cache.get_or_compute(keys[3], self.compute(3))
+        self.assertEqual(self.calls, 4)
+        cache.get_or_compute(keys[0], self.compute(0))
+        self.assertEqual(self.calls, 5)
+
+    def test_file_key(self):
+        path = Path(self.tmpdir.name) / "file.txt"
+        path.write_text("a")
+        key = FeatureCache.file_key(str(path), "load")
+        self.assertEqual(key, FeatureCache.file_key(str(path), "load"))
+        self.assertNotEqual(key, FeatureCache.file_key(str(path), "other"))
+        path.write_text("ab")
+        self.assertNotEqual(key, FeatureCache.file_key(str(path), "load"))
+
+    def test_describe_transform(self):
+        self.assertEqual(describe_transform(RandomResizedCrop(size=8)),
+                         describe_transform(RandomResizedCrop(size=8)))
+        self.assertNotEqual(describe_transform(RandomResizedCrop(size=8)),
+                            describe_transform(RandomResizedCrop(size=4)))
+        self.assertNotEqual(describe_transform(Compose([RandomResizedCrop(8)])),
+                            describe_transform(Compose([RandomResizedCrop(4)])))
+
+
+class NpzToNpyTest(TestCase):
+    def test_cache_dir(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data_dir = Path(tmpdir) / "data"
+            cache_dir = Path(tmpdir) / "cache"
+            data_dir.mkdir()
+            x = np.arange(12, dtype=np.float32).reshape(3, 4)
+            y = np.arange(3)
+            npz_file = str(data_dir / "gsc_train0.npz")
+            np.savez(npz_file, x, y)
+
+            npy_files = npz_to_npy(npz_file, str(cache_dir))
+            self.assertEqual(list(data_dir.iterdir()), [data_dir / "gsc_train0.npz"])
+            self.assertEqual(len(npy_files), 2)
+            for npy_file, name in zip(npy_files, ["arr_0", "arr_1"]):
+                npy_file = Path(npy_file)
+                self.assertEqual(npy_file.parent, cache_dir)
+                self.assertTrue(npy_file.name.startswith("gsc_train0_"))
+                self.assertTrue(npy_file.name.endswith("_{}.npy".format(name)))
+            np.testing.assert_equal(np.load(npy_files[0], mmap_mode="r"), x)
+            np.testing.assert_equal(np.load(npy_files[1], mmap_mode="r"), y)
+
+            # Converting again reuses the same files
+            self.assertEqual(npz_to_npy(npz_file, str(cache_dir)), npy_files)
+
+    def test_regenerated_npz(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = Path(tmpdir) / "cache"
+            npz_file = str(Path(tmpdir) / "gsc_train0.npz")
+            np.savez(npz_file, np.arange(3))
+            old_files = npz_to_npy(npz_file, str(cache_dir))
+
+            np.savez(npz_file, np.arange(5))
+            stat = os.stat(npz_file)
+            os.utime(npz_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            new_files = npz_to_npy(npz_file, str(cache_dir))
+            self.assertNotEqual(new_files, old_files)
+            np.testing.assert_equal(np.load(new_files[0]), np.arange(5))
+
+    def test_same_name_different_roots(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = str(Path(tmpdir) / "cache")
+            npy_files = []
+            for root, size in [("a", 3), ("b", 5)]:
+                (Path(tmpdir) / root).mkdir()
+                npz_file = str(Path(tmpdir) / root / "gsc_train0.npz")
+                np.savez(npz_file, np.arange(size))
+                npy_files += npz_to_npy(npz_file, cache_dir)
+            self.assertNotEqual(npy_files[0], npy_files[1])
+            np.testing.assert_equal(np.load(npy_files[0]), np.arange(3))
+            np.testing.assert_equal(np.load(npy_files[1]), np.arange(5))
+
+
 if __name__ == "__main__":
     unittest.main()
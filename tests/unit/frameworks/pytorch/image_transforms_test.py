@@ -0,0 +1,76 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+import unittest
+
+import torch
+
+from nupic.research.frameworks.pytorch.image_transforms import RandomNoise
+
+
+class RandomNoiseTest(unittest.TestCase):
+
+    def test_apply_batch(self):
+        """Each image gets the same number of noise values as the per image
+        transform"""
+        images = torch.zeros(8, 3, 8, 8)
+        expected = torch.zeros(8, 3, 8, 8)
+        noise = RandomNoise(0.3, high_value=1.0, low_value=-1.0)
+        noise.apply_batch(images)
+        for image in expected:
+            noise(image)
+
+        self.assertEqual(noise.iteration, 16)
+        self.assertEqual((images == 1.0).view(8, -1).sum(1).tolist(),
+                         (expected == 1.0).view(8, -1).sum(1).tolist())
+        self.assertEqual((images == -1.0).view(8, -1).sum(1).tolist(),
+                         (expected == -1.0).view(8, -1).sum(1).tolist())
+
+    def test_seed(self):
+        """Seeded noise only depends on the seed and the image index"""
+        images = torch.zeros(10, 1, 16, 16)
+        noise = RandomNoise(0.2, high_value=1.0, low_value=-1.0, seed=42)
+        noise.apply_batch(images)
+
+        # Same images in smaller batches
+        chunks = torch.zeros(10, 1, 16, 16)
+        noise = RandomNoise(0.2, high_value=1.0, low_value=-1.0, seed=42)
+        noise.apply_batch(chunks[:3])
+        noise.apply_batch(chunks[3:])
+        self.assertTrue(torch.equal(images, chunks))
+
+        # Same images in a different order
+        shuffled = torch.zeros(10, 1, 16, 16)
+        noise = RandomNoise(0.2, high_value=1.0, low_value=-1.0, seed=42)
+        indices = torch.randperm(10)
+        noise.apply_batch(shuffled, indices=indices)
+        self.assertTrue(torch.equal(images[indices], shuffled))
+
+        # Different images get different noise
+        self.assertFalse(torch.equal(images[0], images[1]))
+
+        # Different seed
+        other = torch.zeros(10, 1, 16, 16)
+        noise = RandomNoise(0.2, high_value=1.0, low_value=-1.0, seed=1)
+        noise.apply_batch(other)
+        self.assertFalse(torch.equal(images, other))
+
+
+if __name__ == "__main__":
+    unittest.main()
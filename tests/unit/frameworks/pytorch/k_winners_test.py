@@ -0,0 +1,95 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+import unittest
+
+import torch
+
+from nupic.research.frameworks.pytorch.functions import (
+    KWINNERS_STRATEGIES,
+    kwinners,
+    kwinners_mask,
+    kwinners_threshold,
+)
+
+
+class KWinnersFunctionsTest(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+        self.x = torch.randn(16, 4, 10, 10)
+
+    def test_strategies(self):
+        """All exact strategies select the same winners"""
+        expected = kwinners_mask(self.x, 40, "topk")
+        self.assertEqual(expected.view(16, -1).sum(1).tolist(), [40] * 16)
+        for strategy in ("kthvalue", "partial_sort"):
+            mask = kwinners_mask(self.x, 40, strategy)
+            self.assertTrue(torch.equal(mask, expected), strategy)
+
+    def test_histogram(self):
+        """Approximate strategy keeps all winners plus a few more units"""
+        expected = kwinners_mask(self.x, 40, "topk")
+        mask = kwinners_mask(self.x, 40, "histogram")
+        self.assertFalse((expected & ~mask).any())
+        self.assertLess(mask.sum().item(), 1.2 * expected.sum().item())
+
+    def test_no_winners(self):
+        """k <= 0 selects no units with every strategy"""
+        for strategy in KWINNERS_STRATEGIES:
+            for k in (0, -1):
+                threshold = kwinners_threshold(self.x, k, strategy)
+                self.assertFalse((self.x.view(16, -1) >= threshold).any())
+                self.assertFalse(kwinners_mask(self.x, k, strategy).any())
+
+    def test_kwinners(self):
+        """Output keeps the original value of the winners and zeros the rest"""
+        x = self.x.clone().requires_grad_()
+        for strategy in KWINNERS_STRATEGIES:
+            y = kwinners(x, 40, strategy=strategy)
+            mask = kwinners_mask(self.x, 40, strategy)
+            self.assertTrue(torch.equal(y, self.x * mask))
+
+            grad, = torch.autograd.grad(y.sum(), x)
+            self.assertTrue(torch.equal(grad, mask.float()))
+
+    def test_inplace(self):
+        x = self.x.clone()
+        y = kwinners(x, 40, inplace=True)
+        self.assertEqual(y.data_ptr(), x.data_ptr())
+        self.assertTrue(torch.equal(y, self.x * kwinners_mask(self.x, 40)))
+
+    def test_boosting(self):
+        """Boosting favors units with low duty cycle and updates it in place"""
+        x = torch.ones(4, 10)
+        x[:, :3] = 1.1
+        duty_cycle = torch.zeros(10)
+        duty_cycle[:3] = 0.5
+        y = kwinners(x, 3, duty_cycle, boost_strength=0.0, period=4)
+        self.assertTrue(torch.equal(y.ne(0)[:, :3], torch.ones(4, 3, dtype=torch.bool)))
+
+        # 4 samples with 3 active units each, at period 4
+        self.assertEqual(duty_cycle[:3].tolist(), [1.0] * 3)
+        self.assertEqual(duty_cycle[3:].tolist(), [0.0] * 7)
+        y = kwinners(x, 3, duty_cycle, boost_strength=10.0)
+        self.assertFalse(y[:, :3].ne(0).any())
+
+
+if __name__ == "__main__":
+    unittest.main()
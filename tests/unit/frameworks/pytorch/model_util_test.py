@@ -22,12 +22,20 @@ import unittest
 
 import torch
 import torch.nn
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, TensorDataset
 
 from nupic.research.frameworks.pytorch.model_compare import compare_models
 from nupic.research.frameworks.pytorch.model_utils import (
+    ClassificationMetrics,
     count_nonzero_params,
     deserialize_state_dict,
+    evaluate_loaders,
+    evaluate_model,
+    evaluate_noise,
+    prefetch_in_background,
     serialize_state_dict,
+    train_model,
 )
 from nupic.research.frameworks.pytorch.models.le_sparse_net import LeSparseNet
 from nupic.torch.modules import Flatten
@@ -140,5 +148,125 @@ class ModelSerializationTest(unittest.TestCase):
         self.assertTrue(compare_models(model1, model2, (32,)))
 
 
+class TrainModelTest(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+        self.dataset = TensorDataset(torch.randn(64, 32),
+                                     torch.randint(0, 2, (64,)))
+
+    def train(self, batch_size, **kwargs):
+        torch.manual_seed(18)
+        model = torch.nn.Sequential(simple_linear_net(), torch.nn.LogSoftmax(dim=1))
+        optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+        loader = DataLoader(self.dataset, batch_size=batch_size)
+        results = train_model(model=model, loader=loader, optimizer=optimizer,
+                              device="cpu", criterion=F.nll_loss, **kwargs)
+        return model, results
+
+    def test_prefetch(self):
+        """Prefetching batches should not change the trained model"""
+        model1, results1 = self.train(batch_size=8)
+        model2, results2 = self.train(batch_size=8, prefetch=True)
+        self.assertTrue(compare_models(model1, model2, (32,)))
+        self.assertEqual(results1["num_samples"], 64)
+        self.assertEqual(results2["num_samples"], 64)
+        self.assertAlmostEqual(results1["mean_loss"], results2["mean_loss"])
+
+    def test_gradient_accumulation(self):
+        """Accumulating 4 batches of 4 should match training with batches of 16"""
+        model1, results1 = self.train(batch_size=16)
+        model2, results2 = self.train(batch_size=4, gradient_accumulation_steps=4)
+        self.assertTrue(compare_models(model1, model2, (32,)))
+        self.assertEqual(results1["num_steps"], 4)
+        self.assertEqual(results2["num_steps"], 4)
+        self.assertEqual(results2["num_batches"], 16)
+
+    def test_callback_interval(self):
+        batches = []
+
+        def post_batch(batch_idx, **kwargs):
+            batches.append(batch_idx)
+
+        _, results = self.train(batch_size=4, batches_in_epoch=10, prefetch=True,
+                                callback_interval=3, post_batch_callback=post_batch)
+        self.assertEqual(batches, [0, 3, 6, 9])
+        self.assertEqual(results["num_batches"], 10)
+
+    def test_prefetch_in_background_error(self):
+        def failing_loader():
+            yield 1
+            raise ValueError("loader failed")
+
+        prefetcher = prefetch_in_background(failing_loader())
+        self.assertEqual(next(prefetcher), 1)
+        self.assertRaises(ValueError, next, prefetcher)
+
+
+class EvaluateModelTest(unittest.TestCase):
+
+    def test_classification_metrics(self):
+        output = torch.tensor([[0.1, 0.5, 0.2, 0.0],
+                               [0.9, 0.0, 0.3, 0.2],
+                               [0.1, 0.2, 0.3, 0.4],
+                               [0.4, 0.3, 0.2, 0.1]])
+        target = torch.tensor([1, 2, 0, 3])
+        metrics = ClassificationMetrics("cpu", topk=(2, 5), num_classes=4)
+        metrics.update(output[:2], target[:2], torch.tensor(1.0))
+        metrics.update(output[2:], target[2:], torch.tensor(3.0))
+        results = metrics.results()
+
+        self.assertEqual(results["total_correct"], 1)
+        self.assertEqual(results["total"], 4)
+        self.assertAlmostEqual(results["total_loss"], 4.0)
+        self.assertAlmostEqual(results["mean_loss"], 1.0)
+        self.assertAlmostEqual(results["mean_accuracy"], 0.25)
+        self.assertAlmostEqual(results["mean_accuracy_top2"], 0.5)
+        self.assertAlmostEqual(results["mean_accuracy_top5"], 1.0)
+        expected = [[0, 0, 0, 1],
+                    [0, 1, 0, 0],
+                    [1, 0, 0, 0],
+                    [1, 0, 0, 0]]
+        self.assertEqual(results["confusion_matrix"].tolist(), expected)
+
+    def test_evaluate_loaders(self):
+        torch.manual_seed(42)
+        model = torch.nn.Sequential(simple_linear_net(), torch.nn.LogSoftmax(dim=1))
+        loaders = {
+            noise: DataLoader(TensorDataset(torch.randn(50, 32) * noise,
+                                            torch.randint(0, 2, (50,))),
+                              batch_size=16)
+            for noise in (0.5, 1.0)
+        }
+        results = evaluate_loaders(model, loaders, "cpu")
+        self.assertEqual(set(results.keys()), {0.5, 1.0})
+        for noise, loader in loaders.items():
+            expected = evaluate_model(model, loader, "cpu")
+            self.assertEqual(results[noise]["total_correct"],
+                             expected["total_correct"])
+            self.assertAlmostEqual(results[noise]["mean_loss"],
+                                   expected["mean_loss"])
+
+    def test_evaluate_noise(self):
+        torch.manual_seed(42)
+        model = torch.nn.Sequential(simple_linear_net(), torch.nn.LogSoftmax(dim=1))
+        loader = DataLoader(TensorDataset(torch.randn(50, 32),
+                                          torch.randint(0, 2, (50,))),
+                            batch_size=16)
+        results = evaluate_noise(model, loader, "cpu", noise_values=[0.0, 0.5],
+                                 high_value=2.0, low_value=-2.0)
+        self.assertEqual(set(results.keys()), {0.0, 0.5})
+
+        # No noise is the same as evaluating the clean loader
+        expected = evaluate_model(model, loader, "cpu")
+        self.assertEqual(results[0.0]["total_correct"], expected["total_correct"])
+        self.assertAlmostEqual(results[0.0]["mean_loss"], expected["mean_loss"])
+        self.assertNotAlmostEqual(results[0.5]["mean_loss"], expected["mean_loss"])
+
+        # The clean data must not be modified
+        data, _ = loader.dataset.tensors
+        self.assertFalse(((data == 2.0) | (data == -2.0)).any())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,97 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+import unittest
+
+import torch
+import torch.nn as nn
+
+from nupic.research.frameworks.pytorch.sparse_inference import (
+    SparseConv2d,
+    SparseLinear,
+    export_sparse_model,
+    model_nbytes,
+)
+
+
+def sparsify(model, sparsity):
+    with torch.no_grad():
+        for module in model.modules():
+            if isinstance(module, (nn.Linear, nn.Conv2d)):
+                mask = torch.rand_like(module.weight) < sparsity
+                module.weight[mask] = 0.0
+    return model
+
+
+def create_model():
+    return nn.Sequential(
+        nn.Conv2d(1, 8, kernel_size=5),
+        nn.ReLU(),
+        nn.MaxPool2d(2),
+        nn.Conv2d(8, 16, kernel_size=3, stride=2, padding=1),
+        nn.ReLU(),
+        nn.Flatten(),
+        nn.Linear(16 * 4 * 4, 100),
+        nn.ReLU(),
+        nn.Linear(100, 10),
+    )
+
+
+class SparseInferenceTest(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+
+    def test_export(self):
+        """Exported model is equivalent to the original model"""
+        model = sparsify(create_model(), 0.9).eval()
+        sparse = export_sparse_model(model)
+        self.assertIsInstance(sparse[0], SparseConv2d)
+        self.assertIsInstance(sparse[3], SparseConv2d)
+        self.assertIsInstance(sparse[6], SparseLinear)
+        self.assertIsInstance(sparse[8], SparseLinear)
+        self.assertLess(model_nbytes(sparse), model_nbytes(model))
+
+        x = torch.randn(16, 1, 20, 20)
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(model(x), sparse(x), atol=1e-5))
+
+    def test_min_sparsity(self):
+        """Dense layers are not converted"""
+        model = create_model()
+        sparsify(model[6], 0.9)
+        sparse = export_sparse_model(model, min_sparsity=0.5)
+        self.assertIsInstance(sparse[0], nn.Conv2d)
+        self.assertIsInstance(sparse[6], SparseLinear)
+        self.assertIsInstance(sparse[8], nn.Linear)
+
+    def test_sparse_input(self):
+        """Sparse inputs only use the active weight columns"""
+        linear = sparsify(nn.Linear(200, 50), 0.8)
+        sparse = SparseLinear(linear, activation_density=0.2)
+        x = torch.randn(4, 200)
+        x[:, 20:] = 0.0
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(linear(x), sparse(x), atol=1e-5))
+            x.zero_()
+            self.assertTrue(torch.allclose(linear(x), sparse(x), atol=1e-5))
+
+
+if __name__ == "__main__":
+    unittest.main()
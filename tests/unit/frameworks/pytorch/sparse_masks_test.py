@@ -0,0 +1,94 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+import unittest
+
+import torch
+
+from nupic.research.frameworks.pytorch.sparse_masks import (
+    random_block_zero_indices,
+    random_mask,
+)
+
+
+class SparseMasksTest(unittest.TestCase):
+    def test_random_mask(self):
+        mask = random_mask((64, 32, 3, 3), 1000)
+        self.assertEqual(mask.shape, (64, 32, 3, 3))
+        self.assertEqual(mask.dtype, torch.bool)
+        self.assertEqual(int(mask.sum()), 1000)
+
+    def test_random_mask_per_output(self):
+        mask = random_mask((64, 32, 3, 3), 50, dim=0)
+        self.assertTrue((mask.view(64, -1).sum(dim=1) == 50).all())
+
+        mask = random_mask((10, 20, 30), 7, dim=1)
+        self.assertEqual(mask.shape, (10, 20, 30))
+        self.assertTrue((mask.transpose(0, 1).reshape(20, -1).sum(dim=1) == 7).all())
+
+    def test_random_mask_limits(self):
+        self.assertFalse(random_mask((10, 10), 0).any())
+        self.assertTrue(random_mask((10, 10), 200, dim=0).all())
+
+    def test_reproducible(self):
+        masks = []
+        for _ in range(2):
+            generator = torch.Generator().manual_seed(42)
+            masks.append(random_mask((100, 100), 500, generator=generator))
+        self.assertTrue(torch.equal(masks[0], masks[1]))
+        self.assertFalse(torch.equal(masks[0], random_mask((100, 100), 500)))
+
+    @unittest.skipUnless(torch.cuda.is_available(), "Requires cuda")
+    def test_device(self):
+        mask = random_mask((100, 100), 500, device="cuda")
+        self.assertEqual(mask.device.type, "cuda")
+        self.assertEqual(int(mask.sum()), 500)
+
+    def test_random_block_zero_indices(self):
+        zeros = random_block_zero_indices(8, 640, 600, 7, group_size=4)
+        self.assertEqual(zeros.shape, (8, 600))
+        for row in zeros:
+            self.assertEqual(len(row.unique()), 600)
+
+        # Groups of outputs share the same all zero blocks
+        mask = torch.zeros(8, 640, dtype=torch.bool)
+        mask.scatter_(1, zeros, True)
+        zero_blocks = mask.view(8, 10, 64).all(dim=2)
+        self.assertTrue((zero_blocks.sum(dim=1) >= 7).all())
+        self.assertTrue(torch.equal(zero_blocks[0], zero_blocks[3]))
+        self.assertTrue(torch.equal(zero_blocks[4], zero_blocks[7]))
+
+    def test_random_block_zero_indices_partial_block(self):
+        zeros = random_block_zero_indices(8, 600, 500, 7, group_size=4)
+        self.assertEqual(zeros.shape, (8, 500))
+        self.assertTrue((zeros < 600).all())
+        for row in zeros:
+            self.assertEqual(len(row.unique()), 500)
+
+        # The last block has 600 - 9 * 64 = 24 inputs
+        mask = torch.ones(8, 640, dtype=torch.bool)
+        mask[:, :600] = False
+        mask.scatter_(1, zeros, True)
+        zero_blocks = mask.view(8, 10, 64).all(dim=2)
+        self.assertTrue((zero_blocks.sum(dim=1) >= 7).all())
+        self.assertTrue(torch.equal(zero_blocks[0], zero_blocks[3]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+
+import pickle
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase, mock
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from nupic.research.frameworks.pytorch.audio_transforms import FixAudioLength
+from nupic.research.frameworks.pytorch.dataset_utils import (
+    FeatureCache,
+    create_batch_loader,
+)
+from nupic.research.frameworks.pytorch.speech_commands_dataset import (
+    PreprocessedSpeechDataset,
+    SpeechCommandsDataset,
+    balanced_class_weights,
+)
+
+CLASSES = ("unknown", "silence", "zero", "one")
+
+
+def make_weights_for_balanced_classes(targets, nclasses):
+    """
+    Per item implementation of :func:`balanced_class_weights`
+    """
+    count = np.ones(nclasses)
+    for target in targets:
+        count[target] += 1
+
+    n = float(sum(count))
+    weight_per_class = n / count
+    weight = np.zeros(len(targets))
+    for idx, target in enumerate(targets):
+        weight[idx] = weight_per_class[target]
+    return weight
+
+
+class BalancedClassWeightsTest(TestCase):
+    def test_per_item(self):
+        targets = np.random.RandomState(42).randint(0, 10, size=100)
+        targets[targets == 3] = 4
+        np.testing.assert_allclose(
+            balanced_class_weights(targets, 12),
+            make_weights_for_balanced_classes(targets, 12))
+
+
+class SpeechCommandsDatasetTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        root = Path(self.tmpdir.name)
+        for command in ("zero", "one", "other"):
+            (root / command).mkdir()
+            (root / command / "a.wav").write_bytes(b"")
+        self.root = str(root)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def create_dataset(self, cache=None):
+        with mock.patch("librosa.load",
+                        return_value=(np.ones(8000, dtype=np.float32), 16000)):
+            return SpeechCommandsDataset(self.root, classes=CLASSES,
+                                         silence_percentage=0.5,
+                                         cached_transform=FixAudioLength(),
+                                         cache=cache)
+
+    def iterate(self, dataset):
+        for i in range(len(dataset)):
+            data, _ = dataset[i]
+            self.assertEqual(len(data["samples"]), 16000)
+
+    def test_memory_cache(self):
+        dataset = self.create_dataset()
+        self.assertEqual(len(dataset), 4)
+        for _ in range(2):
+            self.iterate(dataset)
+
+        # Only the 4 transformed items are cached, computed during the first
+        # epoch and reused during the second one
+        stats = dataset.cache_stats()
+        self.assertEqual(stats["misses"], 4)
+        self.assertEqual(stats["hits"], 4)
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_disk_cache(self):
+        cache_dir = str(Path(self.tmpdir.name) / "_cache")
+        dataset = self.create_dataset(FeatureCache(cache_dir))
+        self.iterate(dataset)
+        self.assertEqual(dataset.cache_stats()["misses"], 3 + 4)
+
+        # New process, the decoded audio and transformed items are on disk
+        dataset = self.create_dataset(FeatureCache(cache_dir))
+        self.iterate(dataset)
+        stats = dataset.cache_stats()
+        self.assertEqual(stats["misses"], 0)
+        self.assertEqual(stats["disk_hits"], 3 + 4)
+
+    def test_balanced_class_weights(self):
+        dataset = self.create_dataset()
+        targets = [target for _, target in dataset.data]
+        np.testing.assert_allclose(
+            dataset.make_weights_for_balanced_classes(),
+            make_weights_for_balanced_classes(targets, len(CLASSES)))
+
+
+class PreprocessedSpeechDatasetTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        generator = torch.Generator().manual_seed(42)
+        for epoch in range(2):
+            folder = Path(self.root) / str(epoch) / "train"
+            folder.mkdir(parents=True)
+            for command, size in (("zero", 5), ("one", 3), ("silence", None)):
+                if size is None:
+                    audio = {"input": torch.zeros(1, 4, 4)}
+                else:
+                    audio = [{"input": torch.rand(1, 4, 4, generator=generator)}
+                             for _ in range(size)]
+                with open(folder / "{}.pkl".format(command), "wb") as f:
+                    pickle.dump(audio, f)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def create_datasets(self):
+        return (PreprocessedSpeechDataset(self.root, "train", classes=CLASSES,
+                                          silence_percentage=0.25),
+                PreprocessedSpeechDataset(self.root, "train", classes=CLASSES,
+                                          silence_percentage=0.25,
+                                          columnar=True))
+
+    def test_columnar_items(self):
+        dataset, columnar = self.create_datasets()
+        for _ in range(2):
+            self.assertEqual(len(columnar), 10)
+            self.assertEqual(len(columnar), len(dataset))
+            for i in range(len(dataset)):
+                audio, target = dataset[i]
+                inputs, targets = columnar[i]
+                self.assertTrue(torch.equal(inputs, audio["input"]))
+                self.assertEqual(targets.item(), target)
+            self.assertEqual(dataset.next_epoch(), columnar.next_epoch())
+
+    def test_columnar_batches(self):
+        dataset, columnar = self.create_datasets()
+        loader = DataLoader(dataset, batch_size=4)
+        batch_loader = create_batch_loader(columnar, batch_size=4)
+        self.assertEqual(len(loader), len(batch_loader))
+        for (audio, target), (inputs, targets) in zip(loader, batch_loader):
+            self.assertTrue(torch.equal(inputs, audio["input"]))
+            self.assertTrue(torch.equal(targets, target))
+
+    def test_balanced_class_weights(self):
+        dataset, columnar = self.create_datasets()
+        targets = [target for _, target in dataset.data]
+        expected = make_weights_for_balanced_classes(targets, len(CLASSES))
+        np.testing.assert_allclose(dataset.make_weights_for_balanced_classes(),
+                                   expected)
+        np.testing.assert_allclose(columnar.make_weights_for_balanced_classes(),
+                                   expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+
+import unittest
+
+import torch
+
+from nupic.research.frameworks.pytorch.streaming_covariance import (
+    StreamingCovariance,
+)
+
+
+def reference_covariance(x):
+    x = x - x.mean(dim=0)
+    return x.t().mm(x) / x.shape[0]
+
+
+class StreamingCovarianceTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(42)
+        # Large offset to check the numerical stability of the updates
+        self.x = torch.randn(1000, 20, dtype=torch.float64) * 2 + 1000
+        self.batches = self.x.split(64)
+
+    def accumulate(self, mode, x=None, **kwargs):
+        covariance = StreamingCovariance(mode, dtype=torch.float64, **kwargs)
+        for batch in (self.batches if x is None else x.split(64)):
+            covariance.update(batch)
+        return covariance
+
+    def test_full(self):
+        covariance = self.accumulate("full")
+        expected = reference_covariance(self.x)
+        self.assertEqual(covariance.count, 1000)
+        self.assertTrue(torch.allclose(covariance.mean, self.x.mean(dim=0)))
+        self.assertTrue(torch.allclose(covariance.covariance(), expected))
+        self.assertTrue(torch.allclose(covariance.variance(), expected.diagonal()))
+
+        off_diagonal = expected * (1 - torch.eye(20, dtype=torch.float64))
+        self.assertAlmostEqual(covariance.off_diagonal_sum_of_squares().item(),
+                               (off_diagonal.pow(2).sum() / 2).item())
+
+    def test_diagonal(self):
+        covariance = self.accumulate("diagonal")
+        self.assertTrue(torch.allclose(covariance.variance(),
+                                       self.x.var(dim=0, unbiased=False)))
+        self.assertIsNone(covariance.m2)
+        with self.assertRaises(ValueError):
+            covariance.covariance()
+
+    def test_lowrank(self):
+        # Exact when the rank of the data is below the rank of the sketch
+        x = (torch.randn(1000, 5, dtype=torch.float64)
+             .mm(torch.randn(5, 50, dtype=torch.float64)) + 10)
+        covariance = self.accumulate("lowrank", x, rank=8)
+        expected = reference_covariance(x)
+        self.assertLessEqual(covariance.sketch.shape[0], 16)
+        self.assertTrue(torch.allclose(covariance.covariance(), expected))
+        self.assertTrue(torch.allclose(covariance.variance(), expected.diagonal()))
+
+        full = self.accumulate("full", x)
+        self.assertAlmostEqual(covariance.off_diagonal_sum_of_squares().item(),
+                               full.off_diagonal_sum_of_squares().item(),
+                               places=4)
+
+    def test_correlation(self):
+        x = torch.randn(500, 1)
+        covariance = StreamingCovariance()
+        covariance.update(torch.cat((x, 3 * x + 1, -x), dim=1))
+        corr = covariance.correlation()
+        self.assertAlmostEqual(corr[0, 1].item(), 1.0, places=5)
+        self.assertAlmostEqual(corr[0, 2].item(), -1.0, places=5)
+
+    def test_empty_batches(self):
+        covariance = StreamingCovariance()
+        covariance.update(torch.zeros(0, 5))
+        self.assertEqual(covariance.count, 0)
+        with self.assertRaises(ValueError):
+            covariance.correlation()
+
+        covariance.update(self.x[:10].float())
+        covariance.update(torch.zeros(0, 20))
+        self.assertEqual(covariance.count, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
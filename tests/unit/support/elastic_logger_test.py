@@ -0,0 +1,221 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest import mock
+
+from nupic.research.support.elastic_logger import (
+    ElasticsearchShipper,
+    _git_info,
+    create_elastic_client,
+    get_git_info,
+)
+
+
+class ElasticHandler(BaseHTTPRequestHandler):
+    """Minimal elasticsearch bulk API stand-in"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        time.sleep(server.delay)
+        if server.unavailable:
+            self.send_response(503)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b'{"error": "unavailable", "status": 503}')
+            return
+
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        # Bulk body alternates action metadata and document source
+        docs = lines[1::2]
+        with server.lock:
+            server.requests += 1
+            server.docs.extend(docs)
+        items = [{"index": {"status": 201}} for _ in docs]
+        response = json.dumps({"took": 1, "errors": False, "items": items})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(response.encode())
+
+
+class ElasticServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super(ElasticServer, self).__init__(("127.0.0.1", 0), ElasticHandler)
+        self.lock = threading.Lock()
+        self.docs = []
+        self.requests = 0
+        self.delay = 0
+        self.unavailable = False
+
+
+def action(i):
+    return {"_index": "test", "_type": "test", "_source": {"value": i}}
+
+
+class ElasticsearchShipperTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ElasticServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.client = create_elastic_client(hosts=[host], max_retries=0)
+        self.tmpdir = tempfile.mkdtemp()
+        self.journal = os.path.join(self.tmpdir, "elasticsearch.journal")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def create_shipper(self, **kwargs):
+        shipper = ElasticsearchShipper(self.client, journal=self.journal,
+                                       backoff=0.01, **kwargs)
+        self.addCleanup(shipper.close, timeout=5)
+        return shipper
+
+    def values(self):
+        return sorted(doc["value"] for doc in self.server.docs)
+
+    def test_ship(self):
+        shipper = self.create_shipper(batch_size=4)
+        for i in range(10):
+            shipper.put(action(i))
+        self.assertTrue(shipper.flush(timeout=5))
+        self.assertEqual(self.values(), list(range(10)))
+        self.assertEqual(self.server.requests, 3)
+
+    def test_flush_interval(self):
+        shipper = self.create_shipper(flush_interval=0.1)
+        shipper.put(action(0))
+        start = time.time()
+        while not self.server.docs and time.time() - start < 5:
+            time.sleep(0.01)
+        self.assertEqual(self.values(), [0])
+
+    def test_close(self):
+        shipper = self.create_shipper(flush_interval=60)
+        for i in range(3):
+            shipper.put(action(i))
+        shipper.close(timeout=5)
+        self.assertFalse(shipper.thread.is_alive())
+        self.assertEqual(self.values(), [0, 1, 2])
+
+    def test_journal_replay(self):
+        self.server.unavailable = True
+        shipper = self.create_shipper(max_retries=1)
+        for i in range(3):
+            shipper.put(action(i))
+        self.assertTrue(shipper.flush(timeout=5))
+        self.assertEqual(self.server.docs, [])
+        with open(self.journal) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+        # Replay journal on reconnect
+        self.server.unavailable = False
+        shipper.put(action(3))
+        self.assertTrue(shipper.flush(timeout=5))
+        self.assertEqual(self.values(), [0, 1, 2, 3])
+        self.assertFalse(os.path.exists(self.journal))
+
+    def test_put_does_not_block(self):
+        self.server.delay = 0.5
+        shipper = self.create_shipper(max_queue_size=2, batch_size=1)
+        start = time.time()
+        for i in range(10):
+            shipper.put(action(i))
+        self.assertLess(time.time() - start, 0.4)
+
+        # Actions that do not fit in the queue are spilled to the journal
+        self.assertTrue(os.path.exists(self.journal))
+        self.server.delay = 0
+        self.assertTrue(shipper.flush(timeout=10))
+        shipper.put(action(10))
+        self.assertTrue(shipper.flush(timeout=10))
+        self.assertEqual(self.values(), list(range(11)))
+
+    def test_send_error_is_spilled(self):
+        shipper = self.create_shipper(max_retries=3)
+        send = shipper._send
+
+        def fail_first(actions):
+            if any(a["_source"]["value"] == 0 for a in actions):
+                raise ValueError("Unable to serialize")
+            return send(actions)
+
+        with mock.patch.object(shipper, "_send", side_effect=fail_first) as mocked:
+            shipper.put(action(0))
+            self.assertTrue(shipper.flush(timeout=5))
+            # Not retried, but the thread is still shipping
+            self.assertEqual(mocked.call_count, 1)
+            self.assertTrue(shipper.thread.is_alive())
+            shipper.put(action(1))
+            self.assertTrue(shipper.flush(timeout=5))
+        self.assertEqual(self.values(), [1])
+        with open(self.journal) as f:
+            self.assertEqual(json.loads(f.read())["_source"], {"value": 0})
+
+    def test_invalid_journal_line(self):
+        with open(self.journal, "w") as f:
+            f.write(json.dumps(action(0)) + "\n")
+            f.write(json.dumps(action(1))[:10] + "\n")
+        shipper = self.create_shipper()
+        shipper.put(action(2))
+        self.assertTrue(shipper.flush(timeout=5))
+        self.assertEqual(self.values(), [0, 2])
+        self.assertTrue(shipper.thread.is_alive())
+
+    def test_close_after_thread_died(self):
+        shipper = self.create_shipper()
+        shipper.stop_event.set()
+        shipper.thread.join(5)
+        for i in range(3):
+            shipper.put(action(i))
+        shipper.close(timeout=1)
+        self.assertEqual(shipper.pending, 0)
+        with open(self.journal) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+
+class GitInfoTest(unittest.TestCase):
+    def test_cached(self):
+        _git_info.cache_clear()
+        with mock.patch("subprocess.check_output", return_value=b"value") as git:
+            info = get_git_info()
+            self.assertEqual(get_git_info(), info)
+            self.assertEqual(git.call_count, 5)
+        self.assertEqual(info["sha"], "value")
+        _git_info.cache_clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#  Numenta Platform for Intelligent Computing (NuPIC)
+#  Copyright (C) 2020, Numenta, Inc.  Unless you have an agreement
+#  with Numenta, Inc., for a separate license for this software code, the
+#  following terms and conditions apply:
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Affero Public License version 3 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU Affero Public License for more details.
+#
+#  You should have received a copy of the GNU Affero Public License
+#  along with this program.  If not, see http://www.gnu.org/licenses.
+#
+#  http://numenta.org/licenses/
+#
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from nupic.research.support.results_loader import (
+    CACHE_FILENAME,
+    load_trial_results,
+    read_trial,
+)
+
+READ_TRIAL = "nupic.research.support.results_loader.read_trial"
+
+
+def write_trial(path, name, rows, params):
+    trial_dir = os.path.join(path, name)
+    os.makedirs(trial_dir, exist_ok=True)
+    with open(os.path.join(trial_dir, "progress.csv"), "w") as f:
+        f.write("training_iteration,mean_accuracy\n")
+        for i, acc in enumerate(rows):
+            f.write("{},{}\n".format(i + 1, acc))
+    with open(os.path.join(trial_dir, "params.json"), "w") as f:
+        json.dump(params, f)
+    with open(os.path.join(trial_dir, "result.json"), "w") as f:
+        for acc in rows:
+            f.write(json.dumps(dict(mean_accuracy=acc)) + "\n")
+
+
+class ResultsLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        write_trial(self.path, "trial_0", [0.1, 0.2], dict(lr=0.1))
+        write_trial(self.path, "trial_1", [0.3, 0.4, 0.5], dict(lr=0.01))
+        os.makedirs(os.path.join(self.path, "trial_2"))
+        with open(os.path.join(self.path, "trial_2", "params.json"), "w") as f:
+            json.dump(dict(lr=1.0), f)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_load(self):
+        trials = load_trial_results(self.path, processes=2)
+        self.assertEqual(sorted(trials), ["trial_0", "trial_1", "trial_2"])
+        self.assertEqual(trials["trial_1"]["progress"]["mean_accuracy"].tolist(),
+                         [0.3, 0.4, 0.5])
+        self.assertEqual(trials["trial_0"]["params"], dict(lr=0.1))
+        self.assertIsNone(trials["trial_2"]["progress"])
+        self.assertNotIn("results", trials["trial_0"])
+        self.assertTrue(os.path.isfile(os.path.join(self.path, CACHE_FILENAME)))
+
+    def test_results(self):
+        trials = load_trial_results(self.path, ["trial_0"], read_results=True)
+        self.assertEqual(list(trials), ["trial_0"])
+        self.assertEqual(trials["trial_0"]["results"],
+                         [dict(mean_accuracy=0.1), dict(mean_accuracy=0.2)])
+
+    def test_incremental_refresh(self):
+        load_trial_results(self.path)
+
+        # Cached trials are not read again
+        with mock.patch(READ_TRIAL, wraps=read_trial) as read:
+            load_trial_results(self.path, processes=1)
+            read.assert_not_called()
+
+        # Only the changed trial is read again
+        write_trial(self.path, "trial_1", [0.6], dict(lr=0.5))
+        with mock.patch(READ_TRIAL, wraps=read_trial) as read:
+            trials = load_trial_results(self.path, processes=1)
+            read.assert_called_once_with(os.path.join(self.path, "trial_1"))
+        self.assertEqual(trials["trial_1"]["progress"]["mean_accuracy"].tolist(),
+                         [0.6])
+        self.assertEqual(trials["trial_1"]["params"], dict(lr=0.5))
+        self.assertEqual(trials["trial_0"]["params"], dict(lr=0.1))
+
+    def test_corrupted_cache(self):
+        with open(os.path.join(self.path, CACHE_FILENAME), "w") as f:
+            f.write("invalid")
+        trials = load_trial_results(self.path)
+        self.assertEqual(trials["trial_0"]["params"], dict(lr=0.1))
+
+
+if __name__ == "__main__":
+    unittest.main()